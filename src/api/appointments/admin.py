@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Appointment
+from .models import Appointment, WorkingHours
 from api.users.models import User
 
 class AppointmentAdmin(admin.ModelAdmin):
@@ -14,3 +14,14 @@ class AppointmentAdmin(admin.ModelAdmin):
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 admin.site.register(Appointment, AppointmentAdmin)
+
+class WorkingHoursAdmin(admin.ModelAdmin):
+    list_display = ['doctor', 'weekday', 'start_time', 'end_time', 'slot_minutes']
+    list_filter = ['weekday']
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == "doctor":
+            kwargs["queryset"] = User.objects.filter(role=User.DOCTOR)
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+admin.site.register(WorkingHours, WorkingHoursAdmin)
@@ -0,0 +1,163 @@
+"""
+Async (ASGI-native) versions of the appointment read endpoints.
+
+DRF views are sync, so under ASGI every request to them is handed to a thread. These
+plain Django async views produce the same JSON as AppointmentListView,
+AppointmentDetailView and AppointmentReportView, but await the async ORM (acount,
+aiterator, afirst) and the async cache client instead. Authentication is the cached JWT
+principal or the session; cursor pagination is only available on the sync list.
+
+appointment_events streams live changes and answers 501 outside ASGI.
+"""
+import functools
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from api.users.authentication import CachedJWTAuthentication
+from config.async_cache import async_cache
+from .cache import LIST_CACHE_TIMEOUT, alist_cache_key, cache_stats, query_fingerprint
+from .events import get_hub
+from .filters import AppointmentFilter, AppointmentReportFilter
+from .models import Appointment
+from .pagination import AppointmentPagination, CountOptionalLimitOffsetPagination
+from .rollups import daily_counts
+from .serializer import AppointmentReadSerializer, AppointmentReportSerializer
+
+renderer = JSONRenderer()
+
+
+def json_response(data, status=200):
+    return HttpResponse(renderer.render(data), status=status, content_type='application/json')
+
+
+async def authenticate(request):
+    """
+    Return the user of the request from a JWT or the session, or None if anonymous.
+    """
+    result = await CachedJWTAuthentication().aauthenticate(request)
+    if result is not None:
+        return result[0]
+    user = await request.auser()
+    return user if user.is_authenticated else None
+
+
+def async_api_view(permission, query_budget):
+    """
+    Wrap an async GET view with authentication, a permission check on the user and DRF
+    style error responses. The view is called with a DRF Request and the user.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return json_response({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+            try:
+                user = await authenticate(request)
+            except APIException as exc:
+                return json_response({'detail': exc.detail}, status=exc.status_code)
+            if user is None:
+                return json_response({'detail': 'Authentication credentials were not provided.'}, status=401)
+            if not permission(user):
+                return json_response({'detail': 'You do not have permission to perform this action.'}, status=403)
+            return await view(Request(request), user, *args, **kwargs)
+
+        wrapper.query_budget = query_budget
+        return wrapper
+    return decorator
+
+
+async def paginated_data(paginator, request, queryset, serialize):
+    rows = await paginator.apaginate_queryset(queryset, request)
+    if rows is None:
+        return serialize([row async for row in queryset.aiterator()])
+    return paginator.get_paginated_response(serialize(rows)).data
+
+
+@async_api_view(lambda user: True, query_budget={'GET': 2})
+async def appointment_list(request, user):
+    """
+    Async counterpart of AppointmentListView, sharing its cache generations (but not its
+    entries, whose page links point at the sync endpoint).
+    """
+    paginator = AppointmentPagination()
+    if paginator.use_cursor(request):
+        return json_response({'detail': 'Cursor pagination is only available on /appointments/list/.'}, status=400)
+    filterset = AppointmentFilter(
+        request.query_params,
+        queryset=Appointment.objects.visible_to(user).order_by('scheduled_at', 'id'),
+        request=request,
+    )
+    if not filterset.is_valid():
+        return json_response(filterset.errors, status=400)
+
+    fingerprint = query_fingerprint(request.query_params, AppointmentFilter)
+    if fingerprint is None:
+        # Params that do not fingerprint are not cached, as on the sync list
+        return json_response(await list_data(paginator, request, filterset))
+
+    cache_key = await alist_cache_key(request, user, fingerprint)
+    cached_data = await async_cache.get(cache_key)
+    cache_stats.record(hit=cached_data is not None)
+    if cached_data is not None:
+        return json_response(cached_data)
+
+    data = await list_data(paginator, request, filterset)
+    await async_cache.set(cache_key, data, timeout=LIST_CACHE_TIMEOUT)
+    return json_response(data)
+
+
+async def list_data(paginator, request, filterset):
+    return await paginated_data(
+        paginator, request, AppointmentReadSerializer.values(filterset.qs), AppointmentReadSerializer.from_rows
+    )
+
+
+@async_api_view(lambda user: True, query_budget={'GET': 1})
+async def appointment_detail(request, user, id):
+    """
+    Async counterpart of a GET on AppointmentDetailView.
+    """
+    row = await AppointmentReadSerializer.values(Appointment.objects.visible_to(user).filter(id=id)).afirst()
+    if row is None:
+        return json_response({'detail': 'No Appointment matches the given query.'}, status=404)
+    return json_response(AppointmentReadSerializer.from_row(row))
+
+
+@async_api_view(lambda user: user.is_staff, query_budget={'GET': 2})
+async def appointment_report(request, user):
+    """
+    Async counterpart of AppointmentReportView.
+    """
+    filterset = AppointmentReportFilter(request.query_params, queryset=daily_counts(), request=request)
+    if not filterset.is_valid():
+        return json_response(filterset.errors, status=400)
+    data = await paginated_data(
+        CountOptionalLimitOffsetPagination(), request, filterset.qs,
+        lambda rows: AppointmentReportSerializer(rows, many=True, context={'request': request}).data,
+    )
+    return json_response(data)
+
+
+@async_api_view(lambda user: True, query_budget={'GET': 0})
+async def appointment_events(request, user):
+    """
+    Server-sent events for the creates, updates, completions and deletes of the
+    appointments the user may see (see events.py), resuming after Last-Event-ID.
+    """
+    if not isinstance(request._request, ASGIRequest):
+        # Under WSGI the never-ending stream would be buffered whole, holding the worker
+        return json_response({'detail': 'Event streams are only served over ASGI.'}, status=501)
+    hub = get_hub()
+    if hub.is_full():
+        return json_response({'detail': 'Too many event streams are open; retry later.'}, status=503)
+    try:
+        last_event_id = int(request.headers['Last-Event-ID'])
+    except (KeyError, ValueError):
+        last_event_id = None
+    response = StreamingHttpResponse(hub.stream(user, last_event_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,105 @@
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, timedelta
+from django.utils import timezone
+from .models import Appointment, WorkingHours
+
+
+def _aware(day, time_of_day):
+    return timezone.make_aware(datetime.combine(day, time_of_day))
+
+
+def _day_slots(day, blocks):
+    """
+    Yield the (start, end) slots of one day from that weekday's working hour blocks.
+    """
+    for start_time, end_time, slot_minutes in blocks:
+        slot = timedelta(minutes=slot_minutes)
+        start, block_end = _aware(day, start_time), _aware(day, end_time)
+        while start + slot <= block_end:
+            yield start, start + slot
+            start += slot
+
+
+class Timeline:
+    """
+    The booked [start, end) intervals of one doctor, sorted by start. An overlap lookup
+    is a binary search followed by a backwards walk that stops MAX_DURATION before the
+    probed start, since no earlier appointment can still be running.
+    """
+
+    def __init__(self, intervals=()):
+        self._intervals = sorted(intervals, key=lambda interval: interval[:2])
+        self._starts = [interval[0] for interval in self._intervals]
+
+    def find_overlap(self, start, end):
+        """
+        Return the first (start, end, label) interval overlapping [start, end), or None.
+        """
+        lower_bound = start - Appointment.MAX_DURATION
+        for index in range(bisect_left(self._starts, end) - 1, -1, -1):
+            interval = self._intervals[index]
+            if interval[0] <= lower_bound:
+                break
+            if interval[1] > start:
+                return interval
+        return None
+
+    def add(self, start, end, label=None):
+        index = bisect_left(self._starts, start)
+        self._starts.insert(index, start)
+        self._intervals.insert(index, (start, end, label))
+
+
+def load_timelines(doctor_ids, range_start, range_end):
+    """
+    Return {doctor_id: Timeline} of the appointments overlapping [range_start, range_end),
+    loaded with one range query over the (doctor, scheduled_at) index.
+    """
+    intervals = defaultdict(list)
+    for appointment_id, doctor_id, scheduled_at, ends_at in (
+        Appointment.objects.filter(doctor_id__in=doctor_ids)
+        .overlapping(range_start, range_end)
+        .values_list('id', 'doctor_id', 'scheduled_at', 'ends_at')
+    ):
+        intervals[doctor_id].append((scheduled_at, ends_at, appointment_id))
+    return defaultdict(Timeline, {doctor_id: Timeline(rows) for doctor_id, rows in intervals.items()})
+
+
+def free_slots(doctor_ids, start_date, end_date, now=None):
+    """
+    Return {doctor_id: [(start, end), ...]} with every free future slot of the given doctors
+    between start_date and end_date (inclusive).
+
+    Runs two queries no matter how many doctors or days are asked for: the working hours,
+    and one range scan over the (doctor, scheduled_at) index for the booked appointments.
+    Slots are then checked against each doctor's Timeline in memory.
+    """
+    now = now or timezone.now()
+    doctor_ids = list(doctor_ids)
+
+    hours = defaultdict(lambda: defaultdict(list))
+    for doctor_id, weekday, start_time, end_time, slot_minutes in (
+        WorkingHours.objects.filter(doctor_id__in=doctor_ids)
+        .order_by('start_time')
+        .values_list('doctor_id', 'weekday', 'start_time', 'end_time', 'slot_minutes')
+    ):
+        hours[doctor_id][weekday].append((start_time, end_time, slot_minutes))
+
+    range_start = _aware(start_date, datetime.min.time())
+    range_end = _aware(end_date + timedelta(days=1), datetime.min.time())
+    timelines = load_timelines(list(hours), range_start, range_end)
+
+    slots = {}
+    for doctor_id in doctor_ids:
+        weekly_hours = hours.get(doctor_id, {})
+        timeline = timelines[doctor_id]
+        doctor_slots = []
+        day = start_date
+        while day <= end_date:
+            for start, end in _day_slots(day, weekly_hours.get(day.weekday(), ())):
+                if start >= now and timeline.find_overlap(start, end) is None:
+                    doctor_slots.append((start, end))
+            day += timedelta(days=1)
+        slots[doctor_id] = doctor_slots
+    return slots
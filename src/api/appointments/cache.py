@@ -0,0 +1,231 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from django.core.cache import cache
+from django.db import transaction
+from api.tasks.queue import enqueue
+from config.async_cache import async_cache
+from config.metrics import record_cache_result
+
+logger = logging.getLogger('appointment_cache')
+
+LIST_CACHE_TIMEOUT = 300  # Cache list pages for 5 minutes
+
+# Every cached list key embeds the generation of the principal it was built for and
+# the global generation. Bumping a generation makes all older keys unreachable, so
+# invalidation is a single INCR instead of a pattern delete.
+ADMIN_SCOPE = 'admin'
+GLOBAL_SCOPE = 'all'
+
+
+def principal_scope(user):
+    """
+    Return the cache scope of the principal: superusers share one scope, everyone else
+    is scoped by their user id (covering both their doctor and patient appointments).
+    """
+    if user.is_superuser:
+        return ADMIN_SCOPE
+    return user_scope(user.pk)
+
+
+def user_scope(user_id):
+    return f"user:{user_id}"
+
+
+def _generation_key(scope):
+    return f"appointments:gen:{scope}"
+
+
+def _new_generation():
+    # Seeding with a timestamp means a generation that was evicted from the cache
+    # never restarts at a value that older list keys were built with.
+    return time.time_ns()
+
+
+def get_generations(*scopes):
+    """
+    Return the current generation of each scope, fetched in one round trip.
+    """
+    keys = {scope: _generation_key(scope) for scope in scopes}
+    found = cache.get_many(keys.values())
+    generations = []
+    for scope, key in keys.items():
+        generation = found.get(key)
+        if generation is None:
+            cache.add(key, _new_generation(), timeout=None)
+            generation = cache.get(key)
+        generations.append(generation)
+    return generations
+
+
+async def aget_generations(*scopes):
+    """
+    Async counterpart of get_generations, for async views.
+    """
+    keys = {scope: _generation_key(scope) for scope in scopes}
+    found = await async_cache.get_many(keys.values())
+    generations = []
+    for scope, key in keys.items():
+        generation = found.get(key)
+        if generation is None:
+            await async_cache.add(key, _new_generation(), timeout=None)
+            generation = await async_cache.get(key)
+        generations.append(generation)
+    return generations
+
+
+def bump_generations(*scopes):
+    """
+    Invalidate every list entry cached under the given scopes.
+    """
+    for scope in set(scopes):
+        key = _generation_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # The counter is missing, so no entry can reference it; start a fresh one.
+            cache.add(key, _new_generation(), timeout=None)
+
+
+def bump_generations_on_commit(*scopes):
+    """
+    Bump the generations once the surrounding transaction commits, so a concurrent read
+    cannot re-cache the old rows under the new generation. A failed bump is queued as a
+    task to retry.
+    """
+    def bump():
+        try:
+            bump_generations(*scopes)
+        except Exception:
+            logger.exception("Bumping appointment list generations failed; queueing a retry")
+            enqueue('appointments.bump_list_generations', *({'scope': scope} for scope in sorted(scopes)))
+
+    transaction.on_commit(bump)
+
+
+def invalidate_appointment_lists(*user_ids):
+    """
+    Invalidate the lists an appointment write affects once it commits: the admin scope
+    and the scopes of the given doctors and patients.
+    """
+    scopes = {ADMIN_SCOPE}
+    scopes.update(user_scope(user_id) for user_id in user_ids if user_id)
+    bump_generations_on_commit(*scopes)
+
+
+def invalidate_all_appointment_lists():
+    """
+    Invalidate every cached list once the surrounding transaction commits, e.g. when a
+    doctor or patient is renamed.
+    """
+    bump_generations_on_commit(GLOBAL_SCOPE)
+
+
+class CacheStats:
+    """
+    In-process hit/miss counters for the appointment list cache.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit):
+        record_cache_result(hit)
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def snapshot(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / total, 4) if total else None,
+        }
+
+    def reset(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+
+cache_stats = CacheStats()
+
+PAGINATION_PARAMS = ('limit', 'offset')
+PAGINATION_MODE_PARAMS = ('pagination', 'count')
+
+
+def _canonical_value(name, value):
+    if name == 'doctor_name':
+        # The filter matches case-insensitively and the form already trims the value
+        return value.lower()
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def query_fingerprint(query_params, filterset_class):
+    """
+    Return a canonical fingerprint of the filter and pagination params, or None if they
+    do not validate (the view then responds uncached, surfacing the usual errors).
+
+    Filter values are cleaned by the filterset's own form, so every spelling the filter
+    treats the same way ("True"/"true"/"1", " Smith "/"smith") maps to one fingerprint.
+    """
+    form = filterset_class(data=query_params, queryset=filterset_class._meta.model.objects.none()).form
+    if not form.is_valid():
+        return None
+
+    normalized = {
+        name: _canonical_value(name, value)
+        for name, value in form.cleaned_data.items()
+        if value is not None and value != ''
+    }
+    for name in PAGINATION_PARAMS:
+        value = query_params.get(name)
+        if value is None:
+            continue
+        try:
+            normalized[name] = int(value)
+        except (TypeError, ValueError):
+            return None
+    for name in PAGINATION_MODE_PARAMS:
+        value = query_params.get(name)
+        if value:
+            normalized[name] = value.strip().lower()
+    if query_params.get('cursor'):
+        normalized['cursor'] = query_params['cursor']
+
+    payload = json.dumps(normalized, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def _url_hash(request):
+    # The cached page links are absolute, built from the scheme, host and path
+    return hashlib.sha1(request.build_absolute_uri(request.path).encode()).hexdigest()
+
+
+def list_cache_key(request, user, fingerprint):
+    """
+    Build the list cache key for the given principal and query fingerprint, on the URL
+    of the request.
+    """
+    scope = principal_scope(user)
+    scope_generation, global_generation = get_generations(scope, GLOBAL_SCOPE)
+    return f"appointments:list:{scope}:{scope_generation}:{global_generation}:{_url_hash(request)}:{fingerprint}"
+
+
+async def alist_cache_key(request, user, fingerprint):
+    """
+    Async counterpart of list_cache_key.
+    """
+    scope = principal_scope(user)
+    scope_generation, global_generation = await aget_generations(scope, GLOBAL_SCOPE)
+    return f"appointments:list:{scope}:{scope_generation}:{global_generation}:{_url_hash(request)}:{fingerprint}"
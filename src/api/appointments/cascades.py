@@ -0,0 +1,47 @@
+"""
+Appointments deleted along with their users.
+
+Deleting users cascades to all of their appointments, one post_delete each. Receivers
+that handle those in a batch instead collect them with collected(), on the origin of the
+delete (the user or user queryset it was called on), and take them with pop_collected()
+from the users' post_delete: users are deleted after the appointments referencing them.
+Nothing outlives the origin, and a delete that fails halfway leaves nothing behind for
+the next one to pick up.
+"""
+from django.db.models import QuerySet
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from api.users.models import User
+
+_ATTRIBUTE = '_cascaded_appointment_deletes'
+
+
+def is_user_delete(origin):
+    return isinstance(origin, User) or (isinstance(origin, QuerySet) and origin.model is User)
+
+
+def collected(origin, key, factory):
+    """
+    Return what has been collected under `key` in the delete of origin so far, starting
+    with factory().
+    """
+    cascade = vars(origin).setdefault(_ATTRIBUTE, {})
+    if key not in cascade:
+        cascade[key] = factory()
+    return cascade[key]
+
+
+def pop_collected(origin, key):
+    """
+    Remove and return what was collected under `key` in the delete of origin, or None.
+    """
+    cascade = vars(origin).get(_ATTRIBUTE, {}) if origin is not None else {}
+    return cascade.pop(key, None)
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, origin=None, **kwargs):
+    # Sent for every user before any appointment is deleted; drops what an earlier
+    # delete of the same origin collected before it failed
+    if is_user_delete(origin):
+        vars(origin).pop(_ATTRIBUTE, None)
@@ -0,0 +1,209 @@
+"""
+Live appointment events for server-sent event streams.
+
+Every process (event loop, under ASGI) runs one EventHub while it has subscribers. The
+hub polls the outbox (api.outbox) for appointment changes every POLL_INTERVAL seconds,
+one query for all of its connections however many there are, and routes each change
+to the subscribers who may see the appointment under the rules of
+Appointment.objects.visible_to(): superusers, and its doctor and patient. A doctor or
+patient it is moved away from gets it as a delete carrying only its id.
+
+Events are formatted once and shared by every subscriber they go to. A subscriber holds
+at most SUBSCRIBER_QUEUE_SIZE undelivered ones; a client that falls further behind has
+its backlog replaced by a single "reset" event, after which it should reload its list.
+Clients reconnecting with a Last-Event-ID get what they missed from the REPLAY_SIZE
+latest events, or a reset if that is not enough.
+"""
+import asyncio
+import json
+import logging
+import weakref
+from collections import deque
+from asgiref.sync import sync_to_async
+from django.db import connection
+from django.db.models import Max
+from api.outbox.feed import changes_after
+from api.outbox.models import Change
+
+logger = logging.getLogger('appointment_events')
+
+POLL_INTERVAL = 1.0
+POLL_BATCH_SIZE = 500
+HEARTBEAT_INTERVAL = 15  # Keeps proxies from closing idle streams
+SUBSCRIBER_QUEUE_SIZE = 32
+REPLAY_SIZE = 1000
+MAX_SUBSCRIBERS = 10000  # Per process
+RETRY_MILLISECONDS = 3000
+
+COMPLETE = 'complete'
+RESET_MESSAGE = 'event: reset\ndata: {}\n\n'
+HEARTBEAT_MESSAGE = ': keep-alive\n\n'
+
+
+def format_event(sequence, event):
+    return f"id: {sequence}\nevent: appointment\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+
+
+def build_messages(change):
+    """
+    Return the message superusers get for an appointment change, and the message of each
+    doctor and patient involved, keyed by user id.
+    """
+    appointment = dict(change['data'])
+    previous = appointment.pop('previous', None) or {}
+    action = change['action']
+    if action == Change.UPDATE and previous.get('is_completed') is False and appointment['is_completed']:
+        action = COMPLETE
+    message = format_event(change['sequence'], {'action': action, 'id': change['object_id'], 'appointment': appointment})
+
+    owners = {appointment['doctor_id'], appointment['patient_id']}
+    messages = dict.fromkeys(owners, message)
+    former_owners = {previous.get('doctor_id'), previous.get('patient_id')} - owners - {None}
+    if former_owners:
+        # Only the id: they may no longer see who and when it is
+        removed = format_event(change['sequence'], {'action': Change.DELETE, 'id': change['object_id']})
+        messages.update(dict.fromkeys(former_owners, removed))
+    return message, messages
+
+
+class Subscriber:
+    __slots__ = ('user_id', 'is_superuser', 'queue')
+
+    def __init__(self, user):
+        self.user_id = user.pk
+        self.is_superuser = user.is_superuser
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def push(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Too far behind: drop the backlog, the client reloads instead
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESET_MESSAGE)
+
+
+class EventHub:
+
+    def __init__(self):
+        self.subscribers = {}  # user id -> subscribers
+        self.superusers = set()
+        self.count = 0
+        self.cursor = None  # Last sequence number read
+        # (sequence, superuser message, messages by user id) of the latest events, and
+        # the sequence number after which they are complete
+        self.recent = deque()
+        self.replay_from = None
+        self.started = asyncio.Event()
+        self.task = None
+
+    def is_full(self):
+        return self.count >= MAX_SUBSCRIBERS
+
+    async def subscribe(self, subscriber, last_event_id=None):
+        # Counted from here, so the hub is not stopped while the subscriber waits for it
+        self.count += 1
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+        await self.started.wait()
+        if subscriber.is_superuser:
+            self.superusers.add(subscriber)
+        else:
+            self.subscribers.setdefault(subscriber.user_id, set()).add(subscriber)
+
+        if last_event_id is None or last_event_id >= self.cursor:
+            return
+        if last_event_id < self.replay_from:
+            subscriber.push(RESET_MESSAGE)
+            return
+        for sequence, message, messages in self.recent:
+            if sequence > last_event_id:
+                message = message if subscriber.is_superuser else messages.get(subscriber.user_id)
+                if message is not None:
+                    subscriber.push(message)
+
+    def unsubscribe(self, subscriber):
+        if subscriber.is_superuser:
+            self.superusers.discard(subscriber)
+        else:
+            subscribers = self.subscribers.get(subscriber.user_id, set())
+            subscribers.discard(subscriber)
+            if not subscribers:
+                self.subscribers.pop(subscriber.user_id, None)
+        self.count -= 1
+        if not self.count:
+            # Nobody is listening; the next subscriber starts a new hub
+            self.task.cancel()
+            loop = asyncio.get_running_loop()
+            if _hubs.get(loop) is self:
+                del _hubs[loop]
+
+    def publish(self, change):
+        message, messages = build_messages(change)
+        self.recent.append((change['sequence'], message, messages))
+        if len(self.recent) > REPLAY_SIZE:
+            self.replay_from = self.recent.popleft()[0]
+        for subscriber in self.superusers:
+            subscriber.push(message)
+        for user_id, user_message in messages.items():
+            for subscriber in self.subscribers.get(user_id, ()):
+                subscriber.push(user_message)
+
+    async def run(self):
+        while self.cursor is None:
+            try:
+                # Streams start with the changes made after they connect
+                self.cursor = (await Change.objects.aaggregate(last=Max('sequence')))['last'] or 0
+            except Exception:
+                await self.recover()
+        self.replay_from = self.cursor
+        self.started.set()
+        while True:
+            try:
+                changes = [change async for change in changes_after(self.cursor, POLL_BATCH_SIZE, model=Change.APPOINTMENT)]
+            except Exception:
+                await self.recover()
+                continue
+            for change in changes:
+                self.publish(change)
+            if changes:
+                self.cursor = changes[-1]['sequence']
+            if len(changes) < POLL_BATCH_SIZE:
+                await asyncio.sleep(POLL_INTERVAL)
+
+    async def recover(self):
+        logger.exception("Reading appointment changes failed")
+        # The connection may be broken; the next query opens a new one
+        await sync_to_async(connection.close)()
+        await asyncio.sleep(POLL_INTERVAL)
+
+    async def stream(self, user, last_event_id=None):
+        """
+        Yield the server-sent event stream of the user until the client disconnects.
+        """
+        subscriber = Subscriber(user)
+        try:
+            await self.subscribe(subscriber, last_event_id)
+            yield f"retry: {RETRY_MILLISECONDS}\n\n"
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscriber.queue.get(), HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield HEARTBEAT_MESSAGE
+        finally:
+            self.unsubscribe(subscriber)
+
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_hub():
+    """
+    Return the hub of the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = EventHub()
+    return hub
@@ -1,24 +1,27 @@
+from datetime import datetime, timedelta
+from django.utils import timezone
 from django_filters import rest_framework as filters
-from django.db.models import Q
-from .models import Appointment
+from api.users.search import name_search_q
+from .models import Appointment, DailyAppointmentStats
 
 class AppointmentReportFilter(filters.FilterSet):
-    start_date = filters.DateFilter(field_name='scheduled_at', lookup_expr='gte')
-    end_date = filters.DateFilter(field_name='scheduled_at', lookup_expr='lte')
+    """
+    Filters the daily rollup behind the report; both date bounds are inclusive.
+    """
+    start_date = filters.DateFilter(field_name='date', lookup_expr='gte')
+    end_date = filters.DateFilter(field_name='date', lookup_expr='lte')
     doctor_name = filters.CharFilter(method='filter_doctor_name')
     is_completed = filters.BooleanFilter(field_name='is_completed')
 
     class Meta:
-        model = Appointment
+        model = DailyAppointmentStats
         fields = ['start_date', 'end_date', 'doctor_name', 'is_completed']
 
     def filter_doctor_name(self, queryset, name, value):
-        return queryset.filter(
-            Q(doctor__first_name__icontains=value) | Q(doctor__last_name__icontains=value)
-        )
+        return queryset.filter(name_search_q(value, field='doctor_id'))
 
 class AppointmentFilter(filters.FilterSet):
-    date = filters.DateFilter(field_name='scheduled_at__date') 
+    date = filters.DateFilter(method='filter_date')
     doctor_name = filters.CharFilter(method='filter_doctor_name')
     is_completed = filters.BooleanFilter(field_name='is_completed')
 
@@ -26,7 +29,12 @@ class AppointmentFilter(filters.FilterSet):
         model = Appointment
         fields = ['date', 'doctor_name', 'is_completed']
     
+    def filter_date(self, queryset, name, value):
+        # Same day boundaries as scheduled_at__date, but as a range the scheduled_at
+        # indexes can serve instead of a function applied to every row
+        day_start = timezone.make_aware(datetime.combine(value, datetime.min.time()))
+        next_day_start = timezone.make_aware(datetime.combine(value + timedelta(days=1), datetime.min.time()))
+        return queryset.filter(scheduled_at__gte=day_start, scheduled_at__lt=next_day_start)
+
     def filter_doctor_name(self, queryset, name, value):
-        return queryset.filter(
-            Q(doctor__first_name__icontains=value) | Q(doctor__last_name__icontains=value)
-        )
\ No newline at end of file
+        return queryset.filter(name_search_q(value, field='doctor_id'))
\ No newline at end of file
@@ -0,0 +1,70 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from api.appointments.models import Appointment
+from api.appointments.serializer import AppointmentSerializer, AppointmentReadSerializer
+from api.users.models import User
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare AppointmentSerializer with the read-only fast path on list pages. "
+        "Runs inside a transaction that is rolled back, so no data is left behind."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[5, 100, 1000])
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['sizes'], options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, sizes, repeat):
+        doctor = User.objects.create(username='benchmark-doctor', email='benchmark-doctor@example.com', role=User.DOCTOR)
+        patient = User.objects.create(username='benchmark-patient', email='benchmark-patient@example.com')
+        start = timezone.now()
+        appointments = [
+            Appointment(doctor=doctor, patient=patient, scheduled_at=start + timedelta(hours=i))
+            for i in range(max(sizes))
+        ]
+        for appointment in appointments:
+            appointment.compute_ends_at()
+        Appointment.objects.bulk_create(appointments)
+        queryset = Appointment.objects.filter(doctor=doctor).order_by('scheduled_at', 'id')
+        renderer = JSONRenderer()
+
+        def serializer_page(size):
+            page = list(queryset.select_related('doctor', 'patient')[:size])
+            return renderer.render(AppointmentSerializer(page, many=True).data)
+
+        def fast_page(size):
+            page = list(AppointmentReadSerializer.values(queryset)[:size])
+            return renderer.render(AppointmentReadSerializer.from_rows(page))
+
+        self.stdout.write(f"{'page size':>10} {'serializer ms':>14} {'fast path ms':>13} {'speedup':>8}")
+        for size in sizes:
+            if serializer_page(size) != fast_page(size):
+                raise CommandError(f"Fast path output differs from AppointmentSerializer at page size {size}.")
+            slow = self.best_of(serializer_page, size, repeat)
+            fast = self.best_of(fast_page, size, repeat)
+            self.stdout.write(f"{size:>10} {slow * 1000:>14.2f} {fast * 1000:>13.2f} {slow / fast:>7.1f}x")
+
+    def best_of(self, function, size, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            function(size)
+            timings.append(time.perf_counter() - started)
+        return min(timings)
@@ -0,0 +1,166 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from asgiref.sync import ThreadSensitiveContext
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+from api.appointments.models import Appointment
+from api.users.models import User
+from .benchmark_hms_api import percentile
+
+# (name, sync URL name, async URL name, needs an appointment id)
+ENDPOINTS = (
+    ('list', 'appointment-list', 'appointment-async-list', False),
+    ('detail', 'appointment-detail', 'appointment-async-detail', True),
+    ('report', 'appointment-report', 'appointment-async-report', False),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the async appointment read endpoints under the ASGI handler with the sync "
+        "DRF views under a WSGI handler with a fixed thread pool, at the same number of "
+        "concurrent clients. --db-delay-ms makes every query slower to model a loaded database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300, help="Requests per endpoint and path.")
+        parser.add_argument('--concurrency', type=int, default=50, help="Concurrent clients.")
+        parser.add_argument('--wsgi-threads', type=int, default=8, help="Worker threads of the modeled WSGI server.")
+        parser.add_argument('--db-delay-ms', type=float, default=0, help="Added latency of every SQL query.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Write the results to this JSON file.")
+
+    def handle(self, *args, **options):
+        admin = User.objects.filter(is_superuser=True, is_active=True).order_by('id').first()
+        if admin is None:
+            raise CommandError("The benchmark needs an active superuser; create one with createsuperuser.")
+        appointment_ids = list(Appointment.objects.order_by('id').values_list('id', flat=True)[:1000])
+        if not appointment_ids:
+            raise CommandError("There are no appointments; run seed_hms first.")
+
+        self.authorization = f'Bearer {AccessToken.for_user(admin)}'
+        self.install_db_delay(options['db_delay_ms'])
+        rng = random.Random(options['seed'])
+        results = {}
+        # Both test clients send "testserver" as the host, which the test runner allows too
+        allowed_hosts = override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'])
+        try:
+            with allowed_hosts:
+                for name, sync_name, async_name, by_id in ENDPOINTS:
+                    paths = []
+                    for _ in range(options['requests']):
+                        if by_id:
+                            kwargs = {'id': rng.choice(appointment_ids)}
+                            paths.append((reverse(sync_name, kwargs=kwargs), reverse(async_name, kwargs=kwargs)))
+                        else:
+                            # Different pages, so the list cache does not answer everything
+                            query = f'?offset={rng.randrange(0, 1000)}'
+                            paths.append((reverse(sync_name) + query, reverse(async_name) + query))
+                    results[f'{name}:wsgi'] = self.run_wsgi(
+                        [sync_path for sync_path, _ in paths], options['concurrency'], options['wsgi_threads']
+                    )
+                    results[f'{name}:asgi'] = asyncio.run(
+                        self.run_asgi([async_path for _, async_path in paths], options['concurrency'])
+                    )
+        finally:
+            connection_created.disconnect(dispatch_uid='benchmark_db_delay')
+
+        self.report(results)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump({'options': {key: options[key] for key in (
+                    'requests', 'concurrency', 'wsgi_threads', 'db_delay_ms', 'seed'
+                )}, 'endpoints': results}, output_file, indent=2)
+            self.stdout.write(f"Results written to {options['output']}.")
+
+    def install_db_delay(self, delay_ms):
+        if not delay_ms:
+            return
+
+        def delayed(execute, sql, params, many, context):
+            # A blocking wait, like a slow database holds the calling thread
+            time.sleep(delay_ms / 1000)
+            return execute(sql, params, many, context)
+
+        def add_delay(sender, connection, **kwargs):
+            connection.execute_wrappers.append(delayed)
+
+        connections.close_all()
+        connection_created.connect(add_delay, weak=False, dispatch_uid='benchmark_db_delay')
+
+    def run_wsgi(self, paths, concurrency, threads):
+        """
+        Each client thread sends its share of requests back to back; a semaphore sized
+        like the server's thread pool makes requests queue as they would for a worker.
+        """
+        workers = threading.BoundedSemaphore(threads)
+        latencies, errors = [], []
+
+        def client_loop(client_paths):
+            client = Client(HTTP_AUTHORIZATION=self.authorization)
+            try:
+                for path in client_paths:
+                    started = time.perf_counter()
+                    with workers:
+                        response = client.get(path)
+                    latencies.append(time.perf_counter() - started)
+                    if response.status_code >= 400:
+                        errors.append(response.status_code)
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(client_loop, [paths[i::concurrency] for i in range(concurrency)]))
+        return self.summarize(latencies, errors, time.perf_counter() - started)
+
+    async def run_asgi(self, paths, concurrency):
+        latencies, errors = [], []
+
+        async def client_loop(client_paths):
+            client = AsyncClient()
+            headers = {'authorization': self.authorization}
+            for path in client_paths:
+                started = time.perf_counter()
+                # ASGIHandler gives each request its own thread for sync code; the test
+                # client does not, so do it here
+                async with ThreadSensitiveContext():
+                    response = await client.get(path, headers=headers)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code >= 400:
+                    errors.append(response.status_code)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(paths[i::concurrency]) for i in range(concurrency)))
+        return self.summarize(latencies, errors, time.perf_counter() - started)
+
+    def summarize(self, latencies, errors, elapsed):
+        latencies = sorted(latency * 1000 for latency in latencies)
+        return {
+            'requests': len(latencies),
+            'errors': len(errors),
+            'requests_per_second': round(len(latencies) / elapsed, 1),
+            'latency_ms': {
+                'p50': round(percentile(latencies, 50), 3),
+                'p95': round(percentile(latencies, 95), 3),
+                'p99': round(percentile(latencies, 99), 3),
+            },
+        }
+
+    def report(self, results):
+        self.stdout.write(f"{'endpoint':<14} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for name, summary in results.items():
+            latency = summary['latency_ms']
+            self.stdout.write(
+                f"{name:<14} {summary['requests']:>8} {summary['errors']:>6} {summary['requests_per_second']:>8.1f} "
+                f"{latency['p50']:>8.2f} {latency['p95']:>8.2f} {latency['p99']:>8.2f}"
+            )
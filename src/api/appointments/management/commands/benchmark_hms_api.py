@@ -0,0 +1,217 @@
+import json
+import math
+import random
+import time
+from collections import defaultdict
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from api.appointments.cache import cache_stats
+from api.appointments.models import Appointment
+from api.users.models import User
+
+
+def percentile(sorted_values, percent):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    index = max(math.ceil(percent / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a weighted mix of API requests through the Django test client against the "
+        "current database (see seed_hms) and report latency percentiles and query counts "
+        "per endpoint. Use --output to keep the results as JSON and --baseline to compare runs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--warmup', type=int, default=50, help="Requests replayed first and not measured.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='seed', help="Username prefix the dataset was seeded with.")
+        parser.add_argument('--host', default='localhost', help="Host header; must be in ALLOWED_HOSTS.")
+        parser.add_argument('--output', help="Write the results to this JSON file.")
+        parser.add_argument('--baseline', help="JSON file of an earlier run to compare against.")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.host = options['host']
+        self.clients = {}
+        self.load_principals(options['prefix'])
+
+        for _ in range(options['warmup']):
+            self.replay(self.pick_scenario())
+
+        cache_before = cache_stats.snapshot()
+        samples = defaultdict(list)
+        for _ in range(options['requests']):
+            name = self.pick_scenario()
+            samples[name].append(self.replay(name))
+        cache_after = cache_stats.snapshot()
+
+        results = {
+            'meta': {
+                'finished_at': timezone.now().isoformat(),
+                'seed': options['seed'],
+                'requests': options['requests'],
+                'database': connection.vendor,
+                'dataset': {
+                    'doctors': User.objects.filter(role=User.DOCTOR).count(),
+                    'patients': User.objects.filter(role=User.PATIENT).count(),
+                    'appointments': Appointment.objects.count(),
+                },
+                'list_cache': {
+                    'hits': cache_after['hits'] - cache_before['hits'],
+                    'misses': cache_after['misses'] - cache_before['misses'],
+                },
+            },
+            'endpoints': {name: self.summarize(samples[name]) for name in sorted(samples)},
+        }
+        self.report(results['endpoints'])
+        if options['baseline']:
+            with open(options['baseline']) as baseline_file:
+                self.compare(json.load(baseline_file)['endpoints'], results['endpoints'])
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump(results, output_file, indent=2)
+            self.stdout.write(f"Results written to {options['output']}.")
+
+    def load_principals(self, prefix):
+        self.admin = User.objects.filter(is_superuser=True, is_active=True).order_by('id').first()
+        if self.admin is None:
+            raise CommandError("The benchmark needs an active superuser; create one with createsuperuser.")
+        self.doctor_ids = list(
+            User.objects.filter(username__startswith=f"{prefix}-{User.DOCTOR}-").order_by('id').values_list('id', flat=True)
+        )
+        self.patient_ids = list(
+            User.objects.filter(username__startswith=f"{prefix}-{User.PATIENT}-").order_by('id').values_list('id', flat=True)
+        )
+        if not self.doctor_ids or not self.patient_ids:
+            raise CommandError(f"No users seeded with prefix '{prefix}'; run seed_hms first.")
+        # Appointments to open in detail requests, with the patient who may see them
+        self.appointments = list(
+            Appointment.objects.filter(patient_id__in=self.patient_ids[:200]).order_by('id').values_list('id', 'patient_id')[:1000]
+        )
+        self.today = timezone.localdate()
+
+    # Each scenario returns the user the request is made as and the URL to GET
+    def scenarios(self):
+        return {
+            'appointments:list:admin': (20, self.admin_list),
+            'appointments:list:doctor': (15, self.doctor_list),
+            'appointments:list:patient': (15, self.patient_list),
+            'appointments:detail': (20, self.detail),
+            'appointments:report': (5, self.report_page),
+            'appointments:availability': (10, self.availability),
+            'users:list': (15, self.user_list),
+        }
+
+    def pick_scenario(self):
+        scenarios = self.scenarios()
+        if not self.appointments:
+            scenarios.pop('appointments:detail')
+        names = list(scenarios)
+        return self.rng.choices(names, weights=[scenarios[name][0] for name in names])[0]
+
+    def random_day(self):
+        return self.today + timedelta(days=self.rng.randint(-90, 90))
+
+    def admin_list(self):
+        url = reverse('appointment-list')
+        query = self.rng.choice([
+            '',
+            f'?offset={self.rng.randrange(0, 2000, 10)}',
+            f'?date={self.random_day()}',
+            f'?is_completed={self.rng.choice(["true", "false"])}',
+            f'?doctor_name={self.rng.choice(["am", "khan", "sami", "lo"])}',
+            '?pagination=cursor',
+        ])
+        return self.admin.id, url + query
+
+    def doctor_list(self):
+        query = self.rng.choice(['', f'?date={self.random_day()}', '?is_completed=false'])
+        return self.rng.choice(self.doctor_ids), reverse('appointment-list') + query
+
+    def patient_list(self):
+        return self.rng.choice(self.patient_ids), reverse('appointment-list')
+
+    def detail(self):
+        appointment_id, patient_id = self.rng.choice(self.appointments)
+        return patient_id, reverse('appointment-detail', kwargs={'id': appointment_id})
+
+    def report_page(self):
+        start = self.random_day()
+        return self.admin.id, f"{reverse('appointment-report')}?start_date={start}&end_date={start + timedelta(days=30)}"
+
+    def availability(self):
+        doctor_ids = ','.join(str(doctor_id) for doctor_id in self.rng.sample(self.doctor_ids, min(3, len(self.doctor_ids))))
+        start = self.today + timedelta(days=self.rng.randint(0, 30))
+        url = f"{reverse('appointment-availability')}?doctor_ids={doctor_ids}&start_date={start}&end_date={start + timedelta(days=6)}"
+        return self.rng.choice(self.patient_ids), url
+
+    def user_list(self):
+        user_type = self.rng.choice([User.DOCTOR, User.PATIENT])
+        url = reverse('user-list', kwargs={'user_type': user_type})
+        return self.admin.id, f"{url}?offset={self.rng.randrange(0, 500, 10)}"
+
+    def client_for(self, user_id):
+        client = self.clients.get(user_id)
+        if client is None:
+            client = self.clients[user_id] = Client(HTTP_HOST=self.host)
+            client.force_login(User.objects.get(id=user_id))
+        return client
+
+    def replay(self, name):
+        user_id, url = self.scenarios()[name][1]()
+        client = self.client_for(user_id)
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            response = client.get(url)
+            elapsed = time.perf_counter() - started
+        return elapsed, len(context.captured_queries), response.status_code
+
+    def summarize(self, samples):
+        latencies = sorted(elapsed * 1000 for elapsed, _, _ in samples)
+        queries = [count for _, count, _ in samples]
+        return {
+            'requests': len(samples),
+            'errors': sum(1 for _, _, status_code in samples if status_code >= 400),
+            'latency_ms': {
+                'p50': round(percentile(latencies, 50), 3),
+                'p95': round(percentile(latencies, 95), 3),
+                'p99': round(percentile(latencies, 99), 3),
+                'mean': round(sum(latencies) / len(latencies), 3),
+                'max': round(latencies[-1], 3),
+            },
+            'queries': {
+                'mean': round(sum(queries) / len(queries), 2),
+                'max': max(queries),
+            },
+        }
+
+    def report(self, endpoints):
+        self.stdout.write(
+            f"{'endpoint':<28} {'requests':>8} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8}"
+        )
+        for name, summary in endpoints.items():
+            latency = summary['latency_ms']
+            self.stdout.write(
+                f"{name:<28} {summary['requests']:>8} {summary['errors']:>6} {latency['p50']:>8.2f} "
+                f"{latency['p95']:>8.2f} {latency['p99']:>8.2f} {summary['queries']['mean']:>8.2f}"
+            )
+
+    def compare(self, baseline, endpoints):
+        self.stdout.write(f"\n{'endpoint':<28} {'p95 ms before':>14} {'p95 ms now':>11} {'change':>8} {'queries':>13}")
+        for name, summary in endpoints.items():
+            if name not in baseline:
+                continue
+            before, now = baseline[name]['latency_ms']['p95'], summary['latency_ms']['p95']
+            change = f"{(now - before) / before * 100:+.0f}%" if before else 'n/a'
+            queries = f"{baseline[name]['queries']['mean']:.1f} -> {summary['queries']['mean']:.1f}"
+            self.stdout.write(f"{name:<28} {before:>14.2f} {now:>11.2f} {change:>8} {queries:>13}")
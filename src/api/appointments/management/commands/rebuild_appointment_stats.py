@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from api.appointments.models import Appointment, DailyAppointmentStats
+from api.appointments.rollups import rebuild_daily_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily appointment rollup from the appointment table."
+
+    def handle(self, *args, **options):
+        rebuild_daily_stats(Appointment, DailyAppointmentStats)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {DailyAppointmentStats.objects.count()} daily appointment stats rows."
+        ))
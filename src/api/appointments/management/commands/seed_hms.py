@@ -0,0 +1,147 @@
+import random
+from datetime import date, datetime, time, timedelta
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from api.appointments.cache import invalidate_all_appointment_lists
+from api.appointments.models import Appointment, DailyAppointmentStats, WorkingHours
+from api.appointments.rollups import rebuild_daily_stats
+from api.users import directory
+from api.users.models import User, NameSearchToken
+from api.users.search import name_prefixes
+
+FIRST_NAMES = (
+    'Amina', 'Bilal', 'Chen', 'Daniela', 'Emeka', 'Farah', 'Gustavo', 'Hana', 'Ibrahim', 'Julia',
+    'Kenji', 'Leila', 'Mateo', 'Nadia', 'Omar', 'Priya', 'Quentin', 'Rosa', 'Sami', 'Tariq',
+)
+LAST_NAMES = (
+    'Ahmed', 'Brown', 'Costa', 'Dubois', 'Eze', 'Fischer', 'Garcia', 'Haddad', 'Ivanova', 'Jensen',
+    'Khan', 'Lopez', 'Müller', 'Nakamura', 'Okafor', 'Petrov', 'Qureshi', 'Rossi', 'Silva', 'Tanaka',
+)
+SPECIALIZATIONS = ('Cardiology', 'Dermatology', 'General practice', 'Neurology', 'Pediatrics', 'Radiology')
+
+# Seeded doctors work 09:00-17:00 on weekdays in 30 minute slots
+WORKDAY_START, WORKDAY_END = time(9), time(17)
+SLOT = timedelta(minutes=Appointment.DEFAULT_DURATION_MINUTES)
+SLOTS_PER_DAY = int((datetime.combine(datetime.min, WORKDAY_END) - datetime.combine(datetime.min, WORKDAY_START)) / SLOT)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed synthetic doctors, patients and appointments with bulk inserts. The same "
+        "--seed always produces the same dataset. Seeded usernames start with --prefix."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=100)
+        parser.add_argument('--patients', type=int, default=5000)
+        parser.add_argument('--appointments', type=int, default=100000)
+        parser.add_argument('--days', type=int, default=365, help="Days the appointments are spread over.")
+        parser.add_argument(
+            '--start-date', type=date.fromisoformat,
+            help="First day of the appointments (YYYY-MM-DD); defaults to --days / 2 days ago.",
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='seed')
+        parser.add_argument('--password', default='password', help="Password of every seeded user.")
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--clear', action='store_true', help="Delete users seeded with the same prefix first.")
+
+    def handle(self, *args, **options):
+        doctors, patients, appointments = options['doctors'], options['patients'], options['appointments']
+        if doctors < 1 or patients < 1:
+            raise CommandError("At least one doctor and one patient are needed.")
+        workdays = self.workdays(options['start_date'], options['days'])
+        if appointments > doctors * len(workdays) * SLOTS_PER_DAY:
+            raise CommandError(
+                f"{doctors} doctors only have {doctors * len(workdays) * SLOTS_PER_DAY} free slots in {options['days']} days."
+            )
+
+        self.rng = random.Random(options['seed'])
+        self.prefix = options['prefix']
+        self.batch_size = options['batch_size']
+        with transaction.atomic():
+            if options['clear']:
+                deleted, _ = User.objects.filter(username__startswith=f"{self.prefix}-").delete()
+                self.stdout.write(f"Deleted {deleted} rows seeded earlier.")
+            password = make_password(options['password'])
+            doctor_ids = self.create_users(User.DOCTOR, doctors, password)
+            patient_ids = self.create_users(User.PATIENT, patients, password)
+            self.create_appointments(doctor_ids, patient_ids, appointments, workdays)
+            # One GROUP BY is cheaper than applying a delta per bucket for a large batch
+            rebuild_daily_stats(Appointment, DailyAppointmentStats)
+            # Rows inserted in bulk send no signals, so drop every cached list at once
+            invalidate_all_appointment_lists()
+            directory.invalidate_roles(User.DOCTOR, User.PATIENT)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {doctors} doctors, {patients} patients and {appointments} appointments (seed {options['seed']})."
+        ))
+
+    def create_users(self, role, count, password):
+        users = []
+        for i in range(count):
+            username = f"{self.prefix}-{role}-{i}"
+            users.append(User(
+                username=username,
+                email=f"{username}@example.com",
+                password=password,
+                role=role,
+                first_name=self.rng.choice(FIRST_NAMES),
+                last_name=self.rng.choice(LAST_NAMES),
+                specialization=self.rng.choice(SPECIALIZATIONS) if role == User.DOCTOR else None,
+            ))
+        User.objects.bulk_create(users, batch_size=self.batch_size)
+        # bulk_create only returns primary keys on some backends, so read them back
+        ids = dict(User.objects.filter(username__startswith=f"{self.prefix}-{role}-").values_list('username', 'id'))
+        for user in users:
+            user.id = ids[user.username]
+
+        if role == User.DOCTOR:
+            NameSearchToken.objects.bulk_create(
+                (
+                    NameSearchToken(user_id=user.id, prefix=prefix)
+                    for user in users
+                    for prefix in name_prefixes(user.first_name, user.last_name)
+                ),
+                batch_size=self.batch_size,
+            )
+            WorkingHours.objects.bulk_create(
+                (
+                    WorkingHours(doctor_id=user.id, weekday=weekday, start_time=WORKDAY_START, end_time=WORKDAY_END)
+                    for user in users
+                    for weekday in range(5)
+                ),
+                batch_size=self.batch_size,
+            )
+        return [user.id for user in users]
+
+    def workdays(self, start_date, days):
+        start_date = start_date or timezone.localdate() - timedelta(days=days // 2)
+        return [
+            day for day in (start_date + timedelta(days=offset) for offset in range(days))
+            if day.weekday() < 5
+        ]
+
+    def create_appointments(self, doctor_ids, patient_ids, count, workdays):
+        slots_per_doctor = len(workdays) * SLOTS_PER_DAY
+        now = timezone.now()
+
+        # Spread the appointments evenly, each doctor getting distinct slots, so the
+        # dataset satisfies the (doctor, scheduled_at) constraint and has no overlaps
+        appointments = []
+        for index, doctor_id in enumerate(doctor_ids):
+            share = count // len(doctor_ids) + (index < count % len(doctor_ids))
+            for slot in sorted(self.rng.sample(range(slots_per_doctor), share)):
+                day, slot_of_day = divmod(slot, SLOTS_PER_DAY)
+                scheduled_at = timezone.make_aware(datetime.combine(workdays[day], WORKDAY_START)) + slot_of_day * SLOT
+                appointment = Appointment(
+                    doctor_id=doctor_id,
+                    patient_id=self.rng.choice(patient_ids),
+                    scheduled_at=scheduled_at,
+                    is_completed=scheduled_at < now and self.rng.random() < 0.9,
+                )
+                appointment.compute_ends_at()
+                appointments.append(appointment)
+        Appointment.objects.bulk_create(appointments, batch_size=self.batch_size)
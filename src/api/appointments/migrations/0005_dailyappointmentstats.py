@@ -0,0 +1,48 @@
+# Generated by Django 5.1.1 on 2026-10-18 11:13
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def backfill_daily_stats(apps, schema_editor):
+    Appointment = apps.get_model('appointments', 'Appointment')
+    DailyAppointmentStats = apps.get_model('appointments', 'DailyAppointmentStats')
+    rows = (
+        Appointment.objects
+        .values('doctor_id', 'is_completed', date=TruncDate('scheduled_at'))
+        .annotate(appointment_count=Count('id'))
+        .order_by()
+    )
+    DailyAppointmentStats.objects.bulk_create(
+        (DailyAppointmentStats(**row) for row in rows.iterator()), batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0004_appointment_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyAppointmentStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('is_completed', models.BooleanField()),
+                ('appointment_count', models.IntegerField(default=0)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_appointment_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Daily appointment stats',
+                'verbose_name_plural': 'Daily appointment stats',
+                'unique_together': {('date', 'doctor', 'is_completed')},
+            },
+        ),
+        migrations.RunPython(backfill_daily_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+from datetime import timedelta
+
+import django.core.validators
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_ends_at(apps, schema_editor):
+    Appointment = apps.get_model('appointments', 'Appointment')
+    Appointment.objects.update(ends_at=F('scheduled_at') + timedelta(minutes=30))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0006_workinghours'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='duration_minutes',
+            field=models.PositiveSmallIntegerField(default=30, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(480)]),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='ends_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_ends_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='appointment',
+            name='ends_at',
+            field=models.DateTimeField(editable=False),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.1 on 2026-10-18 11:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0007_appointment_duration'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='appointment_doctor__649ad1_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='appointment_patient_94a7ef_idx',
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'scheduled_at'], name='appointment_patient_42b596_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['is_completed', 'scheduled_at'], name='appointment_is_comp_d452da_idx'),
+        ),
+    ]
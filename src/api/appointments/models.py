@@ -1,22 +1,142 @@
-from django.db import models
+from datetime import timedelta
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import models, transaction
 from api.users.models import User
 from django.utils import timezone
 
+
+class AppointmentQuerySet(models.QuerySet):
+
+    def visible_to(self, user):
+        """
+        Return the appointments the user may see: all of them for superusers, otherwise
+        those where the user is the doctor or the patient.
+        """
+        if user.is_superuser:
+            return self
+        return self.filter(models.Q(doctor_id=user.pk) | models.Q(patient_id=user.pk))
+
+    def overlapping(self, start, end):
+        """
+        Return the appointments overlapping [start, end). No appointment is longer than
+        MAX_DURATION, so the lower bound on scheduled_at keeps the lookup a short range
+        scan on the (doctor, scheduled_at) index however long the doctor's history is.
+        """
+        return self.filter(
+            scheduled_at__gt=start - Appointment.MAX_DURATION,
+            scheduled_at__lt=end,
+            ends_at__gt=start,
+        )
+
+
 class Appointment(models.Model):
+    DEFAULT_DURATION_MINUTES = 30
+    MAX_DURATION = timedelta(hours=8)
+
+
     doctor = models.ForeignKey(User, related_name="doctor_appointment",on_delete=models.CASCADE)
     patient = models.ForeignKey(User, related_name="patient_appointment", on_delete=models.CASCADE)
     scheduled_at = models.DateTimeField()
+    duration_minutes = models.PositiveSmallIntegerField(
+        default=DEFAULT_DURATION_MINUTES,
+        validators=[MinValueValidator(1), MaxValueValidator(MAX_DURATION // timedelta(minutes=1))],
+    )
+    # Denormalized scheduled_at + duration_minutes, so overlaps can be found in SQL
+    ends_at = models.DateTimeField(editable=False)
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
     is_completed= models.BooleanField(default=False)
+
+    objects = AppointmentQuerySet.as_manager()
+
     class Meta:
         unique_together = ('doctor','scheduled_at')
         verbose_name = 'Appointment'
         verbose_name_plural = 'Appointments'
+        # The doctor's appointments by time are served by the unique (doctor, scheduled_at)
+        # index; these cover the other hot paths (see QueryPlanTests).
         indexes = [
-            models.Index(fields=['doctor']),
-            models.Index(fields=['patient']),
+            # A patient's appointments by time
+            models.Index(fields=['patient', 'scheduled_at']),
+            # ?is_completed= lists, in list order
+            models.Index(fields=['is_completed', 'scheduled_at']),
+            # Keyset pagination order, and ?date= ranges for admins
+            models.Index(fields=['scheduled_at', 'id']),
         ]
 
+    # Fields whose loaded values are remembered, so a write can also update what was
+    # derived from the previous values (the previous owners' list caches, daily rollups).
+    TRACKED_FIELDS = ('doctor_id', 'patient_id', 'scheduled_at', 'is_completed')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_state = instance.tracked_state()
+        return instance
+
+    def compute_ends_at(self):
+        self.ends_at = self.scheduled_at + timedelta(minutes=self.duration_minutes)
+
+    def save(self, *args, **kwargs):
+        self.compute_ends_at()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'scheduled_at', 'duration_minutes'}.intersection(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'ends_at'}
+        # The post_save receivers' writes (change record, rollup) commit with the row
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+
+    def tracked_state(self):
+        return {name: self.__dict__.get(name) for name in self.TRACKED_FIELDS}
+
+    def __str__(self):
+        return f"Appointment for {self.patient.get_full_name()} with Dr. {self.doctor.get_full_name()} on {self.scheduled_at}"
+
+
+class DailyAppointmentStats(models.Model):
+    """
+    Appointment counts per day, doctor and completion status, maintained incrementally
+    from Appointment writes (see rollups.py) so reports never scan the appointment table.
+    """
+    date = models.DateField()
+    doctor = models.ForeignKey(User, related_name="daily_appointment_stats", on_delete=models.CASCADE)
+    is_completed = models.BooleanField()
+    appointment_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('date', 'doctor', 'is_completed')
+        verbose_name = 'Daily appointment stats'
+        verbose_name_plural = 'Daily appointment stats'
+
+    def __str__(self):
+        return f"{self.appointment_count} appointments on {self.date}"
+
+
+class WorkingHours(models.Model):
+    """
+    A block of a doctor's weekly working hours, split into bookable slots of slot_minutes.
+    Times are in the project time zone.
+    """
+    WEEKDAY_CHOICES = [
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday'),
+    ]
+
+    doctor = models.ForeignKey(User, related_name="working_hours", on_delete=models.CASCADE)
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    slot_minutes = models.PositiveSmallIntegerField(default=30)
+
+    class Meta:
+        unique_together = ('doctor', 'weekday', 'start_time')
+        verbose_name = 'Working hours'
+        verbose_name_plural = 'Working hours'
+
     def __str__(self):
-        return f"Appointment for {self.patient.get_full_name()} with Dr. {self.doctor.get_full_name()} on {self.scheduled_at}"
\ No newline at end of file
+        return f"{self.get_weekday_display()} {self.start_time}-{self.end_time}"
@@ -0,0 +1,109 @@
+from collections import OrderedDict
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+FALSE_VALUES = ('0', 'false', 'no', 'off')
+
+
+class CountOptionalLimitOffsetPagination(LimitOffsetPagination):
+    """
+    Limit/offset pagination that skips the COUNT(*) query when called with ?count=false.
+    Without a count, one extra row is fetched to tell whether there is a next page.
+    """
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.skip_count = request.query_params.get(self.count_query_param, '').lower() in FALSE_VALUES
+        if not self.skip_count:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.offset = self.get_offset(request)
+        rows = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(rows) > self.limit
+        return rows[:self.limit]
+
+    async def apaginate_queryset(self, queryset, request):
+        """
+        Async counterpart of paginate_queryset for async views, using acount() and
+        aiterator(). Takes a DRF Request, like paginate_queryset.
+        """
+        self.request = request
+        self.skip_count = request.query_params.get(self.count_query_param, '').lower() in FALSE_VALUES
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.offset = self.get_offset(request)
+        if self.skip_count:
+            rows = [row async for row in queryset[self.offset:self.offset + self.limit + 1].aiterator()]
+            self.has_next = len(rows) > self.limit
+            return rows[:self.limit]
+
+        self.count = await queryset.acount()
+        if self.count == 0 or self.offset > self.count:
+            return []
+        return [row async for row in queryset[self.offset:self.offset + self.limit].aiterator()]
+
+    def get_next_link(self):
+        if not self.skip_count:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+
+    def get_paginated_response(self, data):
+        if not self.skip_count:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+
+class OptInCursorPagination(CountOptionalLimitOffsetPagination):
+    """
+    Limit/offset pagination by default; keyset (cursor) pagination when the request asks
+    for it with ?pagination=cursor or carries a cursor from a previous page. Keyset pages
+    never count and cost the same no matter how deep they are.
+    """
+    pagination_query_param = 'pagination'
+    cursor_pagination_class = None
+
+    def use_cursor(self, request):
+        return (
+            request.query_params.get(self.pagination_query_param) == 'cursor'
+            or self.cursor_pagination_class.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if self.use_cursor(request):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request):
+        # Keyset pages are only served through the sync paginate_queryset
+        self.cursor_paginator = None
+        return await super().apaginate_queryset(queryset, request)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class AppointmentCursorPagination(CursorPagination):
+    ordering = ('scheduled_at', 'id')
+    page_size_query_param = 'limit'
+
+
+class AppointmentPagination(OptInCursorPagination):
+    cursor_pagination_class = AppointmentCursorPagination
@@ -1,19 +1,23 @@
-from rest_framework.permissions import BasePermission
+from rest_framework.permissions import BasePermission, SAFE_METHODS
 
 class IsAppointmentOwnerOrSuperuser(BasePermission):
     """
     Custom permission to allow only the doctor, patient, or superuser to view the appointment.
     Only superusers can update, delete, or create an appointment.
+
+    Ownership is enforced by the view's queryset (Appointment.objects.visible_to), so
+    appointments of other users are never fetched; the object check only backs it up.
     """
-    
+
+    def has_permission(self, request, view):
+        # Reject writes by non-superusers before anything is fetched
+        return request.method in SAFE_METHODS or request.user.is_superuser
+
     def has_object_permission(self, request, view, obj):
-        # Allow viewing (GET) if the user is the doctor, patient, or superuser]
-        print(obj)
-        if request.method in ['GET']:
+        if request.method in SAFE_METHODS:
             return (
-                request.user == obj.doctor or
-                request.user == obj.patient or
-                request.user.is_superuser
+                request.user.is_superuser or
+                request.user.pk in (obj.doctor_id, obj.patient_id)
             )
 
         # Only superusers can perform updates, deletes, or create actions
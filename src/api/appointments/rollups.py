@@ -0,0 +1,139 @@
+from collections import Counter
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from api.tasks.queue import enqueue
+
+
+def rollup_key(state):
+    """
+    Return the (date, doctor_id, is_completed) bucket of an appointment's tracked state,
+    or None if part of it is unknown.
+    """
+    scheduled_at = state.get('scheduled_at')
+    if scheduled_at is None or state.get('doctor_id') is None or state.get('is_completed') is None:
+        return None
+    if timezone.is_aware(scheduled_at):
+        # Same day boundaries as the __date lookup: the current time zone
+        scheduled_at = timezone.localtime(scheduled_at)
+    return (scheduled_at.date(), state['doctor_id'], state['is_completed'])
+
+
+def apply_rollup_deltas(deltas):
+    """
+    Add each delta to its (date, doctor_id, is_completed) bucket. Missing buckets are
+    created in one INSERT ... ON CONFLICT DO NOTHING, then the counts are moved with
+    appointment_count = appointment_count + delta, which is safe against concurrent
+    writers: one UPDATE per bucket for a single change, or a single CASE ... UPDATE per
+    batch when many buckets move at once (bulk creates, cascading deletes).
+    """
+    from api.users.models import User
+    from .models import DailyAppointmentStats
+
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    # A missing bucket for a removal means it went with its doctor (cascade)
+    added = {key for key, delta in deltas.items() if delta > 0}
+    if added:
+        # The doctor may have been deleted since the write was queued; their buckets
+        # went with them
+        doctor_ids = set(User.objects.filter(id__in={key[1] for key in added}).values_list('id', flat=True))
+        DailyAppointmentStats.objects.bulk_create(
+            [
+                DailyAppointmentStats(date=date, doctor_id=doctor_id, is_completed=is_completed)
+                for date, doctor_id, is_completed in added
+                if doctor_id in doctor_ids
+            ],
+            ignore_conflicts=True,
+        )
+
+    if len(deltas) <= 2:
+        for (date, doctor_id, is_completed), delta in deltas.items():
+            DailyAppointmentStats.objects.filter(
+                date=date, doctor_id=doctor_id, is_completed=is_completed
+            ).update(appointment_count=F('appointment_count') + delta)
+        return
+
+    bucket_ids = {
+        (date, doctor_id, is_completed): bucket_id
+        for bucket_id, date, doctor_id, is_completed in DailyAppointmentStats.objects.filter(
+            date__in={key[0] for key in deltas}, doctor_id__in={key[1] for key in deltas},
+        ).values_list('id', 'date', 'doctor_id', 'is_completed')
+    }
+    DailyAppointmentStats.objects.bulk_update(
+        [
+            DailyAppointmentStats(id=bucket_ids[key], appointment_count=F('appointment_count') + delta)
+            for key, delta in deltas.items()
+            if key in bucket_ids
+        ],
+        ['appointment_count'],
+        batch_size=500,
+    )
+
+
+def queue_rollup_deltas(deltas):
+    """
+    Queue the deltas for the task worker, as part of the surrounding transaction so a
+    committed change always reaches the rollup. The worker sums the deltas of many writes
+    before applying them, and takes the bucket row locks out of the writing requests.
+    """
+    deltas = [
+        [date.isoformat(), doctor_id, is_completed, delta]
+        for (date, doctor_id, is_completed), delta in deltas.items()
+        if delta
+    ]
+    if deltas:
+        enqueue('appointments.apply_rollup_deltas', {'deltas': deltas}, transactional=True)
+
+
+def record_appointment_change(previous_state, current_state):
+    """
+    Move one appointment from its previous bucket to its current one. Either state may be
+    None, for a created or deleted appointment.
+    """
+    deltas = Counter()
+    if previous_state is not None:
+        deltas[rollup_key(previous_state)] -= 1
+    if current_state is not None:
+        deltas[rollup_key(current_state)] += 1
+    deltas.pop(None, None)
+    queue_rollup_deltas(deltas)
+
+
+def record_appointments_created(appointments):
+    """
+    Add appointments that were inserted without signals (bulk_create) to the rollup.
+    """
+    deltas = Counter(rollup_key(appointment.tracked_state()) for appointment in appointments)
+    deltas.pop(None, None)
+    queue_rollup_deltas(deltas)
+
+
+def rebuild_daily_stats(appointment_model, stats_model):
+    """
+    Recompute the whole rollup from the appointment table. Takes the models as arguments
+    so data migrations can pass their historical versions.
+    """
+    rows = (
+        appointment_model.objects
+        .values('doctor_id', 'is_completed', date=TruncDate('scheduled_at'))
+        .annotate(appointment_count=Count('id'))
+        .order_by()
+    )
+    with transaction.atomic():
+        stats_model.objects.all().delete()
+        stats_model.objects.bulk_create(
+            (stats_model(**row) for row in rows.iterator()),
+            batch_size=1000,
+        )
+
+
+def daily_counts():
+    """
+    Return appointment counts grouped by date, read from the daily rollup.
+    """
+    from .models import DailyAppointmentStats
+
+    return DailyAppointmentStats.objects.filter(appointment_count__gt=0).values(
+        scheduled_date=F('date')
+    ).annotate(count=Sum('appointment_count')).order_by('scheduled_date')
@@ -1,12 +1,21 @@
+from datetime import timedelta
 from rest_framework import serializers
 from .models import Appointment
 from rest_framework.reverse import reverse
 from django.contrib.auth import get_user_model
 from django.db import transaction
-from django.core.cache import cache
+from api.outbox.feed import record_instances
+from api.outbox.models import Change
+from config.routers import use_primary
+from .cache import invalidate_appointment_lists
+from .rollups import record_appointments_created
+from .availability import load_timelines
 
 User = get_user_model()
 
+# Fields that move an appointment in a doctor's calendar
+SCHEDULING_FIELDS = {'doctor', 'scheduled_at', 'duration_minutes'}
+
 class UserSummarySerializer(serializers.ModelSerializer):
     """
     Serializer for displaying a summary of user details.
@@ -23,23 +32,10 @@ class AppointmentSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Appointment
-        fields = ['id', 'scheduled_at', 'is_completed', 'doctor', 'patient', 'doctor_id', 'patient_id']
-        read_only_fields = ('created_at', 'updated_at')
+        fields = ['id', 'scheduled_at', 'duration_minutes', 'ends_at', 'is_completed', 'doctor', 'patient', 'doctor_id', 'patient_id']
+        read_only_fields = ('created_at', 'updated_at', 'ends_at')
         extra_kwargs = {'scheduled_at': {'required': True}}
 
-    def validate_scheduled_at(self, value):
-        doctor_id = self.initial_data.get('doctor_id')
-
-        if doctor_id:
-            doctor = User.objects.filter(id=doctor_id).first()
-        else:
-            doctor = self.instance.doctor if self.instance else None
-
-        if doctor and Appointment.objects.filter(doctor=doctor, scheduled_at=value).exclude(id=self.instance.id if self.instance else None).exists():
-            raise serializers.ValidationError("Doctor already has an appointment at this time.")
-
-        return value
-
     def validate(self, data):
         # Only validate fields if creating a new instance
         if not self.instance:
@@ -49,19 +45,189 @@ class AppointmentSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError({"doctor_id": "This field is required."})
             if 'patient_id' not in self.initial_data:
                 raise serializers.ValidationError({"patient_id": "This field is required."})
+        self.validate_no_overlap(data)
         return data
 
+    def validate_no_overlap(self, data):
+        """
+        Reject the appointment if it overlaps another one of the same doctor.
+        """
+        if not SCHEDULING_FIELDS.intersection(data):
+            return
+        doctor = data.get('doctor')
+        doctor_id = doctor.id if doctor else getattr(self.instance, 'doctor_id', None)
+        scheduled_at = data.get('scheduled_at', getattr(self.instance, 'scheduled_at', None))
+        duration_minutes = data.get(
+            'duration_minutes', getattr(self.instance, 'duration_minutes', Appointment.DEFAULT_DURATION_MINUTES)
+        )
+        if not doctor_id or not scheduled_at:
+            return
+
+        conflicts = Appointment.objects.filter(doctor_id=doctor_id).overlapping(
+            scheduled_at, scheduled_at + timedelta(minutes=duration_minutes)
+        )
+        if self.instance:
+            conflicts = conflicts.exclude(id=self.instance.id)
+        # A lagging replica could miss the appointment that conflicts
+        with use_primary():
+            has_conflicts = conflicts.exists()
+        if has_conflicts:
+            raise serializers.ValidationError({"scheduled_at": "Doctor already has an appointment at this time."})
+
     @transaction.atomic
     def create(self, validated_data):
-        cache.delete_pattern('appointment:*')  # Clear the cache
+        # List caches are invalidated by the Appointment post_save signal
         return super().create(validated_data)
 
     @transaction.atomic
     def update(self, instance, validated_data):
-        cache.delete_pattern('appointment:*')  # Clear the cache
         return super().update(instance, validated_data)
 
     
+class AppointmentReadSerializer:
+    """
+    Read-only fast path producing exactly the output of AppointmentSerializer for list and
+    detail GETs. Rows are fetched with .values()/.only() on the columns below and turned
+    into dicts directly, skipping DRF's per-field machinery and the nested serializers.
+    """
+    values_fields = (
+        'id', 'scheduled_at', 'duration_minutes', 'ends_at', 'is_completed',
+        'doctor_id', 'doctor__first_name', 'doctor__last_name',
+        'patient_id', 'patient__first_name', 'patient__last_name',
+    )
+    only_fields = (
+        'id', 'scheduled_at', 'duration_minutes', 'ends_at', 'is_completed',
+        'doctor__id', 'doctor__first_name', 'doctor__last_name',
+        'patient__id', 'patient__first_name', 'patient__last_name',
+    )
+    # Same formatting (time zone, ISO 8601, trailing "Z") as the ModelSerializer field
+    datetime_field = serializers.DateTimeField()
+
+    @classmethod
+    def values(cls, queryset):
+        return queryset.values(*cls.values_fields)
+
+    @classmethod
+    def only(cls, queryset):
+        return queryset.select_related('doctor', 'patient').only(*cls.only_fields)
+
+    @classmethod
+    def from_row(cls, row):
+        to_representation = cls.datetime_field.to_representation
+        return {
+            'id': row['id'],
+            'scheduled_at': to_representation(row['scheduled_at']),
+            'duration_minutes': row['duration_minutes'],
+            'ends_at': to_representation(row['ends_at']),
+            'is_completed': row['is_completed'],
+            'doctor': {
+                'id': row['doctor_id'],
+                'first_name': row['doctor__first_name'],
+                'last_name': row['doctor__last_name'],
+            },
+            'patient': {
+                'id': row['patient_id'],
+                'first_name': row['patient__first_name'],
+                'last_name': row['patient__last_name'],
+            },
+        }
+
+    @classmethod
+    def from_rows(cls, rows):
+        return [cls.from_row(row) for row in rows]
+
+    @classmethod
+    def from_instance(cls, appointment):
+        doctor, patient = appointment.doctor, appointment.patient
+        return cls.from_row({
+            'id': appointment.id,
+            'scheduled_at': appointment.scheduled_at,
+            'duration_minutes': appointment.duration_minutes,
+            'ends_at': appointment.ends_at,
+            'is_completed': appointment.is_completed,
+            'doctor_id': doctor.id,
+            'doctor__first_name': doctor.first_name,
+            'doctor__last_name': doctor.last_name,
+            'patient_id': patient.id,
+            'patient__first_name': patient.first_name,
+            'patient__last_name': patient.last_name,
+        })
+
+
+class AppointmentRowSerializer(serializers.Serializer):
+    """
+    Serializer for one row of a bulk create. Only checks the shape of the row; references
+    and conflicts are checked for the whole batch at once by AppointmentBulkCreateSerializer.
+    """
+    doctor_id = serializers.IntegerField()
+    patient_id = serializers.IntegerField()
+    scheduled_at = serializers.DateTimeField()
+    duration_minutes = serializers.IntegerField(
+        default=Appointment.DEFAULT_DURATION_MINUTES,
+        min_value=1,
+        max_value=Appointment.MAX_DURATION // timedelta(minutes=1),
+    )
+    is_completed = serializers.BooleanField(default=False)
+
+
+class AppointmentBulkCreateSerializer(serializers.Serializer):
+    """
+    Serializer for creating many appointments in one transaction. Errors are reported per
+    row, as a list aligned with the submitted appointments. Overlaps with existing
+    appointments and between rows are found in one pass over per-doctor timelines.
+    """
+    MAX_ROWS = 1000
+
+    appointments = AppointmentRowSerializer(many=True, allow_empty=False, max_length=MAX_ROWS)
+
+    def validate_appointments(self, rows):
+        doctor_ids = {row['doctor_id'] for row in rows}
+        patient_ids = {row['patient_id'] for row in rows}
+        doctors = set(User.objects.filter(id__in=doctor_ids, role=User.DOCTOR).values_list('id', flat=True))
+        patients = set(User.objects.filter(id__in=patient_ids).values_list('id', flat=True))
+        for row in rows:
+            row['ends_at'] = row['scheduled_at'] + timedelta(minutes=row['duration_minutes'])
+        with use_primary():
+            timelines = load_timelines(
+                doctors, min(row['scheduled_at'] for row in rows), max(row['ends_at'] for row in rows)
+            )
+
+        errors = []
+        for index, row in enumerate(rows):
+            row_errors = {}
+            if row['doctor_id'] not in doctors:
+                row_errors['doctor_id'] = [f'Invalid pk "{row["doctor_id"]}" - object does not exist.']
+            if row['patient_id'] not in patients:
+                row_errors['patient_id'] = [f'Invalid pk "{row["patient_id"]}" - object does not exist.']
+            # Rows of this batch are added to the timeline as they pass, labelled "row <index>"
+            timeline = timelines[row['doctor_id']]
+            overlap = timeline.find_overlap(row['scheduled_at'], row['ends_at'])
+            if overlap is None:
+                timeline.add(row['scheduled_at'], row['ends_at'], f"row {index}")
+            elif isinstance(overlap[2], str):
+                row_errors['scheduled_at'] = [f"Doctor already has appointment {overlap[2]} of this batch at this time."]
+            else:
+                row_errors['scheduled_at'] = ["Doctor already has an appointment at this time."]
+            errors.append(row_errors)
+
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return rows
+
+    @transaction.atomic
+    def create(self, validated_data):
+        appointments = Appointment.objects.bulk_create(
+            [Appointment(**row) for row in validated_data['appointments']]
+        )
+        # bulk_create sends no signals, so maintain the derived data here
+        record_appointments_created(appointments)
+        record_instances(appointments, Change.CREATE)
+        invalidate_appointment_lists(*{
+            user_id for appointment in appointments for user_id in (appointment.doctor_id, appointment.patient_id)
+        })
+        return appointments
+
+
 class AppointmentReportSerializer(serializers.Serializer):
     """
     Serializer for appointment counts by date, including hyperlinks to filtered appointments.
@@ -94,3 +260,34 @@ class AppointmentReportSerializer(serializers.Serializer):
             'status': request.query_params.get('status', '')
         }
         return representation
+
+
+class AvailabilityQuerySerializer(serializers.Serializer):
+    """
+    Serializer for validating the query params of the free slot search.
+    """
+    MAX_DOCTORS = 50
+    MAX_DAYS = 31
+
+    doctor_ids = serializers.CharField()
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+
+    def validate_doctor_ids(self, value):
+        try:
+            doctor_ids = list(dict.fromkeys(int(doctor_id) for doctor_id in value.split(',') if doctor_id.strip()))
+        except ValueError:
+            raise serializers.ValidationError("Provide a comma separated list of doctor ids.")
+        if not doctor_ids:
+            raise serializers.ValidationError("Provide at least one doctor id.")
+        if len(doctor_ids) > self.MAX_DOCTORS:
+            raise serializers.ValidationError(f"At most {self.MAX_DOCTORS} doctors can be searched at once.")
+        return doctor_ids
+
+    def validate(self, data):
+        days = (data['end_date'] - data['start_date']).days
+        if days < 0:
+            raise serializers.ValidationError({"end_date": "End date must not be before start date."})
+        if days >= self.MAX_DAYS:
+            raise serializers.ValidationError({"end_date": f"The date range is limited to {self.MAX_DAYS} days."})
+        return data
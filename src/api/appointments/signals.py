@@ -0,0 +1,85 @@
+from collections import Counter
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from api.users.models import User
+from . import cascades
+from .models import Appointment
+from .cache import invalidate_appointment_lists, invalidate_all_appointment_lists
+from .rollups import queue_rollup_deltas, record_appointment_change, rollup_key
+
+# Name fields of a user that are embedded in appointment list rows.
+USER_SUMMARY_FIELDS = {'first_name', 'last_name'}
+
+
+@receiver(pre_save, sender=Appointment)
+def appointment_saving(sender, instance, **kwargs):
+    """
+    Make sure an updated appointment knows its previous state, even when it was not
+    loaded from the database or was loaded with deferred fields.
+    """
+    if instance._state.adding:
+        instance._loaded_state = None
+        return
+    loaded_state = getattr(instance, '_loaded_state', None)
+    if loaded_state is None or None in loaded_state.values():
+        instance._loaded_state = (
+            Appointment.objects.filter(pk=instance.pk).values(*Appointment.TRACKED_FIELDS).first()
+        )
+
+
+@receiver(post_save, sender=Appointment)
+def appointment_saved(sender, instance, created, **kwargs):
+    """
+    Update the daily rollup and invalidate the lists of the current (and, on update,
+    previous) doctor and patient.
+    """
+    previous_state = getattr(instance, '_loaded_state', None)
+    current_state = instance.tracked_state()
+    record_appointment_change(previous_state, current_state)
+
+    user_ids = {instance.doctor_id, instance.patient_id}
+    if previous_state is not None:
+        user_ids.update((previous_state['doctor_id'], previous_state['patient_id']))
+    invalidate_appointment_lists(*user_ids)
+    instance._loaded_state = current_state
+
+
+@receiver(post_delete, sender=Appointment)
+def appointment_deleted(sender, instance, origin=None, **kwargs):
+    state = getattr(instance, '_loaded_state', None) or instance.tracked_state()
+    if cascades.is_user_delete(origin):
+        # Batch the updates, so deleting a user costs the same number of queries however
+        # many appointments they had
+        deltas, user_ids = cascades.collected(origin, 'rollups', lambda: (Counter(), set()))
+        deltas[rollup_key(state)] -= 1
+        user_ids.update((instance.doctor_id, instance.patient_id))
+        return
+    record_appointment_change(state, None)
+    invalidate_appointment_lists(instance.doctor_id, instance.patient_id)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, origin=None, **kwargs):
+    """
+    Apply the batched updates of the appointments deleted with the user. Users are
+    deleted after the appointments that reference them, so all of those are collected.
+    """
+    cascaded = cascades.pop_collected(origin, 'rollups')
+    if cascaded is None:
+        return
+    deltas, user_ids = cascaded
+    deltas.pop(None, None)
+    queue_rollup_deltas(deltas)
+    invalidate_appointment_lists(*user_ids)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    """
+    A renamed user shows up in other principals' lists, so invalidate all of them.
+    """
+    if created:
+        return
+    if update_fields is not None and not USER_SUMMARY_FIELDS.intersection(update_fields):
+        return
+    invalidate_all_appointment_lists()
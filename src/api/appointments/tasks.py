@@ -0,0 +1,26 @@
+from collections import Counter
+from datetime import date
+from api.tasks.queue import task
+from .cache import bump_generations
+from .rollups import apply_rollup_deltas
+
+
+@task('appointments.bump_list_generations', dedupe=True)
+def bump_list_generations(payloads):
+    """
+    Invalidate the cached appointment lists of the queued scopes, whose bump after the
+    commit failed.
+    """
+    bump_generations(*(payload['scope'] for payload in payloads))
+
+
+@task('appointments.apply_rollup_deltas')
+def apply_queued_rollup_deltas(payloads):
+    """
+    Apply the queued rollup deltas, summed per bucket, in one batch.
+    """
+    deltas = Counter()
+    for payload in payloads:
+        for day, doctor_id, is_completed, delta in payload['deltas']:
+            deltas[(date.fromisoformat(day), doctor_id, is_completed)] += delta
+    apply_rollup_deltas(deltas)
@@ -1,15 +1,48 @@
 from rest_framework.test import APITestCase, APIClient
 from django.urls import reverse
-from api.appointments.models import Appointment
+from api.appointments.models import Appointment, DailyAppointmentStats, WorkingHours
+from api.appointments.serializer import AppointmentSerializer, AppointmentReadSerializer
+from rest_framework.renderers import JSONRenderer
+from api.appointments.availability import Timeline, free_slots
 from api.users.models import User
 from rest_framework import status
 from django.utils import timezone
-from django.db.models import Count
-from datetime import timedelta
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from io import StringIO
+import csv
+import tempfile
+import json
+from datetime import datetime, time, timedelta
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, connections, transaction
+from django.db.models.signals import post_delete
+from django.core.cache import cache
+from api.appointments.cache import cache_stats
+from api.appointments.views import (
+    AppointmentListView, AppointmentDetailView, AppointmentReportView, AppointmentBulkCreateView,
+)
+from config.query_budget import QueryBudgetTestMixin
+from config.metrics import MetricsMiddleware, registry as metrics_registry
+from django.http import HttpResponse
+from django.test import RequestFactory
+from unittest import mock
+from asgiref.sync import sync_to_async
+from rest_framework_simplejwt.tokens import AccessToken
+from config import routers
+import asyncio
+import functools
+from contextlib import suppress
+from api.appointments import events
+from api.appointments.rollups import apply_rollup_deltas
 
 class AppointmentListViewTests(APITestCase):
 
     def setUp(self):
+        cache.clear()
         # Set up users and appointments for testing
         self.superuser = User.objects.create_superuser('admin', 'admin@test.com', 'password')
         self.doctor = User.objects.create_user('doctor', 'doctor@test.com', 'password')
@@ -108,10 +141,27 @@ class AppointmentDetailViewTests(APITestCase):
         self.assertEqual(response.data['id'], self.appointment.id)
 
     def test_retrieve_appointment_as_non_owner(self):
+        # Other users' appointments are filtered out by the lookup itself
         self.client.force_authenticate(user=self.other_user)
         url = reverse('appointment-detail', kwargs={'id': self.appointment.id})
-        response = self.client.get(url)
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_retrieve_appointment_as_patient(self):
+        self.client.force_authenticate(user=self.patient)
+        url = reverse('appointment-detail', kwargs={'id': self.appointment.id})
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_write_as_non_superuser_fetches_nothing(self):
+        self.client.force_authenticate(user=self.other_user)
+        url = reverse('appointment-detail', kwargs={'id': self.appointment.id})
+        with self.assertNumQueries(0):
+            response = self.client.delete(url)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertTrue(Appointment.objects.filter(id=self.appointment.id).exists())
 
     def test_update_appointment_as_owner(self):
         self.client.force_authenticate(user=self.doctor)
@@ -164,6 +214,7 @@ class AppointmentDetailViewTests(APITestCase):
 class AppointmentReportViewTests(APITestCase):
 
     def setUp(self):
+        cache.clear()
         self.superuser = User.objects.create_superuser('admin', 'admin@test.com', 'password')
         self.doctor = User.objects.create_user('doctor', 'doctor@test.com', 'password')
         self.patient = User.objects.create_user('patient', 'patient@test.com', 'password')
@@ -209,10 +260,10 @@ class AppointmentReportViewTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
 
-
 class AppointmentCreateViewTests(APITestCase):
 
     def setUp(self):
+        cache.clear()
         self.doctor = User.objects.create_user('doctor', 'doctor@test.com', 'password')
         self.patient = User.objects.create_user('patient', 'patient@test.com', 'password')
         self.superuser = User.objects.create_superuser('admin', 'admin@test.com', 'password')
@@ -254,5 +305,1207 @@ class AppointmentCreateViewTests(APITestCase):
         }
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
-    
 
+
+class AppointmentListCacheTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.superuser = User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        self.doctor = User.objects.create_user('doctor', 'doctor@test.com', 'password', role=User.DOCTOR)
+        self.patient = User.objects.create_user('patient', 'patient@test.com', 'password', role=User.PATIENT)
+        self.other_patient = User.objects.create_user('other', 'other@test.com', 'password', role=User.PATIENT)
+        self.appointment = Appointment.objects.create(
+            doctor=self.doctor, patient=self.patient, scheduled_at=timezone.now()
+        )
+        self.client = APIClient()
+
+    def list_ids(self, user):
+        self.client.force_authenticate(user=user)
+        response = self.client.get(reverse('appointment-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [row['id'] for row in response.data['results']]
+
+    def test_cache_is_scoped_by_principal(self):
+        self.assertEqual(self.list_ids(self.patient), [self.appointment.id])
+        self.assertEqual(self.list_ids(self.other_patient), [])
+
+    def test_write_invalidates_affected_scopes(self):
+        self.assertEqual(len(self.list_ids(self.superuser)), 1)
+        self.assertEqual(len(self.list_ids(self.doctor)), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.create(
+                doctor=self.doctor, patient=self.other_patient, scheduled_at=timezone.now() + timedelta(hours=1)
+            )
+        self.assertEqual(len(self.list_ids(self.superuser)), 2)
+        self.assertEqual(len(self.list_ids(self.doctor)), 2)
+        self.assertEqual(len(self.list_ids(self.other_patient)), 1)
+
+    def test_page_links_follow_the_request_url(self):
+        Appointment.objects.create(doctor=self.doctor, patient=self.patient, scheduled_at=timezone.now() + timedelta(hours=1))
+        self.client.force_authenticate(user=self.patient)
+        url = reverse('appointment-list') + '?limit=1'
+        self.assertTrue(self.client.get(url).data['next'].startswith('http://'))
+        self.assertTrue(self.client.get(url, secure=True).data['next'].startswith('https://'))
+
+    @override_settings(TASKS_EAGER=False)
+    def test_write_is_listed_without_the_task_worker(self):
+        self.assertEqual(self.list_ids(self.patient), [self.appointment.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment = Appointment.objects.create(
+                doctor=self.doctor, patient=self.patient, scheduled_at=timezone.now() + timedelta(hours=1)
+            )
+        self.assertEqual(self.list_ids(self.patient), [self.appointment.id, appointment.id])
+
+    def test_unrelated_scope_stays_cached(self):
+        self.assertEqual(len(self.list_ids(self.patient)), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.create(
+                doctor=self.doctor, patient=self.other_patient, scheduled_at=timezone.now() + timedelta(hours=1)
+            )
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self.list_ids(self.patient)), 1)
+
+    def test_reassigning_patient_invalidates_previous_patient(self):
+        self.assertEqual(len(self.list_ids(self.patient)), 1)
+        appointment = Appointment.objects.get(id=self.appointment.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.patient = self.other_patient
+            appointment.save()
+        self.assertEqual(self.list_ids(self.patient), [])
+
+    def test_delete_invalidates_cache(self):
+        self.assertEqual(len(self.list_ids(self.doctor)), 1)
+        self.client.force_authenticate(user=self.superuser)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(reverse('appointment-detail', kwargs={'id': self.appointment.id}))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.list_ids(self.doctor), [])
+
+    def test_renaming_doctor_invalidates_all_lists(self):
+        self.list_ids(self.patient)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor.first_name = 'Gregory'
+            self.doctor.save()
+        self.client.force_authenticate(user=self.patient)
+        response = self.client.get(reverse('appointment-list'))
+        self.assertEqual(response.data['results'][0]['doctor']['first_name'], 'Gregory')
+
+    def test_filtered_queries_share_canonical_cache_entry(self):
+        self.doctor.first_name = 'Gregory'
+        self.doctor.save()
+        self.client.force_authenticate(user=self.superuser)
+        url = reverse('appointment-list')
+        today = self.appointment.scheduled_at.date().isoformat()
+        cache_stats.reset()
+        response = self.client.get(url, {'doctor_name': ' Gregory ', 'is_completed': 'False', 'date': today})
+        self.assertEqual(len(response.data['results']), 1)
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'date': today, 'is_completed': 'false', 'doctor_name': 'gregory'})
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(cache_stats.snapshot(), {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+
+    def test_filtered_cache_is_invalidated_by_writes(self):
+        self.client.force_authenticate(user=self.superuser)
+        url = reverse('appointment-list') + '?is_completed=true'
+        self.assertEqual(len(self.client.get(url).data['results']), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointment.is_completed = True
+            self.appointment.save()
+        self.assertEqual(len(self.client.get(url).data['results']), 1)
+
+    def test_invalid_filter_is_not_cached(self):
+        self.client.force_authenticate(user=self.superuser)
+        cache_stats.reset()
+        response = self.client.get(reverse('appointment-list') + '?date=not-a-date')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(cache_stats.snapshot()['misses'], 0)
+
+    def test_cache_stats_view(self):
+        self.client.force_authenticate(user=self.superuser)
+        response = self.client.get(reverse('appointment-cache-stats'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('hit_ratio', response.data)
+
+
+class AppointmentPaginationTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.superuser = User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        self.doctor = User.objects.create_user('doctor', 'doctor@test.com', 'password', role=User.DOCTOR)
+        self.patient = User.objects.create_user('patient', 'patient@test.com', 'password', role=User.PATIENT)
+        start = timezone.now()
+        self.appointments = [
+            Appointment.objects.create(doctor=self.doctor, patient=self.patient, scheduled_at=start + timedelta(hours=i))
+            for i in range(7)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.superuser)
+
+    def test_cursor_pagination_walks_all_pages_in_order(self):
+        url = reverse('appointment-list') + '?pagination=cursor'
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            ids.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(ids, [appointment.id for appointment in self.appointments])
+
+    def test_cursor_pagination_does_not_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('appointment-list') + '?pagination=cursor')
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries.captured_queries))
+
+    def test_offset_pagination_can_skip_count(self):
+        url = reverse('appointment-list') + '?count=false&limit=5'
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries.captured_queries))
+        self.assertNotIn('count', response.data)
+        self.assertEqual(len(response.data['results']), 5)
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNone(response.data['next'])
+
+    def test_offset_pagination_still_counts_by_default(self):
+        response = self.client.get(reverse('appointment-list'))
+        self.assertEqual(response.data['count'], 7)
+
+
+class DailyAppointmentStatsTests(APITestCase):
+
+    def setUp(self):
+        self.superuser = User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        self.doctor = User.objects.create_user('doctor', 'doctor@test.com', 'password', role=User.DOCTOR)
+        self.other_doctor = User.objects.create_user('doctor2', 'doctor2@test.com', 'password', role=User.DOCTOR)
+        self.patient = User.objects.create_user('patient', 'patient@test.com', 'password', role=User.PATIENT)
+        self.day = timezone.now().replace(hour=9, minute=0, second=0, microsecond=0)
+        self.client = APIClient()
+
+    def create_appointment(self, scheduled_at, doctor=None, **kwargs):
+        return Appointment.objects.create(
+            doctor=doctor or self.doctor, patient=self.patient, scheduled_at=scheduled_at, **kwargs
+        )
+
+    def rollup(self):
+        return {
+            (row.date, row.doctor_id, row.is_completed): row.appointment_count
+            for row in DailyAppointmentStats.objects.filter(appointment_count__gt=0)
+        }
+
+    def recomputed(self):
+        counts = Appointment.objects.values('doctor_id', 'is_completed', date=TruncDate('scheduled_at')).annotate(
+            count=Count('id')
+        )
+        return {(row['date'], row['doctor_id'], row['is_completed']): row['count'] for row in counts}
+
+    def test_rollup_follows_creates_updates_and_deletes(self):
+        first = self.create_appointment(self.day)
+        second = self.create_appointment(self.day + timedelta(hours=1))
+        self.create_appointment(self.day + timedelta(days=1), doctor=self.other_doctor)
+        self.assertEqual(self.rollup(), self.recomputed())
+
+        first.is_completed = True
+        first.save()
+        self.assertEqual(self.rollup(), self.recomputed())
+
+        moved = Appointment.objects.get(id=second.id)
+        moved.scheduled_at = self.day + timedelta(days=2)
+        moved.doctor = self.other_doctor
+        moved.save()
+        self.assertEqual(self.rollup(), self.recomputed())
+
+        Appointment.objects.get(id=first.id).delete()
+        self.assertEqual(self.rollup(), self.recomputed())
+
+    def test_rollup_survives_doctor_deletion(self):
+        self.create_appointment(self.day)
+        self.create_appointment(self.day, doctor=self.other_doctor)
+        self.doctor.delete()
+        self.assertEqual(self.rollup(), self.recomputed())
+
+    def test_failed_patient_deletion_leaves_nothing_behind(self):
+        other_patient = User.objects.create_user('patient2', 'patient2@test.com', 'password', role=User.PATIENT)
+        self.create_appointment(self.day)
+        Appointment.objects.create(doctor=self.doctor, patient=other_patient, scheduled_at=self.day + timedelta(hours=1))
+
+        def fail(**kwargs):
+            raise RuntimeError("delete failed")
+        post_delete.connect(fail, sender=Appointment)
+        try:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                self.patient.delete()
+        finally:
+            post_delete.disconnect(fail, sender=Appointment)
+        self.assertEqual(self.rollup(), self.recomputed())
+
+        # Retrying the delete counts each appointment once
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patient.delete()
+        self.assertEqual(self.rollup(), self.recomputed())
+
+    def test_rollup_skips_deleted_doctors(self):
+        # A delta queued for a doctor deleted before the worker applied it
+        doctor_id = self.doctor.id
+        self.doctor.delete()
+        apply_rollup_deltas({(self.day.date(), doctor_id, False): 1})
+        self.assertFalse(DailyAppointmentStats.objects.filter(doctor_id=doctor_id).exists())
+
+    def test_rebuild_command_matches_incremental_rollup(self):
+        self.create_appointment(self.day, is_completed=True)
+        self.create_appointment(self.day + timedelta(hours=2))
+        incremental = self.rollup()
+        call_command('rebuild_appointment_stats', stdout=StringIO())
+        self.assertEqual(self.rollup(), incremental)
+
+    def test_report_reads_from_rollup(self):
+        self.create_appointment(self.day)
+        self.create_appointment(self.day + timedelta(hours=1), is_completed=True)
+        self.create_appointment(self.day + timedelta(days=1), doctor=self.other_doctor)
+        self.client.force_authenticate(user=self.superuser)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('appointment-report'))
+        self.assertFalse(any('appointments_appointment' in query['sql'] for query in queries.captured_queries))
+        counts = [(row['date'], row['count']) for row in response.data['results']]
+        self.assertEqual(counts, [(str(self.day.date()), 2), (str(self.day.date() + timedelta(days=1)), 1)])
+
+    def test_report_filters_map_onto_rollup(self):
+        self.create_appointment(self.day)
+        self.create_appointment(self.day + timedelta(hours=1), is_completed=True)
+        self.create_appointment(self.day + timedelta(days=1))
+        self.client.force_authenticate(user=self.superuser)
+        day = self.day.date().isoformat()
+        response = self.client.get(reverse('appointment-report'), {'start_date': day, 'end_date': day, 'is_completed': 'false'})
+        self.assertEqual([row['count'] for row in response.data['results']], [1])
+
+
+class AppointmentAvailabilityTests(APITestCase):
+
+    def setUp(self):
+        self.doctor = User.objects.create_user('doctor', 'doctor@test.com', 'password', role=User.DOCTOR)
+        self.other_doctor = User.objects.create_user('doctor2', 'doctor2@test.com', 'password', role=User.DOCTOR)
+        self.patient = User.objects.create_user('patient', 'patient@test.com', 'password', role=User.PATIENT)
+        self.day = timezone.localdate() + timedelta(days=7)
+        for doctor in (self.doctor, self.other_doctor):
+            WorkingHours.objects.create(
+                doctor=doctor, weekday=self.day.weekday(), start_time=time(9), end_time=time(11), slot_minutes=30
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.patient)
+
+    def at(self, hour, minute=0):
+        return timezone.make_aware(datetime.combine(self.day, time(hour, minute)))
+
+    def test_free_slots_skip_booked_times(self):
+        Appointment.objects.create(doctor=self.doctor, patient=self.patient, scheduled_at=self.at(9, 30))
+        Appointment.objects.create(doctor=self.doctor, patient=self.patient, scheduled_at=self.at(10, 10))
+        slots = free_slots([self.doctor.id, self.other_doctor.id], self.day, self.day)
+        # 10:10 lasts the default 30 minutes, into the 10:30 slot
+        self.assertEqual(slots[self.doctor.id], [(self.at(9), self.at(9, 30))])
+        self.assertEqual(len(slots[self.other_doctor.id]), 4)
+
+    def test_query_count_does_not_grow_with_doctors_or_days(self):
+        with self.assertNumQueries(2):
+            free_slots([self.doctor.id, self.other_doctor.id], self.day, self.day + timedelta(days=13))
+
+    def test_past_slots_are_not_offered(self):
+        now = self.at(10)
+        slots = free_slots([self.doctor.id], self.day, self.day, now=now)
+        self.assertEqual(slots[self.doctor.id], [(self.at(10), self.at(10, 30)), (self.at(10, 30), self.at(11))])
+
+    def test_availability_view(self):
+        url = reverse('appointment-availability')
+        response = self.client.get(url, {
+            'doctor_ids': f'{self.doctor.id},{self.other_doctor.id}',
+            'start_date': self.day.isoformat(),
+            'end_date': self.day.isoformat(),
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['doctor_id'] for row in response.data['results']], [self.doctor.id, self.other_doctor.id])
+        self.assertEqual(response.data['results'][0]['slots'][0]['start'], self.at(9).isoformat().replace('+00:00', 'Z'))
+
+    def test_availability_view_rejects_long_ranges(self):
+        response = self.client.get(reverse('appointment-availability'), {
+            'doctor_ids': str(self.doctor.id),
+            'start_date': self.day.isoformat(),
+            'end_date': (self.day + timedelta(days=60)).isoformat(),
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AppointmentBulkCreateViewTests(APITestCase):
+
+    def setUp(self):
+        self.superuser = User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        self.doctors = [
+            User.objects.create_user(f'doctor{i}', f'doctor{i}@test.com', 'password', role=User.DOCTOR) for i in range(3)
+        ]
+        self.patient = User.objects.create_user('patient', 'patient@test.com', 'password', role=User.PATIENT)
+        self.start = timezone.now().replace(hour=8, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        self.url = reverse('appointment-bulk-create')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.superuser)
+
+    def row(self, doctor, hours):
+        return {
+            'doctor_id': doctor.id,
+            'patient_id': self.patient.id,
+            'scheduled_at': (self.start + timedelta(hours=hours)).isoformat(),
+        }
+
+    def test_bulk_create_uses_constant_queries(self):
+        rows = [self.row(doctor, hours) for doctor in self.doctors for hours in range(10)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {'appointments': rows}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 30)
+        self.assertEqual(Appointment.objects.count(), 30)
+        # savepoint, doctors, patients, conflicts, insert, existing doctors, rollup buckets,
+        # bucket ids, one CASE update for every doctor-day bucket, change records, release
+        self.assertEqual(len(queries), 11)
+        self.assertEqual(sum(DailyAppointmentStats.objects.values_list('appointment_count', flat=True)), 30)
+
+    def test_bulk_create_reports_errors_per_row(self):
+        Appointment.objects.create(doctor=self.doctors[0], patient=self.patient, scheduled_at=self.start)
+        rows = [
+            self.row(self.doctors[1], 0),
+            self.row(self.doctors[0], 0),  # booked in the database
+            self.row(self.doctors[1], 0),  # conflicts with the first row
+            {'doctor_id': self.patient.id, 'patient_id': self.patient.id, 'scheduled_at': self.start.isoformat()},
+        ]
+        response = self.client.post(self.url, {'appointments': rows}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = response.data['appointments']
+        self.assertEqual(errors[0], {})
+        self.assertIn('scheduled_at', errors[1])
+        self.assertIn('scheduled_at', errors[2])
+        self.assertIn('doctor_id', errors[3])
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_bulk_create_requires_admin(self):
+        self.client.force_authenticate(user=self.patient)
+        response = self.client.post(self.url, {'appointments': [self.row(self.doctors[0], 0)]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class AppointmentOverlapTests(APITestCase):
+
+    def setUp(self):
+        self.superuser = User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        self.doctor = User.objects.create_user('doctor', 'doctor@test.com', 'password', role=User.DOCTOR)
+        self.patient = User.objects.create_user('patient', 'patient@test.com', 'password', role=User.PATIENT)
+        self.start = timezone.now().replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        self.appointment = Appointment.objects.create(
+            doctor=self.doctor, patient=self.patient, scheduled_at=self.start, duration_minutes=60
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.superuser)
+
+    def create(self, scheduled_at, duration_minutes=30):
+        return self.client.post(reverse('appointment-create'), {
+            'doctor_id': self.doctor.id,
+            'patient_id': self.patient.id,
+            'scheduled_at': scheduled_at,
+            'duration_minutes': duration_minutes,
+        })
+
+    def test_ends_at_follows_duration(self):
+        self.assertEqual(self.appointment.ends_at, self.start + timedelta(hours=1))
+        self.appointment.duration_minutes = 45
+        self.appointment.save(update_fields=['duration_minutes'])
+        self.appointment.refresh_from_db()
+        self.assertEqual(self.appointment.ends_at, self.start + timedelta(minutes=45))
+
+    def test_overlapping_appointment_is_rejected(self):
+        response = self.create(self.start + timedelta(minutes=30))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('scheduled_at', response.data)
+        response = self.create(self.start - timedelta(minutes=45), duration_minutes=60)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_adjacent_appointment_is_accepted(self):
+        response = self.create(self.start + timedelta(hours=1))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['ends_at'], (self.start + timedelta(hours=1, minutes=30)).isoformat().replace('+00:00', 'Z'))
+
+    def test_extending_an_appointment_into_the_next_is_rejected(self):
+        Appointment.objects.create(doctor=self.doctor, patient=self.patient, scheduled_at=self.start + timedelta(hours=1))
+        url = reverse('appointment-detail', kwargs={'id': self.appointment.id})
+        response = self.client.patch(url, {'duration_minutes': 90})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(url, {'is_completed': True})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_overlap_lookup_is_bounded_by_max_duration(self):
+        sql = str(Appointment.objects.filter(doctor=self.doctor).overlapping(self.start, self.start + timedelta(hours=1)).query)
+        self.assertIn('"scheduled_at" >', sql)
+        self.assertIn('"scheduled_at" <', sql)
+
+    def test_timeline_finds_overlaps(self):
+        timeline = Timeline([(self.start, self.start + timedelta(hours=1), 1)])
+        self.assertIsNotNone(timeline.find_overlap(self.start + timedelta(minutes=59), self.start + timedelta(hours=2)))
+        self.assertIsNone(timeline.find_overlap(self.start + timedelta(hours=1), self.start + timedelta(hours=2)))
+        timeline.add(self.start - timedelta(hours=3), self.start - timedelta(hours=2), 'row 0')
+        self.assertEqual(timeline.find_overlap(self.start - timedelta(hours=2, minutes=30), self.start)[2], 'row 0')
+
+    def test_bulk_create_detects_overlaps(self):
+        rows = [
+            {'doctor_id': self.doctor.id, 'patient_id': self.patient.id, 'scheduled_at': self.start + timedelta(minutes=15)},
+            {'doctor_id': self.doctor.id, 'patient_id': self.patient.id, 'scheduled_at': self.start + timedelta(hours=2), 'duration_minutes': 60},
+            {'doctor_id': self.doctor.id, 'patient_id': self.patient.id, 'scheduled_at': self.start + timedelta(hours=2, minutes=30)},
+        ]
+        response = self.client.post(reverse('appointment-bulk-create'), {'appointments': rows}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = response.data['appointments']
+        self.assertIn('scheduled_at', errors[0])
+        self.assertEqual(errors[1], {})
+        self.assertIn('row 1', errors[2]['scheduled_at'][0])
+
+
+class AppointmentDoctorNameFilterTests(APITestCase):
+
+    def setUp(self):
+        self.superuser = User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        self.house = User.objects.create_user('house', 'house@test.com', 'password', role=User.DOCTOR, first_name='Gregory', last_name='House')
+        self.wilson = User.objects.create_user('wilson', 'wilson@test.com', 'password', role=User.DOCTOR, first_name='James', last_name='Wilson')
+        self.patient = User.objects.create_user('patient', 'patient@test.com', 'password', role=User.PATIENT, first_name='Houston')
+        now = timezone.now()
+        Appointment.objects.create(doctor=self.house, patient=self.patient, scheduled_at=now)
+        Appointment.objects.create(doctor=self.wilson, patient=self.patient, scheduled_at=now)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.superuser)
+
+    def test_list_filters_by_doctor_name_prefix(self):
+        response = self.client.get(reverse('appointment-list'), {'doctor_name': 'hou'})
+        self.assertEqual([row['doctor']['id'] for row in response.data['results']], [self.house.id])
+
+    def test_doctor_name_filter_does_not_join_users(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('appointment-report'), {'doctor_name': 'wil'})
+        self.assertFalse(any('LIKE' in query['sql'] for query in queries.captured_queries))
+        response = self.client.get(reverse('appointment-report'), {'doctor_name': 'wil'})
+        self.assertEqual(response.data['results'][0]['count'], 1)
+
+
+class AppointmentExportViewTests(APITestCase):
+
+    def setUp(self):
+        self.superuser = User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        self.doctor = User.objects.create_user('doctor', 'doctor@test.com', 'password', role=User.DOCTOR, first_name='Gregory')
+        self.patient = User.objects.create_user('patient', 'patient@test.com', 'password', role=User.PATIENT)
+        start = timezone.now().replace(microsecond=0)
+        self.appointments = [
+            Appointment.objects.create(
+                doctor=self.doctor, patient=self.patient, scheduled_at=start + timedelta(hours=i), is_completed=i % 2 == 0
+            )
+            for i in range(3)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.superuser)
+
+    def test_export_csv(self):
+        response = self.client.get(reverse('appointment-export'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([int(row['id']) for row in rows], [appointment.id for appointment in self.appointments])
+        self.assertEqual(rows[0]['doctor_first_name'], 'Gregory')
+
+    def test_export_ndjson_applies_filters(self):
+        response = self.client.get(reverse('appointment-export'), {'output': 'ndjson', 'is_completed': 'true'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows], [self.appointments[0].id, self.appointments[2].id])
+        detail = AppointmentSerializer(self.appointments[0]).data
+        self.assertEqual(rows[0]['scheduled_at'], detail['scheduled_at'])
+
+    def test_export_rejects_unknown_output(self):
+        response = self.client.get(reverse('appointment-export'), {'output': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_requires_admin(self):
+        self.client.force_authenticate(user=self.doctor)
+        response = self.client.get(reverse('appointment-export'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class AppointmentReadSerializerTests(APITestCase):
+
+    def setUp(self):
+        self.superuser = User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        self.doctor = User.objects.create_user('doctor', 'doctor@test.com', 'password', role=User.DOCTOR, first_name='Gregory', last_name='House')
+        self.patient = User.objects.create_user('patient', 'patient@test.com', 'password', role=User.PATIENT, first_name='Ünïcode')
+        start = timezone.now()
+        for i in range(3):
+            Appointment.objects.create(
+                doctor=self.doctor, patient=self.patient, scheduled_at=start + timedelta(days=i, microseconds=i),
+                duration_minutes=15 * (i + 1), is_completed=i == 1,
+            )
+        self.renderer = JSONRenderer()
+
+    def test_fast_path_output_is_byte_identical(self):
+        queryset = Appointment.objects.order_by('id')
+        expected = self.renderer.render(AppointmentSerializer(queryset.select_related('doctor', 'patient'), many=True).data)
+        self.assertEqual(self.renderer.render(AppointmentReadSerializer.from_rows(AppointmentReadSerializer.values(queryset))), expected)
+        instances = [AppointmentReadSerializer.from_instance(appointment) for appointment in AppointmentReadSerializer.only(queryset)]
+        self.assertEqual(self.renderer.render(instances), expected)
+
+    def test_list_and_detail_use_fast_path(self):
+        self.client.force_authenticate(user=self.superuser)
+        appointment = Appointment.objects.first()
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('appointment-detail', kwargs={'id': appointment.id}))
+        self.assertEqual(response.data, AppointmentSerializer(appointment).data)
+        cache.clear()
+        response = self.client.get(reverse('appointment-list'))
+        self.assertEqual(response.data['results'][0], AppointmentSerializer(appointment).data)
+
+    def test_benchmark_command_checks_output(self):
+        out = StringIO()
+        call_command('benchmark_appointment_serializers', sizes=[5], repeat=1, stdout=out)
+        self.assertIn('page size', out.getvalue())
+
+
+class QueryPlanTests(APITestCase):
+    """
+    Runs the SQL each hot endpoint generates through EXPLAIN on a seeded dataset and
+    fails if any of it reads a hot table with a full scan instead of an index.
+    """
+    HOT_TABLES = {
+        Appointment._meta.db_table,
+        DailyAppointmentStats._meta.db_table,
+        User._meta.db_table,
+        'users_namesearchtoken',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.superuser = User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        cls.doctors = [
+            User.objects.create(username=f'doctor{i}', role=User.DOCTOR, first_name=f'Doc{i}', last_name='Smith')
+            for i in range(40)
+        ]
+        cls.patients = User.objects.bulk_create(
+            User(username=f'patient{i}', role=User.PATIENT) for i in range(200)
+        )
+        start = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(days=100)
+        appointments = []
+        for i in range(5000):
+            appointment = Appointment(
+                doctor=cls.doctors[i % 40],
+                patient=cls.patients[i % 200],
+                scheduled_at=start + timedelta(hours=i // 40),
+                is_completed=i % 3 == 0,
+            )
+            appointment.compute_ends_at()
+            appointments.append(appointment)
+        Appointment.objects.bulk_create(appointments)
+        call_command('rebuild_appointment_stats', stdout=StringIO())
+        cls.day = (start + timedelta(days=50)).date()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        cache.clear()
+
+    def explain(self, sql, params):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                return [row[-1] for row in cursor.fetchall()]
+            cursor.execute(f'EXPLAIN {sql}', params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def full_scans(self, plan):
+        scans = []
+        for line in plan:
+            if connection.vendor == 'sqlite':
+                words = line.split()
+                # "SCAN t USING [COVERING] INDEX ..." walks an index, a bare "SCAN t" the table
+                if words[:1] == ['SCAN'] and len(words) == 2 and words[1] in self.HOT_TABLES:
+                    scans.append(line)
+            elif 'Seq Scan on' in line and line.split('Seq Scan on')[1].split()[0] in self.HOT_TABLES:
+                scans.append(line)
+        return scans
+
+    def assertNoFullScans(self, user, url):
+        self.client.force_authenticate(user=user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, url)
+        for query in context.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT'):
+                continue
+            with self.subTest(url=url, sql=sql):
+                # Captured queries have their parameters interpolated already
+                self.assertEqual(self.full_scans(self.explain(sql, None)), [])
+
+    def test_admin_lists(self):
+        list_url = reverse('appointment-list')
+        for query in ('', f'?date={self.day}', '?is_completed=true', '?doctor_name=doc1',
+                      '?pagination=cursor', '?count=false&offset=2000'):
+            self.assertNoFullScans(self.superuser, list_url + query)
+
+    def test_own_lists(self):
+        list_url = reverse('appointment-list')
+        for user in (self.doctors[0], self.patients[0]):
+            for query in ('', f'?date={self.day}', '?is_completed=false', '?pagination=cursor'):
+                self.assertNoFullScans(user, list_url + query)
+
+    def test_detail(self):
+        appointment = Appointment.objects.filter(patient=self.patients[0]).first()
+        url = reverse('appointment-detail', kwargs={'id': appointment.id})
+        self.assertNoFullScans(self.patients[0], url)
+        self.assertNoFullScans(self.superuser, url)
+
+    def test_report(self):
+        url = reverse('appointment-report')
+        self.assertNoFullScans(self.superuser, f'{url}?start_date={self.day}&end_date={self.day + timedelta(days=7)}')
+        self.assertNoFullScans(self.superuser, f'{url}?doctor_name=doc1')
+
+    def test_availability(self):
+        WorkingHours.objects.create(doctor=self.doctors[0], weekday=self.day.weekday(), start_time=time(9), end_time=time(17))
+        url = reverse('appointment-availability')
+        self.assertNoFullScans(self.superuser, f'{url}?doctor_ids={self.doctors[0].id}&start_date={self.day}&end_date={self.day}')
+
+
+class SeedAndBenchmarkCommandTests(APITestCase):
+
+    def seed(self, **options):
+        call_command('seed_hms', doctors=3, patients=10, appointments=60, days=14, start_date=datetime(2024, 1, 1).date(),
+                     stdout=StringIO(), **options)
+
+    def test_seed_is_deterministic(self):
+        self.seed(seed=7)
+        first = list(Appointment.objects.order_by('doctor__username', 'scheduled_at')
+                     .values_list('doctor__username', 'patient__username', 'scheduled_at', 'is_completed'))
+        self.seed(seed=7, clear=True)
+        second = list(Appointment.objects.order_by('doctor__username', 'scheduled_at')
+                      .values_list('doctor__username', 'patient__username', 'scheduled_at', 'is_completed'))
+        self.assertEqual(len(first), 60)
+        self.assertEqual(first, second)
+        self.assertEqual(User.objects.filter(role=User.DOCTOR).count(), 3)
+        self.assertEqual(WorkingHours.objects.count(), 15)
+        total = DailyAppointmentStats.objects.aggregate(total=Sum('appointment_count'))['total']
+        self.assertEqual(total, 60)
+
+    def test_seed_rejects_more_appointments_than_slots(self):
+        with self.assertRaises(CommandError):
+            call_command('seed_hms', doctors=1, patients=1, appointments=1000, days=7, stdout=StringIO())
+
+    def test_benchmark_writes_results(self):
+        self.seed()
+        User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        with tempfile.TemporaryDirectory() as directory:
+            output = f'{directory}/benchmark.json'
+            call_command('benchmark_hms_api', requests=40, warmup=0, host='testserver', output=output, stdout=StringIO())
+            with open(output) as results_file:
+                results = json.load(results_file)
+
+        self.assertEqual(results['meta']['requests'], 40)
+        self.assertEqual(sum(summary['requests'] for summary in results['endpoints'].values()), 40)
+        for summary in results['endpoints'].values():
+            self.assertEqual(summary['errors'], 0)
+            self.assertLessEqual(summary['latency_ms']['p50'], summary['latency_ms']['p99'])
+
+
+class AsyncBenchmarkCommandTests(TransactionTestCase):
+    """
+    A TransactionTestCase, because the benchmark's client threads use their own database
+    connections and must see the committed seed data.
+    """
+
+    def test_benchmark_compares_both_paths(self):
+        call_command('seed_hms', doctors=2, patients=5, appointments=20, days=7, start_date=datetime(2024, 1, 1).date(),
+                     stdout=StringIO())
+        User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        with tempfile.TemporaryDirectory() as directory:
+            output = f'{directory}/benchmark.json'
+            call_command('benchmark_async_appointments', requests=6, concurrency=3, wsgi_threads=2, db_delay_ms=1,
+                         output=output, stdout=StringIO())
+            with open(output) as results_file:
+                results = json.load(results_file)
+
+        self.assertEqual(results['options']['concurrency'], 3)
+        self.assertEqual(set(results['endpoints']), {
+            'list:wsgi', 'list:asgi', 'detail:wsgi', 'detail:asgi', 'report:wsgi', 'report:asgi',
+        })
+        for summary in results['endpoints'].values():
+            self.assertEqual(summary['requests'], 6)
+            self.assertEqual(summary['errors'], 0)
+
+
+class AppointmentQueryBudgetTests(QueryBudgetTestMixin, APITestCase):
+
+    def setUp(self):
+        self.superuser = User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        self.doctor = User.objects.create_user('doctor', 'doctor@test.com', 'password', role=User.DOCTOR, first_name='Ann')
+        self.patient = User.objects.create_user('patient', 'patient@test.com', 'password')
+        start = timezone.now() + timedelta(days=1)
+        for i in range(60):
+            Appointment.objects.create(doctor=self.doctor, patient=self.patient, scheduled_at=start + timedelta(days=i))
+        self.appointment = Appointment.objects.first()
+        self.client.force_authenticate(user=self.superuser)
+
+    def test_lists_stay_within_budget_at_any_page_size(self):
+        for user in (self.superuser, self.patient):
+            self.client.force_authenticate(user=user)
+            for query in ('?limit=1', '?limit=60', '?limit=60&doctor_name=ann', '?pagination=cursor&limit=60'):
+                cache.clear()
+                response = self.assertWithinQueryBudget(AppointmentListView, 'GET', reverse('appointment-list') + query)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_detail_stays_within_budget(self):
+        url = reverse('appointment-detail', kwargs={'id': self.appointment.id})
+        self.assertWithinQueryBudget(AppointmentDetailView, 'GET', url)
+        self.assertWithinQueryBudget(AppointmentDetailView, 'PATCH', url, {'is_completed': True})
+        response = self.assertWithinQueryBudget(
+            AppointmentDetailView, 'PATCH', url, {'scheduled_at': (timezone.now() - timedelta(days=3)).isoformat()}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertWithinQueryBudget(AppointmentDetailView, 'DELETE', url)
+
+    def test_report_stays_within_budget(self):
+        self.assertWithinQueryBudget(AppointmentReportView, 'GET', reverse('appointment-report') + '?limit=1')
+        self.assertWithinQueryBudget(AppointmentReportView, 'GET', reverse('appointment-report') + '?limit=100')
+
+    def test_bulk_create_stays_within_budget_at_any_size(self):
+        start = timezone.now() + timedelta(days=100)
+        for size in (1, 50):
+            rows = [
+                {'doctor_id': self.doctor.id, 'patient_id': self.patient.id,
+                 'scheduled_at': (start + timedelta(days=size + i)).isoformat()}
+                for i in range(size)
+            ]
+            response = self.assertWithinQueryBudget(
+                AppointmentBulkCreateView, 'POST', reverse('appointment-bulk-create'), {'appointments': rows}, format='json'
+            )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_cascading_user_delete_does_not_scale_with_appointments(self):
+        with CaptureQueriesContext(connection) as context:
+            self.patient.delete()
+        self.assertLess(len(context), 20)
+        self.assertFalse(DailyAppointmentStats.objects.filter(appointment_count__gt=0).exists())
+
+    def test_middleware_logs_requests_over_budget(self):
+        url = reverse('appointment-detail', kwargs={'id': self.appointment.id})
+        with self.assertNoLogs('query_budget'):
+            self.client.get(url)
+        with mock.patch.object(AppointmentDetailView, 'query_budget', {'GET': 0}), \
+                override_settings(QUERY_BUDGET_AUTHENTICATION_QUERIES=0), self.assertLogs('query_budget') as logs:
+            self.client.get(url)
+        self.assertIn('AppointmentDetailView', logs.output[0])
+
+
+class RequestMetricsTests(APITestCase):
+
+    def setUp(self):
+        metrics_registry.reset()
+        self.superuser = User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        self.doctor = User.objects.create_user('doctor', 'doctor@test.com', 'password', role=User.DOCTOR)
+        Appointment.objects.create(doctor=self.doctor, patient=self.superuser, scheduled_at=timezone.now())
+        self.client.force_authenticate(user=self.superuser)
+
+    def test_requests_are_exported_per_view(self):
+        self.client.get(reverse('appointment-list'))
+        self.client.get(reverse('appointment-list'))
+        self.client.get(reverse('appointment-report'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+
+        self.assertIn('hms_requests_total{view="appointment-list",method="GET",status="200"} 2', body)
+        self.assertIn('hms_request_duration_seconds_count{view="appointment-report"} 1', body)
+        self.assertIn('hms_request_queries_bucket{view="appointment-list",le="+Inf"} 2', body)
+        # The second list request was served from the cache without touching the database
+        self.assertIn('hms_request_queries_bucket{view="appointment-list",le="0"} 1', body)
+        self.assertIn('hms_cache_requests_total{view="appointment-list",result="hit"} 1', body)
+        self.assertIn('hms_cache_requests_total{view="appointment-list",result="miss"} 1', body)
+        self.assertIn('hms_response_size_bytes_count{view="appointment-list"} 2', body)
+
+    def test_unknown_methods_share_one_series(self):
+        for method in ('FOO', 'BAR1'):
+            self.client.generic(method, reverse('appointment-list'))
+            self.client.generic(method, '/no-such-page/')
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('hms_requests_total{view="appointment-list",method="other",status="405"} 2', body)
+        self.assertIn('hms_requests_total{view="unmatched",method="other",status="404"} 2', body)
+        self.assertNotIn('FOO', body)
+
+    def test_metrics_are_restricted_by_address(self):
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_middleware_only_wraps_the_request(self):
+        wrappers = []
+
+        def get_response(request):
+            wrappers.append({alias: len(connections[alias].execute_wrappers) for alias in connections})
+            return HttpResponse(b'{}')
+
+        middleware = MetricsMiddleware(get_response)
+        with self.assertNumQueries(0):
+            middleware(RequestFactory().get('/'))
+        # One wrapper per connection while the response is produced, none left after
+        self.assertEqual(wrappers, [dict.fromkeys(connections, 1)])
+        self.assertFalse(any(connections[alias].execute_wrappers for alias in connections))
+
+class AsyncAppointmentViewTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.superuser = User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        self.doctor = User.objects.create_user('doctor', 'doctor@test.com', 'password', role=User.DOCTOR, first_name='Ann')
+        self.patient = User.objects.create_user('patient', 'patient@test.com', 'password')
+        self.other_user = User.objects.create_user('other', 'other@test.com', 'password')
+        start = timezone.now()
+        self.appointments = [
+            Appointment.objects.create(doctor=self.doctor, patient=self.patient, scheduled_at=start + timedelta(days=i))
+            for i in range(7)
+        ]
+
+    def sync_json(self, user, url):
+        self.client.force_authenticate(user=user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def bearer(self, user):
+        return {'AUTHORIZATION': f'Bearer {AccessToken.for_user(user)}'}
+
+    def delete_appointment(self, appointment):
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.delete()
+
+    async def test_list_matches_sync_list(self):
+        for user in (self.superuser, self.patient):
+            for query in ('', '?offset=5', '?is_completed=false&doctor_name=ann', '?count=false&limit=2'):
+                expected = await sync_to_async(self.sync_json)(user, reverse('appointment-list') + query)
+                response = await self.async_client.get(reverse('appointment-async-list') + query, headers=self.bearer(user))
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                data = response.json()
+                self.assertEqual(data['results'], expected['results'])
+                self.assertEqual(data.get('count'), expected.get('count'))
+                self.assertEqual(data['next'] is None, expected['next'] is None)
+
+    async def test_list_is_cached(self):
+        url = reverse('appointment-async-list')
+        cache_stats.reset()
+        await self.async_client.get(url, headers=self.bearer(self.superuser))
+        response = await self.async_client.get(url, headers=self.bearer(self.superuser))
+        self.assertEqual(response.json()['count'], 7)
+        self.assertEqual(cache_stats.snapshot()['hits'], 1)
+
+        # Writes bump the generations the async entries are keyed on too
+        await sync_to_async(self.delete_appointment)(self.appointments[0])
+        response = await self.async_client.get(url, headers=self.bearer(self.superuser))
+        self.assertEqual(response.json()['count'], 6)
+
+    async def test_unfingerprinted_queries_are_not_cached(self):
+        other_doctor = await User.objects.acreate(username='bob', email='bob@test.com', role=User.DOCTOR, first_name='Bob')
+        await Appointment.objects.acreate(doctor=other_doctor, patient=self.patient, scheduled_at=timezone.now() - timedelta(days=1))
+        url = reverse('appointment-async-list')
+        for name, count in (('ann', 7), ('bob', 1)):
+            response = await self.async_client.get(f'{url}?limit=abc&doctor_name={name}', headers=self.bearer(self.superuser))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.json()['count'], count)
+
+    async def test_detail(self):
+        appointment = self.appointments[0]
+        expected = await sync_to_async(self.sync_json)(self.patient, reverse('appointment-detail', kwargs={'id': appointment.id}))
+        url = reverse('appointment-async-detail', kwargs={'id': appointment.id})
+        response = await self.async_client.get(url, headers=self.bearer(self.patient))
+        self.assertEqual(response.json(), expected)
+        response = await self.async_client.get(url, headers=self.bearer(self.other_user))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_report_is_admin_only(self):
+        expected = await sync_to_async(self.sync_json)(self.superuser, reverse('appointment-report'))
+        response = await self.async_client.get(reverse('appointment-async-report'), headers=self.bearer(self.superuser))
+        self.assertEqual(response.json(), expected | {'next': response.json()['next']})
+        response = await self.async_client.get(reverse('appointment-async-report'), headers=self.bearer(self.patient))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    async def test_authentication_errors(self):
+        response = await self.async_client.get(reverse('appointment-async-list'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = await self.async_client.get(reverse('appointment-async-list'), headers={'AUTHORIZATION': 'Bearer nonsense'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = await self.async_client.post(reverse('appointment-async-list'), headers=self.bearer(self.superuser))
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    async def test_cursor_pagination_is_rejected(self):
+        response = await self.async_client.get(
+            reverse('appointment-async-list') + '?pagination=cursor', headers=self.bearer(self.superuser)
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(APITestCase):
+    """
+    The replica is a second, separate test database; rows only reach it when a test
+    copies them, which stands in for replication.
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.superuser = User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        self.doctor = User.objects.create_user('doctor', 'doctor@test.com', 'password', role=User.DOCTOR)
+        self.patient = User.objects.create_user('patient', 'patient@test.com', 'password')
+        self.start = timezone.now().replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        self.appointment = Appointment.objects.create(doctor=self.doctor, patient=self.patient, scheduled_at=self.start)
+        self.replicate(User, self.superuser, self.doctor, self.patient)
+        self.client.force_authenticate(user=self.superuser)
+
+    def replicate(self, model, *objs):
+        model.objects.using('replica').bulk_create(objs)
+
+    def list_ids(self):
+        response = self.client.get(reverse('appointment-list') + '?limit=100')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [row['id'] for row in response.data['results']]
+
+    def test_reads_go_to_the_replica(self):
+        self.assertEqual(self.list_ids(), [])
+        response = self.client.get(reverse('appointment-detail', kwargs={'id': self.appointment.id}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        self.replicate(Appointment, self.appointment)
+        cache.clear()
+        self.assertEqual(self.list_ids(), [self.appointment.id])
+        self.assertNotIn(routers.PIN_COOKIE, self.client.cookies)
+
+    def test_client_reads_its_writes_from_the_primary(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('appointment-create'), {
+                'doctor_id': self.doctor.id,
+                'patient_id': self.patient.id,
+                'scheduled_at': self.start + timedelta(hours=2),
+            })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+        self.assertEqual(sorted(self.list_ids()), [self.appointment.id, response.data['id']])
+
+        # Once the pin has expired, reads go back to the lagging replica
+        del self.client.cookies[routers.PIN_COOKIE]
+        cache.clear()
+        self.assertEqual(self.list_ids(), [])
+
+    def test_overlap_check_reads_the_primary(self):
+        serializer = AppointmentSerializer(data={
+            'doctor_id': self.doctor.id,
+            'patient_id': self.patient.id,
+            'scheduled_at': self.start + timedelta(minutes=15),
+        })
+        token = routers._replica.set('replica')
+        try:
+            with CaptureQueriesContext(connections['replica']) as replica_queries:
+                self.assertFalse(serializer.is_valid())
+        finally:
+            routers._replica.reset(token)
+        self.assertIn('scheduled_at', serializer.errors)
+        # The doctor and patient lookups may use the replica, the overlap check may not
+        self.assertFalse(any('appointments_appointment' in query['sql'] for query in replica_queries.captured_queries))
+
+    @override_settings(DATABASE_REPLICAS=['replica', 'default'])
+    def test_a_request_reads_from_one_replica(self):
+        # default stands in for a second replica, one that has the appointment
+        for _ in range(10):
+            cache.clear()
+            with CaptureQueriesContext(connections['replica']) as replica_queries, \
+                    CaptureQueriesContext(connection) as default_queries:
+                ids = self.list_ids()
+            self.assertEqual(ids, [self.appointment.id] if default_queries.captured_queries else [])
+            self.assertFalse(replica_queries.captured_queries and default_queries.captured_queries)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_everything_uses_the_primary(self):
+        self.assertEqual(self.list_ids(), [self.appointment.id])
+        response = self.client.delete(reverse('appointment-detail', kwargs={'id': self.appointment.id}))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+
+
+class EventStream:
+    """
+    Reads a server-sent event stream in the background, collecting its events.
+    """
+
+    def __init__(self, chunks):
+        self.events = asyncio.Queue()
+        self.task = asyncio.create_task(self.read(chunks))
+
+    async def read(self, chunks):
+        buffer = ''
+        async for chunk in chunks:
+            buffer += chunk.decode() if isinstance(chunk, bytes) else chunk
+            while '\n\n' in buffer:
+                block, buffer = buffer.split('\n\n', 1)
+                fields = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+                if 'event' in fields:
+                    await self.events.put(fields)
+
+    async def next(self):
+        event = await asyncio.wait_for(self.events.get(), 5)
+        if event['event'] == 'appointment':
+            event['data'] = json.loads(event['data'])
+        return event
+
+    async def close(self):
+        # What the ASGI handler does when the client disconnects
+        self.task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self.task
+
+
+def closing_streams(test):
+    """
+    Close the streams a test opened before its event loop goes away.
+    """
+    @functools.wraps(test)
+    async def wrapper(self):
+        try:
+            await test(self)
+        finally:
+            for stream in self.streams:
+                await stream.close()
+    return wrapper
+
+
+class AppointmentEventTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(events, 'POLL_INTERVAL', 0.01)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.superuser = User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        self.doctor = User.objects.create_user('doctor', 'doctor@test.com', 'password', role=User.DOCTOR)
+        self.other_doctor = User.objects.create_user('other_doctor', 'other_doctor@test.com', 'password', role=User.DOCTOR)
+        self.patient = User.objects.create_user('patient', 'patient@test.com', 'password')
+        self.other_patient = User.objects.create_user('other_patient', 'other_patient@test.com', 'password')
+        self.start = timezone.now() + timedelta(days=1)
+        self.streams = []
+
+    def write(self, function):
+        # Commits run the task numbering the change records
+        with self.captureOnCommitCallbacks(execute=True):
+            return function()
+
+    async def create(self, doctor, patient, hours=0):
+        return await sync_to_async(self.write)(
+            lambda: Appointment.objects.create(doctor=doctor, patient=patient, scheduled_at=self.start + timedelta(hours=hours))
+        )
+
+    async def update(self, appointment, **fields):
+        def save():
+            for name, value in fields.items():
+                setattr(appointment, name, value)
+            appointment.save()
+        await sync_to_async(self.write)(save)
+
+    async def open(self, user, last_event_id=None):
+        stream = EventStream(events.get_hub().stream(user, last_event_id))
+        self.streams.append(stream)
+        # Wait for the hub to take the subscriber
+        while not events.get_hub().count or not events.get_hub().started.is_set():
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.05)
+        return stream
+
+    @closing_streams
+    async def test_events_are_scoped_to_the_appointment_owners(self):
+        doctor, patient, admin, other = [
+            await self.open(user) for user in (self.doctor, self.patient, self.superuser, self.other_patient)
+        ]
+        appointment = await self.create(self.doctor, self.patient)
+        for stream in (doctor, patient, admin):
+            event = await stream.next()
+            self.assertEqual((event['data']['action'], event['data']['id']), ('create', appointment.id))
+            self.assertEqual(event['data']['appointment']['patient_id'], self.patient.id)
+
+        # The other patient's first event is their own appointment's
+        own = await self.create(self.other_doctor, self.other_patient, hours=1)
+        self.assertEqual((await other.next())['data']['id'], own.id)
+
+    @closing_streams
+    async def test_update_complete_and_delete(self):
+        stream = await self.open(self.patient)
+        appointment = await self.create(self.doctor, self.patient)
+        await self.update(appointment, duration_minutes=45)
+        await self.update(appointment, is_completed=True)
+        await sync_to_async(self.write)(appointment.delete)
+        actions = [(await stream.next())['data']['action'] for _ in range(4)]
+        self.assertEqual(actions, ['create', 'update', 'complete', 'delete'])
+
+    @closing_streams
+    async def test_moved_appointment_is_removed_for_its_former_doctor(self):
+        appointment = await self.create(self.doctor, self.patient)
+        former, new = await self.open(self.doctor), await self.open(self.other_doctor)
+        await self.update(appointment, doctor=self.other_doctor)
+        self.assertEqual((await former.next())['data'], {'action': 'delete', 'id': appointment.id})
+        self.assertEqual((await new.next())['data']['action'], 'update')
+
+    @closing_streams
+    async def test_reconnect_resumes_after_last_event_id(self):
+        # A change from before the hub started
+        await self.create(self.doctor, self.patient, hours=2)
+        admin = await self.open(self.superuser)
+        await self.create(self.doctor, self.patient)
+        second = await self.create(self.doctor, self.patient, hours=1)
+        first_id = int((await admin.next())['id'])
+        await admin.next()
+
+        resumed = await self.open(self.patient, last_event_id=first_id)
+        self.assertEqual((await resumed.next())['data']['id'], second.id)
+
+        # Older than anything the hub has seen: the client has to reload
+        stale = await self.open(self.patient, last_event_id=0)
+        self.assertEqual((await stale.next())['event'], 'reset')
+
+    def test_slow_subscriber_keeps_a_bounded_backlog(self):
+        subscriber = events.Subscriber(self.patient)
+        for sequence in range(events.SUBSCRIBER_QUEUE_SIZE + 5):
+            subscriber.push(events.format_event(sequence, {}))
+        self.assertEqual(subscriber.queue.qsize(), 5)
+        self.assertEqual(subscriber.queue.get_nowait(), events.RESET_MESSAGE)
+
+    @closing_streams
+    async def test_endpoint_streams_events(self):
+        url = reverse('appointment-events')
+        self.assertEqual((await self.async_client.get(url)).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        headers = {'AUTHORIZATION': f'Bearer {AccessToken.for_user(self.doctor)}'}
+        response = await self.async_client.get(url, headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = EventStream(response.streaming_content)
+        self.streams.append(stream)
+        while not events.get_hub().started.is_set():
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+
+        appointment = await self.create(self.doctor, self.patient)
+        event = await stream.next()
+        self.assertEqual((event['event'], event['data']['id']), ('appointment', appointment.id))
+
+    def test_endpoint_is_not_served_under_wsgi(self):
+        response = self.client.get(
+            reverse('appointment-events'), HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.doctor)}'
+        )
+        self.assertEqual(response.status_code, status.HTTP_501_NOT_IMPLEMENTED)
+        self.assertFalse(events._hubs)
+
+    async def test_streams_are_limited_per_process(self):
+        with mock.patch.object(events, 'MAX_SUBSCRIBERS', 0):
+            response = await self.async_client.get(
+                reverse('appointment-events'), headers={'AUTHORIZATION': f'Bearer {AccessToken.for_user(self.doctor)}'}
+            )
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
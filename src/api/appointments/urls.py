@@ -1,13 +1,37 @@
 from django.urls import path
-from .views import AppointmentListView, AppointmentDetailView, AppointmentReportView, AppointmentCreateView
+from . import async_views
+from .views import (
+    AppointmentListView, AppointmentExportView, AppointmentDetailView, AppointmentReportView, AppointmentCreateView,
+    AppointmentBulkCreateView, AppointmentAvailabilityView, AppointmentCacheStatsView,
+)
 urlpatterns = [
     # List appointments
     path('list/', AppointmentListView.as_view(), name='appointment-list'),
 
+    # Stream the filtered appointments as CSV or NDJSON
+    path('export/', AppointmentExportView.as_view(), name='appointment-export'),
+
     # Retrieve details of an appointment by id
     path('<int:id>/', AppointmentDetailView.as_view(), name='appointment-detail'),
     # Generate a report of appointments
     path('report/', AppointmentReportView.as_view(), name='appointment-report'),
 
     path('create/', AppointmentCreateView.as_view(), name='appointment-create'),
+
+    # Create many appointments in one transaction
+    path('bulk-create/', AppointmentBulkCreateView.as_view(), name='appointment-bulk-create'),
+
+    # Free slots of doctors over a date range
+    path('availability/', AppointmentAvailabilityView.as_view(), name='appointment-availability'),
+
+    # Hit/miss counters of the list cache
+    path('cache/stats/', AppointmentCacheStatsView.as_view(), name='appointment-cache-stats'),
+
+    # Async versions of the read endpoints, for ASGI servers
+    path('async/list/', async_views.appointment_list, name='appointment-async-list'),
+    path('async/<int:id>/', async_views.appointment_detail, name='appointment-async-detail'),
+    path('async/report/', async_views.appointment_report, name='appointment-async-report'),
+
+    # Server-sent events of appointment changes, for dashboards (ASGI only)
+    path('events/', async_views.appointment_events, name='appointment-events'),
 ]
@@ -1,57 +1,142 @@
-from rest_framework import generics
+import csv
+import json
+from datetime import datetime
+from rest_framework import generics, serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
+from rest_framework import status
 from django_filters.rest_framework import DjangoFilterBackend
 from django.core.cache import cache
-from django.db.models import Q, Count, F
+from django.http import StreamingHttpResponse
 from .models import Appointment
-from .serializer import AppointmentSerializer, AppointmentReportSerializer
+from .serializer import (
+    AppointmentSerializer, AppointmentReadSerializer, AppointmentReportSerializer, AppointmentBulkCreateSerializer,
+    AvailabilityQuerySerializer,
+)
+from .availability import free_slots
+from .rollups import daily_counts
 from .permissions import IsAppointmentOwnerOrSuperuser
 from .filters import AppointmentReportFilter, AppointmentFilter
+from .pagination import AppointmentPagination
+from .cache import LIST_CACHE_TIMEOUT, cache_stats, list_cache_key, query_fingerprint
 
 class AppointmentListView(generics.ListAPIView):
     serializer_class = AppointmentSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_class = AppointmentFilter
+    pagination_class = AppointmentPagination
+    query_budget = {'GET': 2}  # COUNT + page
 
     def get_queryset(self):
         """
         Return the queryset of appointments based on user and query parameters.
         """
-        user = self.request.user
-        queryset = Appointment.objects.select_related('doctor', 'patient')
-        condition = Q()
+        return (
+            Appointment.objects.visible_to(self.request.user)
+            .select_related('doctor', 'patient')
+            .order_by('scheduled_at', 'id')
+        )
 
-        if not user.is_superuser:
-            condition &= Q(doctor=user) | Q(patient=user)
+    def list(self, request, *args, **kwargs):
+        """
+        Override list method to cache pages per principal, keyed on a canonical
+        fingerprint of the filter and pagination params.
+        """
+        fingerprint = query_fingerprint(request.query_params, self.filterset_class)
+        if fingerprint is None:
+            return self.list_rows(request)
 
-        return queryset.filter(condition)
+        cache_key = list_cache_key(request, request.user, fingerprint)
+        cached_response = cache.get(cache_key)
+        cache_stats.record(hit=cached_response is not None)
+        if cached_response is not None:
+            return Response(cached_response)
 
-    def list(self, request, *args, **kwargs):
+        response = self.list_rows(request)
+        cache.set(cache_key, response.data, timeout=LIST_CACHE_TIMEOUT)
+
+        return response
+
+    def list_rows(self, request):
         """
-        Override list method to implement caching with respect to filters and pagination.
+        List through the read-only fast path: the page is fetched as plain values and
+        turned into the same dicts AppointmentSerializer would produce.
         """
-        query_params = request.query_params
-        doctor_name = query_params.get('doctor_name')
-        date = query_params.get('date')
-        is_completed = query_params.get('is_completed')
+        queryset = AppointmentReadSerializer.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(AppointmentReadSerializer.from_rows(page))
+        return Response(AppointmentReadSerializer.from_rows(queryset))
 
-        pagination_key = f"limit={query_params.get('limit', 10)}&offset={query_params.get('offset', 0)}"
-        cache_key = f"appointments:{pagination_key}"
 
-        if doctor_name or date or is_completed:
-            return super().list(request, *args, **kwargs)
+class Echo:
+    """
+    A file-like object that returns what is written to it, so csv.writer can produce lines
+    for a streaming response.
+    """
+
+    def write(self, value):
+        return value
 
-        cached_response = cache.get(cache_key)
-        if cached_response:
-            return Response(cached_response)
 
-        response = super().list(request, *args, **kwargs)
-        cache.set(cache_key, response.data, timeout=300)  # Cache for 5 minutes
+class AppointmentExportView(AppointmentListView):
+    """
+    View to stream every appointment matching the list filters as CSV or NDJSON
+    (?output=csv|ndjson). Rows are read in chunks with a server-side cursor and written
+    as plain tuples, so memory stays flat however many rows are exported.
+    """
+    permission_classes = [IsAdminUser]
+    pagination_class = None
+    query_budget = {'GET': 1}
+    chunk_size = 2000
+    export_fields = (
+        'id', 'scheduled_at', 'ends_at', 'duration_minutes', 'is_completed',
+        'doctor_id', 'doctor__first_name', 'doctor__last_name',
+        'patient_id', 'patient__first_name', 'patient__last_name',
+    )
+    content_types = {
+        'csv': 'text/csv',
+        'ndjson': 'application/x-ndjson',
+    }
+    datetime_field = serializers.DateTimeField()
 
+    def list(self, request, *args, **kwargs):
+        output = request.query_params.get('output', 'csv')
+        if output not in self.content_types:
+            raise ValidationError({'output': f"Choose one of: {', '.join(self.content_types)}."})
+
+        rows = (
+            self.filter_queryset(self.get_queryset())
+            .order_by('id')
+            .values_list(*self.export_fields)
+            .iterator(chunk_size=self.chunk_size)
+        )
+        header = [field.replace('__', '_') for field in self.export_fields]
+        lines = self.csv_lines(header, rows) if output == 'csv' else self.ndjson_lines(header, rows)
+
+        response = StreamingHttpResponse(lines, content_type=self.content_types[output])
+        response['Content-Disposition'] = f'attachment; filename="appointments.{output}"'
         return response
 
+    def formatted(self, row):
+        # Datetimes are written exactly like the API renders them
+        to_representation = self.datetime_field.to_representation
+        return [to_representation(value) if isinstance(value, datetime) else value for value in row]
+
+    def csv_lines(self, header, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(header)
+        for row in rows:
+            yield writer.writerow(self.formatted(row))
+
+    def ndjson_lines(self, header, rows):
+        for row in rows:
+            yield json.dumps(dict(zip(header, self.formatted(row)))) + '\n'
+
+
 class AppointmentDetailView(generics.RetrieveUpdateDestroyAPIView):
     """
     View to retrieve, update, or delete an appointment.
@@ -59,19 +144,24 @@ class AppointmentDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = AppointmentSerializer
     permission_classes = [IsAuthenticated, IsAppointmentOwnerOrSuperuser]
     lookup_field = 'id'
-    queryset = Appointment.objects.select_related('patient','doctor').all()
+    query_budget = {'GET': 1, 'PUT': 11, 'PATCH': 11, 'DELETE': 4}
 
     def get_serializer(self, *args, **kwargs):
         kwargs['partial'] = True
         return super().get_serializer(*args, **kwargs)
-    
-    def delete(self, request, *args, **kwargs):
+
+    def get_queryset(self):
         """
-        Override delete method to clear the cache after deleting an appointment.
+        Scope the lookup to the appointments the user may see, so the ownership check is
+        part of the single indexed fetch and other users' appointments are simply not found.
         """
-        response = super().delete(request, *args, **kwargs)
-        cache.delete_pattern('appointments:*')
-        return response
+        queryset = Appointment.objects.visible_to(self.request.user)
+        if self.request.method == 'GET':
+            return AppointmentReadSerializer.only(queryset)
+        return queryset.select_related('patient', 'doctor')
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(AppointmentReadSerializer.from_instance(self.get_object()))
 
 
 class AppointmentReportView(generics.ListAPIView):
@@ -79,18 +169,75 @@ class AppointmentReportView(generics.ListAPIView):
     serializer_class = AppointmentReportSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_class = AppointmentReportFilter
+    query_budget = {'GET': 2}
 
     def get_queryset(self):
         """
-        Return the queryset of appointments grouped by date.
+        Return appointment counts grouped by date, read from the daily rollup.
         """
-        return Appointment.objects.select_related('doctor', 'patient').values(
-            scheduled_date=F('scheduled_at__date')
-        ).annotate(count=Count('id'))
+        return daily_counts()
 
 class AppointmentCreateView(generics.CreateAPIView):
     """
     View to create appointments.
     """
     serializer_class = AppointmentSerializer
-    permission_classes = [IsAdminUser]
\ No newline at end of file
+    permission_classes = [IsAdminUser]
+    query_budget = {'POST': 9}
+
+
+class AppointmentBulkCreateView(generics.GenericAPIView):
+    """
+    View to create many appointments at once, e.g. when importing a clinic's schedule.
+    Either every row is created or none is, with errors reported per row.
+    """
+    serializer_class = AppointmentBulkCreateSerializer
+    permission_classes = [IsAdminUser]
+    query_budget = {'POST': 11}  # Whatever the number of rows
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        appointments = serializer.save()
+        return Response(
+            {'created': len(appointments), 'ids': [appointment.id for appointment in appointments]},
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class AppointmentCacheStatsView(APIView):
+    """
+    View to expose the appointment list cache hit and miss counters of this process.
+    """
+    permission_classes = [IsAdminUser]
+    query_budget = {'GET': 0}
+
+    def get(self, request, *args, **kwargs):
+        return Response(cache_stats.snapshot())
+
+
+class AppointmentAvailabilityView(APIView):
+    """
+    View to list the free slots of one or more doctors over a date range.
+    """
+    permission_classes = [IsAuthenticated]
+    query_budget = {'GET': 2}
+    datetime_field = serializers.DateTimeField()
+
+    def get(self, request, *args, **kwargs):
+        query = AvailabilityQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        slots = free_slots(**query.validated_data)
+        to_representation = self.datetime_field.to_representation
+        return Response({
+            'results': [
+                {
+                    'doctor_id': doctor_id,
+                    'slots': [
+                        {'start': to_representation(start), 'end': to_representation(end)}
+                        for start, end in doctor_slots
+                    ],
+                }
+                for doctor_id, doctor_slots in slots.items()
+            ]
+        })
@@ -0,0 +1,10 @@
+from django.contrib import admin
+from .models import Change
+
+
+class ChangeAdmin(admin.ModelAdmin):
+    list_display = ['sequence', 'model', 'object_id', 'action', 'recorded_at']
+    list_filter = ['model', 'action']
+    search_fields = ['=object_id']
+
+admin.site.register(Change, ChangeAdmin)
@@ -0,0 +1,123 @@
+"""
+Transactional outbox of appointment and user changes.
+
+Every create, update and delete inserts a compact Change row in the writing transaction,
+so a change is in the feed exactly when it is in the tables. Consumers read the feed
+after the last sequence number they processed (ChangeFeedView, stream_changes), at a
+cost proportional to the changes rather than the tables.
+
+Row ids are handed out at insert time, but transactions commit in any order: reading
+"after id N" could skip a row with a smaller id that commits later. Sequence numbers are
+assigned instead by assign_sequences(), which runs on the task queue after each commit
+and numbers the rows it can see in id order, so they only ever grow in commit order.
+Changes are in the feed once numbered.
+"""
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Max
+from api.appointments.models import Appointment
+from api.tasks.queue import enqueue
+from api.users.models import User
+from .models import Change
+
+# Fields written into the change records of each model
+TRACKED_MODELS = {
+    Appointment: (Change.APPOINTMENT, ('doctor_id', 'patient_id', 'scheduled_at', 'duration_minutes', 'is_completed')),
+    User: (Change.USER, (
+        'username', 'email', 'first_name', 'last_name', 'phone_number', 'role', 'specialization', 'is_active',
+    )),
+}
+
+# Previous values recorded with an appointment update when they change: who could see
+# the appointment before, and whether it has just been completed
+PREVIOUS_FIELDS = ('doctor_id', 'patient_id', 'is_completed')
+
+SEQUENCE_BATCH_SIZE = 1000
+
+
+def is_tracked_update(model, update_fields):
+    """
+    Return whether a save with the given update_fields changes a tracked field
+    (last_login updates, for instance, do not).
+    """
+    if update_fields is None:
+        return True
+    _, fields = TRACKED_MODELS[model]
+    return bool({*fields, *(field.removesuffix('_id') for field in fields)}.intersection(update_fields))
+
+
+def build_change(instance, action, previous_state=None):
+    """
+    Build the change record of the instance: its tracked fields after the change (before
+    it, for deletes), plus the PREVIOUS_FIELDS of previous_state that differ.
+    """
+    name, fields = TRACKED_MODELS[type(instance)]
+    data = {field: getattr(instance, field) for field in fields}
+    if previous_state is not None:
+        previous = {field: previous_state.get(field) for field in PREVIOUS_FIELDS}
+        if any(previous[field] != data[field] for field in PREVIOUS_FIELDS):
+            data['previous'] = previous
+    return Change(model=name, object_id=instance.pk, action=action, data=data)
+
+
+def record_changes(changes):
+    """
+    Insert the changes in the surrounding transaction, and number them once it commits.
+    """
+    if not changes:
+        return
+    Change.objects.bulk_create(changes)
+    enqueue('outbox.assign_sequences', {})
+
+
+def record_instances(instances, action, previous_state=None):
+    record_changes([build_change(instance, action, previous_state) for instance in instances])
+
+
+def assign_sequences():
+    """
+    Number the committed changes that have no sequence number yet, in id order, and
+    return how many were numbered.
+    """
+    numbered = conflicts = 0
+    while True:
+        try:
+            count = _assign_batch()
+        except IntegrityError:
+            # A concurrent run numbered from the same maximum; read it again
+            conflicts += 1
+            if conflicts > 3:
+                raise
+            continue
+        numbered += count
+        if count < SEQUENCE_BATCH_SIZE:
+            return numbered
+
+
+def _assign_batch():
+    with transaction.atomic():
+        pending = Change.objects.filter(sequence__isnull=True).order_by('id')
+        if connection.features.has_select_for_update:
+            # A concurrent run waits here, then finds these rows numbered
+            pending = pending.select_for_update()
+        change_ids = list(pending.values_list('id', flat=True)[:SEQUENCE_BATCH_SIZE])
+        if not change_ids:
+            return 0
+        last = Change.objects.aggregate(last=Max('sequence'))['last'] or 0
+        Change.objects.bulk_update(
+            [Change(id=change_id, sequence=last + offset) for offset, change_id in enumerate(change_ids, start=1)],
+            ['sequence'],
+        )
+    return len(change_ids)
+
+
+def changes_after(sequence, limit, model=None):
+    """
+    Return up to `limit` changes numbered after `sequence`, oldest first, as dicts;
+    only those of `model` if given.
+    """
+    changes = Change.objects.filter(sequence__gt=sequence)
+    if model is not None:
+        changes = changes.filter(model=model)
+    return changes.order_by('sequence').values(
+        'sequence', 'model', 'object_id', 'action', 'data', 'recorded_at',
+    )[:limit]
@@ -0,0 +1,41 @@
+import json
+import time
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from api.outbox.feed import changes_after
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the appointment and user changes numbered after --after to stdout, one JSON "
+        "object per line, in batches. With --follow, keeps polling for new changes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--after', type=int, default=0, help="Last sequence number already processed.")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--follow', action='store_true', help="Wait for new changes instead of exiting.")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds between polls with --follow.")
+
+    def handle(self, *args, **options):
+        after = options['after']
+        streamed = 0
+        try:
+            while True:
+                close_old_connections()
+                changes = list(changes_after(after, options['batch_size']))
+                for change in changes:
+                    self.stdout.write(json.dumps(change, cls=DjangoJSONEncoder))
+                if changes:
+                    after = changes[-1]['sequence']
+                    streamed += len(changes)
+                if len(changes) == options['batch_size']:
+                    continue
+                if not options['follow']:
+                    break
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        # stdout carries only the changes
+        self.stderr.write(f"Streamed {streamed} changes; resume with --after {after}.")
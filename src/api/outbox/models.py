@@ -0,0 +1,45 @@
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class Change(models.Model):
+    """
+    A create, update or delete of an appointment or user, written in the transaction of
+    the write itself. The sequence number is assigned after the commit, in the order the
+    changes become visible (see feed.py), so a consumer that has read up to a sequence
+    number never misses a change that committed late.
+    """
+    APPOINTMENT = 'appointment'
+    USER = 'user'
+    MODEL_CHOICES = [
+        (APPOINTMENT, 'Appointment'),
+        (USER, 'User'),
+    ]
+
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    ACTION_CHOICES = [
+        (CREATE, 'Create'),
+        (UPDATE, 'Update'),
+        (DELETE, 'Delete'),
+    ]
+
+    sequence = models.BigIntegerField(null=True, blank=True, unique=True)
+    model = models.CharField(max_length=20, choices=MODEL_CHOICES)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    # The object's fields after the change, or before it for deletes (see feed.py)
+    data = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    recorded_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Changes still waiting for a sequence number, in insertion order
+            models.Index(fields=['id'], condition=Q(sequence__isnull=True), name='outbox_change_unsequenced_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.action} {self.model} {self.object_id}"
@@ -0,0 +1,24 @@
+from rest_framework import serializers
+from .models import Change
+
+
+class ChangeFeedQuerySerializer(serializers.Serializer):
+    """
+    Serializer for validating the query params of the change feed.
+    """
+    MAX_LIMIT = 1000
+
+    after = serializers.IntegerField(min_value=0, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=MAX_LIMIT, default=500)
+
+
+class ChangeSerializer(serializers.Serializer):
+    """
+    Serializer for one change record, read from the rows of feed.changes_after().
+    """
+    sequence = serializers.IntegerField()
+    model = serializers.ChoiceField(choices=Change.MODEL_CHOICES)
+    object_id = serializers.IntegerField()
+    action = serializers.ChoiceField(choices=Change.ACTION_CHOICES)
+    data = serializers.JSONField()
+    recorded_at = serializers.DateTimeField()
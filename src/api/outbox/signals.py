@@ -0,0 +1,37 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from api.appointments import cascades
+from api.appointments.models import Appointment
+from api.users.models import User
+from . import feed
+from .models import Change
+
+
+@receiver(pre_save, sender=Appointment)
+def appointment_saving(sender, instance, **kwargs):
+    # The receiver of api.appointments, connected first, has made sure it is loaded
+    instance._outbox_previous_state = getattr(instance, '_loaded_state', None)
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_save, sender=User)
+def instance_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        feed.record_instances([instance], Change.CREATE)
+    elif feed.is_tracked_update(sender, update_fields):
+        feed.record_instances([instance], Change.UPDATE, getattr(instance, '_outbox_previous_state', None))
+
+
+@receiver(post_delete, sender=Appointment)
+def appointment_deleted(sender, instance, origin=None, **kwargs):
+    if cascades.is_user_delete(origin):
+        # One INSERT for all the appointments of the deleted users, as for the rollups
+        cascades.collected(origin, 'outbox', list).append(feed.build_change(instance, Change.DELETE))
+        return
+    feed.record_instances([instance], Change.DELETE)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, origin=None, **kwargs):
+    changes = cascades.pop_collected(origin, 'outbox') or []
+    feed.record_changes([*changes, feed.build_change(instance, Change.DELETE)])
@@ -0,0 +1,10 @@
+from api.tasks.queue import task
+from .feed import assign_sequences
+
+
+@task('outbox.assign_sequences', dedupe=True)
+def assign_change_sequences(payloads):
+    """
+    Number the changes committed since the last run.
+    """
+    assign_sequences()
@@ -0,0 +1,156 @@
+import json
+from datetime import timedelta
+from io import StringIO
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from api.appointments.models import Appointment
+from api.outbox.feed import assign_sequences
+from api.outbox.models import Change
+from api.outbox.views import ChangeFeedView
+from api.users.models import User
+from config.query_budget import QueryBudgetTestMixin
+
+
+class ChangeRecordTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.doctor = User.objects.create_user('doctor', 'doctor@test.com', 'password', role=User.DOCTOR)
+        self.patient = User.objects.create_user('patient', 'patient@test.com', 'password', role=User.PATIENT)
+        self.start = timezone.localtime().replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+    def changes(self, model=Change.APPOINTMENT):
+        return list(Change.objects.filter(model=model).order_by('id').values_list('object_id', 'action'))
+
+    def test_appointment_writes_are_recorded(self):
+        appointment = Appointment.objects.create(doctor=self.doctor, patient=self.patient, scheduled_at=self.start)
+        appointment.is_completed = True
+        appointment.save(update_fields=['is_completed'])
+        appointment_id = appointment.id
+        appointment.delete()
+
+        self.assertEqual(self.changes(), [
+            (appointment_id, Change.CREATE), (appointment_id, Change.UPDATE), (appointment_id, Change.DELETE),
+        ])
+        update = Change.objects.get(action=Change.UPDATE)
+        self.assertEqual(update.data['is_completed'], True)
+        self.assertEqual(update.data['doctor_id'], self.doctor.id)
+        self.assertEqual(update.data['previous'], {'doctor_id': self.doctor.id, 'patient_id': self.patient.id, 'is_completed': False})
+        self.assertEqual(Change.objects.get(action=Change.DELETE).data['patient_id'], self.patient.id)
+
+    def test_rolled_back_writes_are_not_recorded(self):
+        with transaction.atomic():
+            Appointment.objects.create(doctor=self.doctor, patient=self.patient, scheduled_at=self.start)
+            transaction.set_rollback(True)
+        self.assertEqual(self.changes(), [])
+
+    def test_untracked_user_updates_are_not_recorded(self):
+        Change.objects.all().delete()
+        self.doctor.last_login = timezone.now()
+        self.doctor.save(update_fields=['last_login'])
+        self.assertEqual(self.changes(Change.USER), [])
+
+        self.doctor.first_name = 'Gregory'
+        self.doctor.save(update_fields=['first_name'])
+        self.assertEqual(self.changes(Change.USER), [(self.doctor.id, Change.UPDATE)])
+
+    def test_user_delete_records_its_appointments_in_one_insert(self):
+        for hour in range(5):
+            Appointment.objects.create(doctor=self.doctor, patient=self.patient, scheduled_at=self.start + timedelta(hours=hour))
+        Change.objects.all().delete()
+        doctor_id = self.doctor.id
+
+        with CaptureQueriesContext(connection) as queries:
+            self.doctor.delete()
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "outbox_change"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(Change.objects.filter(model=Change.APPOINTMENT, action=Change.DELETE).count(), 5)
+        self.assertEqual(self.changes(Change.USER), [(doctor_id, Change.DELETE)])
+
+    def test_bulk_created_appointments_are_recorded(self):
+        admin = User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        self.client.force_authenticate(admin)
+        rows = [
+            {'doctor_id': self.doctor.id, 'patient_id': self.patient.id, 'scheduled_at': (self.start + timedelta(hours=hour)).isoformat()}
+            for hour in range(3)
+        ]
+        response = self.client.post(reverse('appointment-bulk-create'), {'appointments': rows}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.changes(), [(appointment_id, Change.CREATE) for appointment_id in response.data['ids']])
+
+    def test_sequences_follow_the_commit_order(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.create(doctor=self.doctor, patient=self.patient, scheduled_at=self.start)
+        self.assertFalse(Change.objects.filter(sequence__isnull=True).exists())
+        last = Change.objects.order_by('-sequence').first().sequence
+
+        # A row inserted earlier but committed later is numbered after the ones already read
+        late = Change.objects.create(model=Change.USER, object_id=self.doctor.id, action=Change.UPDATE, data={})
+        Change.objects.filter(id=late.id).update(id=0)
+        self.assertEqual(assign_sequences(), 1)
+        self.assertEqual(Change.objects.get(id=0).sequence, last + 1)
+
+
+class ChangeFeedViewTests(QueryBudgetTestMixin, APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        self.doctor = User.objects.create_user('doctor', 'doctor@test.com', 'password', role=User.DOCTOR)
+        self.patient = User.objects.create_user('patient', 'patient@test.com', 'password', role=User.PATIENT)
+        start = timezone.now() + timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            for hour in range(3):
+                Appointment.objects.create(doctor=self.doctor, patient=self.patient, scheduled_at=start + timedelta(hours=hour))
+        self.url = reverse('change-feed')
+        self.client.force_authenticate(self.admin)
+
+    def test_feed_is_read_in_batches(self):
+        total = Change.objects.count()
+        seen, after = [], 0
+        while True:
+            response = self.client.get(self.url, {'after': after, 'limit': 2})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(change['sequence'] for change in response.data['changes'])
+            after = response.data['next_after']
+            if not response.data['has_more']:
+                break
+        self.assertEqual(seen, list(range(1, total + 1)))
+
+        response = self.client.get(self.url, {'after': after})
+        self.assertEqual((response.data['changes'], response.data['next_after']), ([], after))
+
+    def test_change_format(self):
+        appointment = Appointment.objects.order_by('id').last()
+        response = self.client.get(self.url, {'after': Change.objects.get(object_id=appointment.id, model=Change.APPOINTMENT).sequence - 1, 'limit': 1})
+        change = response.data['changes'][0]
+        self.assertEqual(
+            (change['model'], change['object_id'], change['action']), (Change.APPOINTMENT, appointment.id, Change.CREATE)
+        )
+        self.assertEqual(change['data']['patient_id'], self.patient.id)
+
+    def test_invalid_params_are_rejected(self):
+        for params in ({'after': -1}, {'limit': 0}, {'limit': 5000}, {'after': 'x'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_only_admins_can_read_the_feed(self):
+        self.client.force_authenticate(self.doctor)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_feed_stays_within_budget(self):
+        self.assertWithinQueryBudget(ChangeFeedView, 'GET', self.url, {'limit': 1000})
+
+    def test_stream_changes_command(self):
+        out, err = StringIO(), StringIO()
+        call_command('stream_changes', after=1, batch_size=2, stdout=out, stderr=err)
+        sequences = [json.loads(line)['sequence'] for line in out.getvalue().splitlines()]
+        total = Change.objects.count()
+        self.assertEqual(sequences, list(range(2, total + 1)))
+        self.assertIn(f'--after {total}', err.getvalue())
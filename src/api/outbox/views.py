@@ -0,0 +1,28 @@
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from .feed import changes_after
+from .serializers import ChangeFeedQuerySerializer, ChangeSerializer
+
+
+class ChangeFeedView(APIView):
+    """
+    View to read the appointment and user changes numbered after ?after=, oldest first.
+    A consumer stores next_after and passes it back until has_more is false.
+    """
+    permission_classes = [IsAdminUser]
+    query_budget = {'GET': 1}
+
+    def get(self, request, *args, **kwargs):
+        query = ChangeFeedQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        after, limit = query.validated_data['after'], query.validated_data['limit']
+        # One extra row tells whether there is more
+        changes = list(changes_after(after, limit + 1))
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        return Response({
+            'changes': ChangeSerializer(changes, many=True).data,
+            'next_after': changes[-1]['sequence'] if changes else after,
+            'has_more': has_more,
+        })
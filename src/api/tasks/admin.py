@@ -0,0 +1,10 @@
+from django.contrib import admin
+from .models import Task
+
+
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'attempts', 'run_after', 'created_at']
+    list_filter = ['status', 'name']
+    readonly_fields = ['created_at', 'started_at', 'claimed_by']
+
+admin.site.register(Task, TaskAdmin)
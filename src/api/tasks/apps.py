@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+
+
+class TasksConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'api.tasks'
+
+    def ready(self):
+        # Register the tasks every installed app defines in its tasks module
+        autodiscover_modules('tasks')
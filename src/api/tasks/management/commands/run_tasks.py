@@ -0,0 +1,36 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from api.tasks.queue import is_eager, requeue_stalled, run_pending
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the queued background tasks (cache invalidation, rollup updates). Polls the "
+        "queue until stopped; --once runs what is due and exits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit once no task is due.")
+        parser.add_argument('--batch-size', type=int, default=100, help="Tasks claimed per poll.")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to wait while the queue is empty.")
+
+    def handle(self, *args, **options):
+        if is_eager():
+            self.stderr.write("TASKS_EAGER is on: tasks run where they are queued, so only rows queued elsewhere show up here.")
+        processed = 0
+        try:
+            requeue_stalled()
+            while True:
+                close_old_connections()
+                count = run_pending(options['batch_size'])
+                processed += count
+                if count:
+                    continue
+                if options['once']:
+                    break
+                requeue_stalled()
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f"Ran {processed} tasks.")
@@ -0,0 +1,44 @@
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class Task(models.Model):
+    """
+    A queued call of a registered task (see queue.py). Rows are deleted once the task
+    has run; the ones that ran out of attempts stay behind as failed.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    # Set for tasks that are deduplicated: one pending row per key
+    dedupe_key = models.CharField(max_length=40, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    claimed_by = models.CharField(max_length=32, null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # The worker's poll: due pending tasks, oldest first
+            models.Index(fields=['status', 'run_after'], name='tasks_task_due_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedupe_key'], condition=Q(status='pending'), name='tasks_task_pending_dedupe_key'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
@@ -0,0 +1,225 @@
+"""
+A task queue kept in the database, so running it needs no broker.
+
+Tasks are functions registered under a name with @task, in the tasks module of an app.
+enqueue() adds a row per payload to the Task table once the surrounding transaction
+commits, and the run_tasks command claims due rows, runs them and deletes them.
+
+- A task function is called with the payloads of every claimed row of its name at once,
+  so a burst of writes costs one call (one cache round trip, one rollup UPDATE) instead
+  of one per write.
+- Deduplicated tasks keep one pending row per payload: repeating an invalidation that
+  has not run yet adds nothing.
+- A failing call is retried with exponential backoff up to the task's max_attempts;
+  after that its rows are kept as failed.
+- A task may run twice (its worker can die before deleting it), so it has to be
+  idempotent, unless it only writes to the database: those writes commit together with
+  the removal of its rows.
+
+With TASKS_EAGER (on while DEBUG) tasks run in the process that queues them instead,
+at the same point in the transaction, and no worker is needed.
+"""
+import hashlib
+import json
+import logging
+import traceback
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger('tasks')
+
+# Seconds before the first retry, doubled for every further one
+RETRY_DELAY = 2
+MAX_RETRY_DELAY = 300
+# A task claimed longer ago than this belongs to a worker that died
+CLAIM_TIMEOUT = 600
+
+_registry = {}
+
+
+class TaskDefinition:
+
+    def __init__(self, name, function, max_attempts, dedupe):
+        self.name = name
+        self.function = function
+        self.max_attempts = max_attempts
+        self.dedupe = dedupe
+
+    def dedupe_key(self, payload):
+        if not self.dedupe:
+            return None
+        data = json.dumps([self.name, payload], sort_keys=True, separators=(',', ':'), cls=DjangoJSONEncoder)
+        return hashlib.sha1(data.encode()).hexdigest()
+
+    def unique_payloads(self, payloads):
+        if not self.dedupe:
+            return list(payloads)
+        return list({self.dedupe_key(payload): payload for payload in payloads}.values())
+
+
+def task(name, max_attempts=5, dedupe=False):
+    """
+    Register the decorated function as the task `name`. It is called with a list of
+    JSON-serializable payloads.
+    """
+    def register(function):
+        if name in _registry:
+            raise ValueError(f"A task is already registered as {name!r}.")
+        _registry[name] = TaskDefinition(name, function, max_attempts, dedupe)
+        return function
+    return register
+
+
+def get_task(name):
+    try:
+        return _registry[name]
+    except KeyError:
+        raise LookupError(f"No task is registered as {name!r}.") from None
+
+
+def is_eager():
+    return getattr(settings, 'TASKS_EAGER', False)
+
+
+def enqueue(name, *payloads, transactional=False):
+    """
+    Queue a call of the task for each payload.
+
+    The rows are added once the surrounding transaction commits, so the task never sees
+    data older than the change that queued it and a rolled back change queues nothing.
+    With transactional=True they are added as part of the transaction instead, for tasks
+    that must not be lost if the process dies right after the commit (derived counts).
+    Those cannot be deduplicated, since the pending key would stay locked until the commit.
+    """
+    definition = get_task(name)
+    payloads = definition.unique_payloads(payloads)
+    if not payloads:
+        return
+    if not transactional:
+        transaction.on_commit(lambda: _submit(definition, payloads))
+        return
+    if definition.dedupe:
+        raise ValueError(f"The task {name!r} is deduplicated, so it cannot be queued in the transaction.")
+    _submit(definition, payloads)
+
+
+def _submit(definition, payloads):
+    from .models import Task
+
+    if is_eager():
+        definition.function(payloads)
+        return
+    Task.objects.bulk_create(
+        [Task(name=definition.name, payload=payload, dedupe_key=definition.dedupe_key(payload)) for payload in payloads],
+        # A pending row with the same key already covers the payload
+        ignore_conflicts=definition.dedupe,
+    )
+
+
+def claim(limit):
+    """
+    Mark up to `limit` due tasks as running and return them, grouped by name.
+    """
+    from .models import Task
+
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    with transaction.atomic():
+        due = Task.objects.filter(status=Task.PENDING, run_after__lte=now).order_by('run_after', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            # Concurrent workers pass over each other's rows instead of waiting for them
+            due = due.select_for_update(skip_locked=True)
+        task_ids = list(due.values_list('id', flat=True)[:limit])
+        # Rows another worker claimed in the meantime (no row locks) keep their token
+        Task.objects.filter(id__in=task_ids, status=Task.PENDING).update(
+            status=Task.RUNNING, claimed_by=token, started_at=now, attempts=F('attempts') + 1,
+        )
+    return list(Task.objects.filter(claimed_by=token).order_by('name', 'id'))
+
+
+def run_pending(limit=100):
+    """
+    Run up to `limit` due tasks and return how many were run (failed or not).
+    """
+    tasks = claim(limit)
+    groups = {}
+    for queued in tasks:
+        groups.setdefault(queued.name, []).append(queued)
+    for name, group in groups.items():
+        _run_group(name, group)
+    return len(tasks)
+
+
+def _run_group(name, tasks):
+    from .models import Task
+
+    definition = _registry.get(name)
+    if definition is None:
+        Task.objects.filter(id__in=[queued.id for queued in tasks]).update(
+            status=Task.FAILED, claimed_by=None, last_error=f"No task is registered as {name!r}.",
+        )
+        return
+    try:
+        _run(definition, tasks)
+    except Exception:
+        if len(tasks) == 1:
+            _retry(tasks, traceback.format_exc())
+            return
+        # Run them one at a time, so one bad payload does not hold back the rest
+        for queued in tasks:
+            try:
+                _run(definition, [queued])
+            except Exception:
+                _retry([queued], traceback.format_exc())
+
+
+def _run(definition, tasks):
+    from .models import Task
+
+    with transaction.atomic():
+        definition.function([queued.payload for queued in tasks])
+        Task.objects.filter(id__in=[queued.id for queued in tasks]).delete()
+
+
+def _retry(tasks, error):
+    """
+    Put the tasks back in the queue after a delay, or mark them failed when they are out
+    of attempts.
+    """
+    from .models import Task
+
+    now = timezone.now()
+    for queued in tasks:
+        definition = _registry.get(queued.name)
+        if definition is None or queued.attempts >= definition.max_attempts:
+            logger.error("Task %s (%s) failed after %d attempts:\n%s", queued.id, queued.name, queued.attempts, error)
+            Task.objects.filter(id=queued.id).update(status=Task.FAILED, claimed_by=None, last_error=error)
+            continue
+        logger.warning("Task %s (%s) failed, retrying:\n%s", queued.id, queued.name, error)
+        delay = min(RETRY_DELAY * 2 ** max(queued.attempts - 1, 0), MAX_RETRY_DELAY)
+        try:
+            with transaction.atomic():
+                Task.objects.filter(id=queued.id).update(
+                    status=Task.PENDING, claimed_by=None, run_after=now + timedelta(seconds=delay), last_error=error,
+                )
+        except IntegrityError:
+            # The same payload was queued again in the meantime; that row covers this one
+            Task.objects.filter(id=queued.id).delete()
+
+
+def requeue_stalled(timeout=CLAIM_TIMEOUT):
+    """
+    Put back the tasks claimed more than `timeout` seconds ago by a worker that died.
+    """
+    from .models import Task
+
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    stalled = list(Task.objects.filter(status=Task.RUNNING, started_at__lt=cutoff))
+    if stalled:
+        _retry(stalled, "The worker running the task stopped.")
+    return len(stalled)
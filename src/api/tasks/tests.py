@@ -0,0 +1,161 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from api.appointments.cache import ADMIN_SCOPE, get_generations
+from api.appointments.models import Appointment, DailyAppointmentStats
+from api.tasks.models import Task
+from api.tasks.queue import enqueue, requeue_stalled, run_pending, task
+from api.users.models import User
+
+
+calls = []
+
+
+@task('tests.record', dedupe=True)
+def record(payloads):
+    calls.append([payload['value'] for payload in payloads])
+
+
+@task('tests.flaky', max_attempts=2)
+def flaky(payloads):
+    if any(payload.get('fail') for payload in payloads):
+        raise RuntimeError("flaky task failed")
+    calls.append([payload['value'] for payload in payloads])
+
+
+@override_settings(TASKS_EAGER=False)
+class TaskQueueTests(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_tasks_are_queued_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue('tests.record', {'value': 1})
+            self.assertFalse(Task.objects.exists())
+        self.assertEqual(Task.objects.get().payload, {'value': 1})
+
+    def test_rolled_back_changes_queue_nothing(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                enqueue('tests.record', {'value': 1})
+                transaction.set_rollback(True)
+        self.assertFalse(Task.objects.exists())
+
+    def test_duplicate_pending_tasks_are_merged(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue('tests.record', {'value': 1}, {'value': 1}, {'value': 2})
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue('tests.record', {'value': 2})
+        self.assertEqual(Task.objects.filter(status=Task.PENDING).count(), 2)
+
+        # A running task may have read the state already, so a new row is added
+        Task.objects.update(status=Task.RUNNING)
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue('tests.record', {'value': 2})
+        self.assertEqual(Task.objects.filter(status=Task.PENDING).count(), 1)
+
+    def test_tasks_of_one_name_run_in_one_call(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue('tests.record', {'value': 1}, {'value': 2})
+            enqueue('tests.flaky', {'value': 3})
+
+        self.assertEqual(run_pending(), 3)
+        self.assertEqual(sorted(calls), [[1, 2], [3]])
+        self.assertFalse(Task.objects.exists())
+
+    def test_failed_task_is_retried_then_kept(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue('tests.flaky', {'value': 1, 'fail': True})
+
+        run_pending()
+        queued = Task.objects.get()
+        self.assertEqual((queued.status, queued.attempts), (Task.PENDING, 1))
+        self.assertGreater(queued.run_after, timezone.now())
+        self.assertIn('flaky task failed', queued.last_error)
+        # Not due yet
+        self.assertEqual(run_pending(), 0)
+
+        Task.objects.update(run_after=timezone.now())
+        run_pending()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Task.FAILED, 2))
+
+    def test_bad_payload_does_not_hold_back_the_batch(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue('tests.flaky', {'value': 1}, {'value': 2, 'fail': True}, {'value': 3})
+
+        run_pending()
+        self.assertEqual(calls, [[1], [3]])
+        self.assertEqual(list(Task.objects.values_list('payload', flat=True)), [{'value': 2, 'fail': True}])
+
+    def test_stalled_tasks_are_requeued(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue('tests.record', {'value': 1})
+        Task.objects.update(status=Task.RUNNING, attempts=1, started_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(requeue_stalled(), 1)
+        self.assertEqual(Task.objects.get().status, Task.PENDING)
+
+    def test_deduplicated_tasks_cannot_be_transactional(self):
+        with self.assertRaises(ValueError):
+            enqueue('tests.record', {'value': 1}, transactional=True)
+
+    def test_unknown_task_is_rejected(self):
+        with self.assertRaises(LookupError):
+            enqueue('tests.missing', {})
+
+    def test_run_tasks_command(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue('tests.record', {'value': 1})
+        out = StringIO()
+        call_command('run_tasks', once=True, stdout=out)
+        self.assertIn('Ran 1 tasks.', out.getvalue())
+        self.assertEqual(calls, [[1]])
+
+
+@override_settings(TASKS_EAGER=False)
+class AppointmentTaskTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.doctor = User.objects.create_user('doctor', 'doctor@test.com', 'password', role=User.DOCTOR)
+        self.patient = User.objects.create_user('patient', 'patient@test.com', 'password', role=User.PATIENT)
+
+    def test_appointment_write_queues_rollup_and_invalidates_on_commit(self):
+        generation = get_generations(ADMIN_SCOPE)[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.create(doctor=self.doctor, patient=self.patient, scheduled_at=timezone.now())
+            # The rollup delta is queued with the write
+            self.assertEqual(list(Task.objects.values_list('name', flat=True)), ['appointments.apply_rollup_deltas'])
+            self.assertEqual(get_generations(ADMIN_SCOPE)[0], generation)
+
+        # The lists are invalidated by the commit, without waiting for the worker
+        self.assertGreater(get_generations(ADMIN_SCOPE)[0], generation)
+        self.assertFalse(DailyAppointmentStats.objects.exists())
+
+        run_pending()
+        self.assertEqual(DailyAppointmentStats.objects.get().appointment_count, 1)
+        self.assertFalse(Task.objects.exists())
+
+    def test_failed_invalidation_is_queued(self):
+        with mock.patch('api.appointments.cache.bump_generations', side_effect=ConnectionError):
+            with self.captureOnCommitCallbacks(execute=True):
+                Appointment.objects.create(doctor=self.doctor, patient=self.patient, scheduled_at=timezone.now())
+        self.assertEqual(
+            Task.objects.filter(name='appointments.bump_list_generations').count(), 3
+        )
+
+    def test_rollup_deltas_of_many_writes_are_summed(self):
+        morning = timezone.localtime().replace(hour=9, minute=0, second=0, microsecond=0)
+        for hour in range(3):
+            Appointment.objects.create(doctor=self.doctor, patient=self.patient, scheduled_at=morning + timedelta(hours=hour))
+        Appointment.objects.filter(doctor=self.doctor).first().delete()
+
+        run_pending()
+        self.assertEqual(DailyAppointmentStats.objects.get().appointment_count, 2)
@@ -0,0 +1,176 @@
+import threading
+import time
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from api.tasks.queue import enqueue
+from config.async_cache import async_cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings
+from .models import User
+
+# The only user fields the permission checks and querysets need
+PRINCIPAL_FIELDS = ('id', 'username', 'role', 'is_superuser', 'is_staff', 'is_active')
+PRINCIPAL_CACHE_TIMEOUT = 300  # Shared cache, invalidated when the user is saved or deleted
+PRINCIPAL_LOCAL_TTL = 5  # Per-process cache; bounds how long other processes may lag behind
+
+
+class PrincipalTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Embeds the role and admin flags in the issued tokens, so clients (and stateless
+    consumers) can tell what a token may do without asking the API.
+    """
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['role'] = user.role
+        token['is_superuser'] = user.is_superuser
+        token['is_staff'] = user.is_staff
+        return token
+
+
+class LocalPrincipalCache:
+    """
+    A small per-process TTL cache in front of the shared cache.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, user_id):
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def set(self, user_id, values):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, values)
+
+    def pop(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local_principals = LocalPrincipalCache(PRINCIPAL_LOCAL_TTL)
+
+
+def principal_cache_key(user_id):
+    return f"users:principal:{user_id}"
+
+
+def get_principal_values(user_id):
+    """
+    Return the principal fields of a user from the local cache, the shared cache or,
+    on a miss in both, a single-row SELECT. Returns None for unknown users.
+    """
+    values = local_principals.get(user_id)
+    if values is not None:
+        return values
+
+    values = cache.get(principal_cache_key(user_id))
+    if values is None:
+        values = User.objects.filter(id=user_id).values(*PRINCIPAL_FIELDS).first()
+        if values is None:
+            return None
+        cache.set(principal_cache_key(user_id), values, timeout=PRINCIPAL_CACHE_TIMEOUT)
+    local_principals.set(user_id, values)
+    return values
+
+
+async def aget_principal_values(user_id):
+    """
+    Async counterpart of get_principal_values.
+    """
+    values = local_principals.get(user_id)
+    if values is not None:
+        return values
+
+    values = await async_cache.get(principal_cache_key(user_id))
+    if values is None:
+        values = await User.objects.filter(id=user_id).values(*PRINCIPAL_FIELDS).afirst()
+        if values is None:
+            return None
+        await async_cache.set(principal_cache_key(user_id), values, timeout=PRINCIPAL_CACHE_TIMEOUT)
+    local_principals.set(user_id, values)
+    return values
+
+
+def _drop_principal(user_id):
+    cache.delete(principal_cache_key(user_id))
+    local_principals.pop(user_id)
+
+
+def invalidate_principal(user_id):
+    """
+    Drop the principal from both caches now and again once the surrounding transaction
+    commits (a concurrent read could re-cache the old row in between), so the change
+    applies on the next request. The queued task repeats the shared-cache delete in
+    case the one after the commit fails.
+    """
+    _drop_principal(user_id)
+    transaction.on_commit(lambda: _drop_principal(user_id), robust=True)
+    enqueue('users.invalidate_principals', {'user_id': user_id})
+
+
+def build_principal(values):
+    """
+    Build a User carrying only the principal fields; the rest are deferred and loaded
+    from the database only if some code actually reads them.
+    """
+    field_names = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+    return User.from_db(DEFAULT_DB_ALIAS, field_names, [values[name] for name in field_names])
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that resolves request.user from the principal caches instead of
+    selecting the whole user row on every request.
+    """
+
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            # Revocation compares the password hash, which is not part of the principal
+            return super().get_user(validated_token)
+
+        return self.principal_from_values(get_principal_values(self.user_id(validated_token)))
+
+    def user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+    def principal_from_values(self, values):
+        if values is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if not values['is_active']:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return build_principal(values)
+
+    async def aauthenticate(self, request):
+        """
+        Async counterpart of authenticate() for async views. Token checks are CPU only;
+        the principal comes from the caches. Returns (user, token) or None.
+        """
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        if api_settings.CHECK_REVOKE_TOKEN:
+            return await sync_to_async(super().get_user)(validated_token), validated_token
+        values = await aget_principal_values(self.user_id(validated_token))
+        return self.principal_from_values(values), validated_token
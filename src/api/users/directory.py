@@ -0,0 +1,120 @@
+"""
+Cached user directory behind UserListView and UserDetailView.
+
+Every user has one cache entry holding their serialized form as a compact tuple, shared
+by list pages and detail reads; it is dropped when the user is saved or deleted. List
+pages cache only the ids of their users, under a generation per role that is bumped
+when the role gains or loses a member, so registering patients leaves cached doctor
+pages alone. A warm page costs two cache round trips and no query.
+"""
+import hashlib
+import time
+from django.core.cache import cache
+from django.db import transaction
+from api.tasks.queue import enqueue
+from config.metrics import record_cache_result
+
+ENTRY_TIMEOUT = 3600
+PAGE_TIMEOUT = 300
+
+# Representation fields of UserSerializer, in the order of the cached tuples
+DIRECTORY_FIELDS = (
+    'id', 'username', 'first_name', 'last_name', 'email', 'phone_number',
+    'date_of_birth', 'gender', 'address', 'specialization', 'role',
+)
+
+
+def entry_key(user_id):
+    return f"users:directory:user:{user_id}"
+
+
+def _generation_key(role):
+    return f"users:directory:gen:{role}"
+
+
+def get_generation(role):
+    key = _generation_key(role)
+    generation = cache.get(key)
+    if generation is None:
+        # A timestamp never repeats a generation that older page keys were built with
+        cache.add(key, time.time_ns(), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_generations(*roles):
+    for role in set(roles):
+        try:
+            cache.incr(_generation_key(role))
+        except ValueError:
+            cache.add(_generation_key(role), time.time_ns(), timeout=None)
+
+
+def page_key(role, request):
+    """
+    Build the key of the list page the request asks for. The absolute URL is part of
+    it, as the cached page links are built from it.
+    """
+    url_hash = hashlib.sha1(request.build_absolute_uri().encode()).hexdigest()
+    return f"users:directory:page:{role}:{get_generation(role)}:{url_hash}"
+
+
+def get_page(key):
+    page = cache.get(key)
+    record_cache_result(page is not None)
+    return page
+
+
+def set_page(key, page):
+    cache.set(key, page, timeout=PAGE_TIMEOUT)
+
+
+def to_entry(data):
+    return tuple(data[field] for field in DIRECTORY_FIELDS)
+
+
+def from_entry(entry, fields=DIRECTORY_FIELDS):
+    return {field: value for field, value in zip(DIRECTORY_FIELDS, entry) if field in fields}
+
+
+def get_users(user_ids, fields=DIRECTORY_FIELDS):
+    """
+    Return the serialized users with the given ids that exist, in the given order and
+    limited to `fields` (the layout of a role's serializer). Entries missing from the
+    cache are loaded in one query and cached.
+    """
+    from .models import User
+    from .serializers import UserSerializer
+
+    keys = {user_id: entry_key(user_id) for user_id in user_ids}
+    found = cache.get_many(keys.values()) if keys else {}
+    entries = {user_id: found[key] for user_id, key in keys.items() if key in found}
+    missing = [user_id for user_id in keys if user_id not in entries]
+    if missing:
+        loaded = {data['id']: to_entry(data) for data in UserSerializer(User.objects.filter(id__in=missing), many=True).data}
+        cache.set_many({entry_key(user_id): entry for user_id, entry in loaded.items()}, timeout=ENTRY_TIMEOUT)
+        entries.update(loaded)
+    return [from_entry(entries[user_id], fields) for user_id in user_ids if user_id in entries]
+
+
+def get_user(user_id, fields=DIRECTORY_FIELDS):
+    users = get_users([user_id], fields)
+    return users[0] if users else None
+
+
+def invalidate_user(user_id):
+    """
+    Drop the entry of the user, now and again once the surrounding transaction commits
+    (a concurrent read could re-cache the old row in between). The queued task repeats
+    the delete in case the one after the commit fails.
+    """
+    cache.delete(entry_key(user_id))
+    transaction.on_commit(lambda: cache.delete(entry_key(user_id)), robust=True)
+    enqueue('users.invalidate_directory_entries', {'user_id': user_id})
+
+
+def invalidate_roles(*roles):
+    """
+    Queue invalidation of the cached list pages of the given roles.
+    """
+    enqueue('users.bump_directory_generations', *({'role': role} for role in sorted({role for role in roles if role})))
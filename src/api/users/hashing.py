@@ -0,0 +1,51 @@
+"""
+Password hashing for bulk registration.
+
+make_password() is deliberately slow (hundreds of milliseconds per password with the
+default PBKDF2 hasher) and holds the GIL, so threads do not help. Large batches are
+hashed in a pool of worker processes that lives as long as this process.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+
+# Below this many passwords, sending them to the pool costs more than it saves
+PARALLEL_HASH_MIN = 16
+
+_pool = None
+_pool_workers = None
+
+
+def _init_worker():
+    # Workers started with "spawn" have to load Django themselves
+    import django
+
+    django.setup()
+
+
+def hash_workers():
+    return getattr(settings, 'PASSWORD_HASH_WORKERS', None) or os.cpu_count() or 1
+
+
+def get_pool():
+    global _pool, _pool_workers
+    workers = hash_workers()
+    if _pool is None or _pool_workers != workers:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+        _pool_workers = workers
+    return _pool
+
+
+def hash_passwords(passwords):
+    """
+    Return make_password() of every password, in order. None gives an unusable password.
+    """
+    passwords = list(passwords)
+    workers = hash_workers()
+    if workers < 2 or len(passwords) < PARALLEL_HASH_MIN:
+        return [make_password(password) for password in passwords]
+    chunksize = max(1, len(passwords) // (workers * 4))
+    return list(get_pool().map(make_password, passwords, chunksize=chunksize))
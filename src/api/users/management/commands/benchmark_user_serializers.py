@@ -0,0 +1,114 @@
+import time
+from collections import Counter
+from unittest import mock
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from rest_framework import serializers
+from api.users import directory
+from api.users.models import User
+from api.users.serializers import ROLE_SERIALIZERS
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure what building user serializers costs per request: the role serializers, "
+        "whose fields are built once, against DRF's default of building them per instance, "
+        "and how many serializers the user list and detail endpoints construct. Runs inside "
+        "a transaction that is rolled back, so no data is left behind."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50, help="Doctors to create for the list pages.")
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        created_ids = []
+        try:
+            with transaction.atomic():
+                self.run(options['users'], options['repeat'], created_ids)
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            # The rolled back users' ids will be handed out again
+            cache.delete_many([directory.entry_key(user_id) for user_id in created_ids])
+            directory.bump_generations(User.DOCTOR, User.ADMIN)
+
+    def run(self, count, repeat, created_ids):
+        User.objects.bulk_create(
+            User(username=f'benchmark-doctor-{i}', email=f'benchmark-doctor-{i}@example.com', role=User.DOCTOR,
+                 first_name='Bench', specialization='Cardiology')
+            for i in range(count)
+        )
+        doctors = list(User.objects.filter(username__startswith='benchmark-doctor-').order_by('id'))
+        admin = User.objects.create_superuser('benchmark-admin', 'benchmark-admin@example.com', None)
+        created_ids.extend([admin.id] + [doctor.id for doctor in doctors])
+
+        self.stdout.write("Building a serializer and its fields:")
+        self.stdout.write(f"{'role':>10} {'per instance us':>16} {'prebuilt us':>12} {'speedup':>8}")
+        for role, serializer_class in ROLE_SERIALIZERS.items():
+            per_instance_class = type(f'PerInstance{serializer_class.__name__}', (serializers.ModelSerializer,), {
+                'Meta': serializer_class.Meta,
+            })
+            slow = self.best_of(lambda: per_instance_class(doctors[0]).fields, repeat)
+            fast = self.best_of(lambda: serializer_class(doctors[0]).fields, repeat)
+            self.stdout.write(f"{role:>10} {slow * 1e6:>16.1f} {fast * 1e6:>12.1f} {slow / fast:>7.1f}x")
+
+        self.stdout.write("\nPer request, with the directory cache cold and warm:")
+        self.stdout.write(
+            f"{'endpoint':>10} {'cold ms':>8} {'warm ms':>8} {'serializers cold':>17} {'serializers warm':>17}"
+        )
+        client = Client()
+        client.force_login(admin)
+        endpoints = {
+            'list': reverse('user-list', kwargs={'user_type': User.DOCTOR}) + f'?limit={count}',
+            'detail': reverse('user-detail', kwargs={'user_type': User.DOCTOR, 'id': doctors[0].id}),
+        }
+        # A cold request finds none of the doctors cached, seeded ones included
+        doctor_ids = list(User.objects.filter(role=User.DOCTOR).values_list('id', flat=True))
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for name, url in endpoints.items():
+                cold_built, cold = self.measure(client, url, doctor_ids, repeat, cold=True)
+                warm_built, warm = self.measure(client, url, doctor_ids, repeat, cold=False)
+                self.stdout.write(
+                    f"{name:>10} {cold * 1000:>8.2f} {warm * 1000:>8.2f} {cold_built:>17} {warm_built:>17}"
+                )
+
+    def measure(self, client, url, user_ids, repeat, cold):
+        """
+        Return the serializers one request constructs and its best time.
+        """
+        built = Counter()
+        original_init = serializers.BaseSerializer.__init__
+
+        def counting_init(serializer, *args, **kwargs):
+            built[type(serializer).__name__] += 1
+            original_init(serializer, *args, **kwargs)
+
+        timings = []
+        for _ in range(repeat):
+            if cold:
+                cache.delete_many([directory.entry_key(user_id) for user_id in user_ids])
+                directory.bump_generations(User.DOCTOR)
+            built.clear()
+            with mock.patch.object(serializers.BaseSerializer, '__init__', counting_init):
+                started = time.perf_counter()
+                client.get(url)
+                timings.append(time.perf_counter() - started)
+        return sum(built.values()), min(timings)
+
+    def best_of(self, function, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
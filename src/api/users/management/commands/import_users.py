@@ -0,0 +1,76 @@
+import csv
+from itertools import islice
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+from api.users.models import User
+from api.users.serializers import BulkRegisterSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Register doctors or patients from a CSV file whose header names the fields of a bulk "
+        "registration row (username, email, first_name, password or password_hash, ...). "
+        "Each batch is one transaction; invalid rows are reported and skipped. Importing "
+        "password_hash values or no passwords at all avoids hashing, by far the slowest step."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV file to import.")
+        parser.add_argument('--role', choices=[User.DOCTOR, User.PATIENT], default=User.PATIENT)
+        parser.add_argument('--batch-size', type=int, default=BulkRegisterSerializer.MAX_ROWS)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if not 1 <= batch_size <= BulkRegisterSerializer.MAX_ROWS:
+            raise CommandError(f"--batch-size must be between 1 and {BulkRegisterSerializer.MAX_ROWS}.")
+
+        created = rejected = 0
+        with open(options['path'], newline='', encoding='utf-8') as csv_file:
+            reader = csv.DictReader(csv_file)
+            # Line 1 is the header
+            line = 2
+            while batch := list(islice(reader, batch_size)):
+                # Empty cells are missing values, not empty strings
+                rows = [{field: value for field, value in row.items() if value not in ('', None)} for row in batch]
+                batch_created = self.import_batch(rows, line, options['role'])
+                created += batch_created
+                rejected += len(rows) - batch_created
+                line += len(rows)
+                self.stdout.write(f"{created} users imported, {rejected} rows rejected")
+
+        self.stdout.write(self.style.SUCCESS(f"Imported {created} {options['role']}s; rejected {rejected} rows."))
+
+    def import_batch(self, rows, first_line, role):
+        """
+        Register the valid rows of one batch and return how many users were created.
+        """
+        serializer = BulkRegisterSerializer(data={'users': rows})
+        if not serializer.is_valid():
+            valid_rows = self.valid_rows(rows, serializer.errors, first_line)
+            if not valid_rows:
+                return 0
+            # Validated again, as other users may have been registered in the meantime
+            serializer = BulkRegisterSerializer(data={'users': valid_rows})
+            if not serializer.is_valid():
+                self.stderr.write(f"Lines {first_line}-{first_line + len(rows) - 1}: {serializer.errors}")
+                return 0
+        try:
+            return len(serializer.save(role=role))
+        except ValidationError as exc:
+            self.stderr.write(f"Lines {first_line}-{first_line + len(rows) - 1}: {exc.detail}")
+            return 0
+
+    def valid_rows(self, rows, errors, first_line):
+        """
+        Return the rows of the batch without validation errors, reporting the others.
+        """
+        row_errors = errors.get('users')
+        if not isinstance(row_errors, list):
+            raise CommandError(f"Lines {first_line}-{first_line + len(rows) - 1}: {errors}")
+        valid = []
+        for offset, (row, errors) in enumerate(zip(rows, row_errors)):
+            if errors:
+                self.stderr.write(f"Line {first_line + offset}: {errors}")
+            else:
+                valid.append(row)
+        return valid
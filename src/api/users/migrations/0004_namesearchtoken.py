@@ -0,0 +1,58 @@
+# Generated by Django 5.1.1 on 2026-10-18 11:18
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def name_prefixes(*names):
+    """
+    Frozen copy of api.users.search.name_prefixes as of this migration, so later
+    changes to the tokenization do not change what it indexes.
+    """
+    decomposed = unicodedata.normalize('NFKD', ' '.join(name for name in names if name))
+    normalized = ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+    prefixes = set()
+    for word in re.findall(r'\w+', normalized):
+        word = word[:30]
+        prefixes.update(word[:length] for length in range(1, len(word) + 1))
+    return prefixes
+
+
+def index_doctor_names(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    NameSearchToken = apps.get_model('users', 'NameSearchToken')
+    doctors = User.objects.filter(role='doctor').values_list('id', 'first_name', 'last_name')
+    NameSearchToken.objects.bulk_create(
+        (
+            NameSearchToken(user_id=user_id, prefix=prefix)
+            for user_id, first_name, last_name in doctors.iterator()
+            for prefix in name_prefixes(first_name, last_name)
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_alter_user_email_alter_user_phone_number'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NameSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(max_length=30)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='name_search_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('prefix', 'user')},
+            },
+        ),
+        migrations.RunPython(index_doctor_names, migrations.RunPython.noop),
+    ]
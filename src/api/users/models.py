@@ -1,6 +1,10 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
 from django.shortcuts import get_object_or_404
+from .search import MAX_PREFIX_LENGTH, name_prefixes
+
+# Fields that decide whether and how a user is indexed for name search
+NAME_STATE_FIELDS = {'role', 'first_name', 'last_name'}
 
 class User(AbstractUser):
     # Define choices for the role field
@@ -26,14 +30,50 @@ class User(AbstractUser):
     # Role field with choices
     role = models.CharField(max_length=50, choices=ROLE_CHOICES, default=PATIENT)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Directory pages list one role ordered by id
+            models.Index(fields=['role', 'id'], name='users_user_role_id_idx'),
+        ]
+
     def __str__(self):
         return self.username  # Use username or another field for the string representation
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_name_state = instance.name_state()
+        return instance
+
+    def name_state(self):
+        return (self.__dict__.get('role'), self.__dict__.get('first_name'), self.__dict__.get('last_name'))
+
     def save(self, *args, **kwargs):
         # Automatically assign the 'admin' role if the user is a superuser
         if self.is_superuser:
             self.role = self.ADMIN
-        super().save(*args, **kwargs)
+        created = self._state.adding
+        # The name index and the post_save receivers' writes (change record) commit with the row
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and not NAME_STATE_FIELDS.intersection(update_fields):
+                return
+            if self.name_state() != getattr(self, '_loaded_name_state', None):
+                self.sync_name_search_tokens(created=created)
+                self._loaded_name_state = self.name_state()
+
+    def sync_name_search_tokens(self, created=False):
+        """
+        Rebuild the name prefixes doctors are searched by; other roles are not indexed.
+        """
+        if not created:
+            NameSearchToken.objects.filter(user=self).delete()
+        if self.role == self.DOCTOR:
+            NameSearchToken.objects.bulk_create(
+                NameSearchToken(user=self, prefix=prefix) for prefix in name_prefixes(self.first_name, self.last_name)
+            )
 
     @classmethod
     def get_by_role(cls, role):
@@ -42,3 +82,16 @@ class User(AbstractUser):
     @classmethod
     def get_by_id(cls, user_id):
         return get_object_or_404(cls, id=user_id)
+
+
+class NameSearchToken(models.Model):
+    """
+    One prefix of one word of a doctor's name. Searching a name is an equality lookup on
+    (prefix, user), which stays fast with many doctors and never needs a leading-wildcard
+    LIKE over the users table.
+    """
+    user = models.ForeignKey(User, related_name="name_search_tokens", on_delete=models.CASCADE)
+    prefix = models.CharField(max_length=MAX_PREFIX_LENGTH)
+
+    class Meta:
+        unique_together = ('prefix', 'user')
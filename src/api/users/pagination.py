@@ -0,0 +1,11 @@
+from rest_framework.pagination import CursorPagination
+from api.appointments.pagination import OptInCursorPagination
+
+
+class UserCursorPagination(CursorPagination):
+    ordering = ('id',)
+    page_size_query_param = 'limit'
+
+
+class UserPagination(OptInCursorPagination):
+    cursor_pagination_class = UserCursorPagination
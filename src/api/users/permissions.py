@@ -1,8 +1,16 @@
-
 from rest_framework import permissions
 class IsOwnerOrAdmin(permissions.BasePermission):
+    """
+    Owners may read their own user, admins may do anything. Decided from the id in the
+    URL, so a forbidden request is refused before the user is loaded.
+    """
     def has_permission(self, request, view):
-        return super().has_permission(request, view)    
+        if not request.user.is_authenticated:
+            return False
+        if request.user.is_superuser:
+            return True
+        return request.method in permissions.SAFE_METHODS and request.user.id == view.kwargs.get('id')
+
     def has_object_permission(self, request, view, obj):
         if not request.user.is_authenticated:
             return False
@@ -0,0 +1,48 @@
+import re
+import unicodedata
+
+# Longest name prefix that is indexed; longer search terms match on their first characters.
+MAX_PREFIX_LENGTH = 30
+
+WORD_RE = re.compile(r'\w+')
+
+
+def normalize_name(value):
+    """
+    Case-fold a name and strip accents, so "José" and "jose" index the same way.
+    """
+    decomposed = unicodedata.normalize('NFKD', value or '')
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def name_prefixes(*names):
+    """
+    Return every prefix (edge n-gram) of every word in the given names.
+    """
+    prefixes = set()
+    for word in WORD_RE.findall(normalize_name(' '.join(name for name in names if name))):
+        word = word[:MAX_PREFIX_LENGTH]
+        prefixes.update(word[:length] for length in range(1, len(word) + 1))
+    return prefixes
+
+
+def query_tokens(value):
+    return {word[:MAX_PREFIX_LENGTH] for word in WORD_RE.findall(normalize_name(value))}
+
+
+def name_search_q(value, field='id'):
+    """
+    Return a Q matching rows whose `field` points at a doctor with a name word starting
+    with every word of `value`. Each word is an equality lookup on the prefix index, so
+    the search never scans the users or appointments table.
+    """
+    from django.db.models import Q
+    from .models import NameSearchToken
+
+    tokens = query_tokens(value)
+    if not tokens:
+        return Q(**{f'{field}__in': []})
+    condition = Q()
+    for token in tokens:
+        condition &= Q(**{f'{field}__in': NameSearchToken.objects.filter(prefix=token).values('user_id')})
+    return condition
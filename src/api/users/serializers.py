@@ -1,14 +1,66 @@
+import copy
+from contextlib import contextmanager
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from rest_framework.exceptions import ValidationError
-from django.db import transaction
+from django.contrib.auth.hashers import identify_hasher
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.db import IntegrityError, transaction
 from django.db.models import Q
+from api.outbox.feed import record_instances
+from api.outbox.models import Change
+from . import directory
+from .hashing import hash_passwords
+from .models import NameSearchToken
+from .search import name_prefixes
 
 User = get_user_model()
 
-class UserSerializer(serializers.ModelSerializer):
+UNIQUE_FIELD_MESSAGES = {
+    'username': 'Username is already taken.',
+    'email': 'Email is already taken.',
+}
+
+
+@contextmanager
+def unique_field_errors():
+    """
+    Turn a unique constraint violation on username or email, from a concurrent
+    registration that passed validate() at the same time, into a field error.
+    """
+    try:
+        yield
+    except IntegrityError as exc:
+        # SQLite names the column ("users_user.email"), PostgreSQL the constraint ("users_user_email_key")
+        message = str(exc)
+        errors = {
+            field: error for field, error in UNIQUE_FIELD_MESSAGES.items()
+            if f'{User._meta.db_table}.{field}' in message or f'{User._meta.db_table}_{field}_' in message
+        }
+        if not errors:
+            raise
+        raise ValidationError(errors) from exc
+
+
+class PrebuiltFieldsMixin:
+    """
+    Build a serializer class's fields once instead of on every instantiation. DRF
+    rebuilds a ModelSerializer's fields from the model for each instance; with this the
+    first instance builds them and later ones get a copy.
     """
-    Serializer for the User model, with conditional fields.
+
+    def get_fields(self):
+        layout = type(self).__dict__.get('_field_layout')
+        if layout is None:
+            layout = super().get_fields()
+            type(self)._field_layout = layout
+        # Fields are bound to the serializer that uses them, so each instance needs its own
+        return copy.deepcopy(layout)
+
+
+class UserSerializer(PrebuiltFieldsMixin, serializers.ModelSerializer):
+    """
+    Serializer for the User model. Views use the role-specific subclasses below.
     """
     class Meta:
         model = User
@@ -17,59 +69,206 @@ class UserSerializer(serializers.ModelSerializer):
         extra_kwargs = {
             'password': {'write_only': True, 'required': False},  # Password not required for update
             'specialization': {'required': False},  # Specialization not required for non-doctors
+            # Uniqueness is checked by validate() in one query instead of one per field
+            'username': {'validators': [UnicodeUsernameValidator()]},
+            'email': {'validators': []},
         }
 
-    def __init__(self, *args, **kwargs):
-        super(UserSerializer, self).__init__(*args, **kwargs)
-        request = self.context.get('request', None)
-
-        if request:
-            user_type = request.parser_context['kwargs'].get('user_type').lower()
-            if user_type != User.DOCTOR:
-                # If the user is not a doctor, remove the specialization field
-                self.fields.pop('specialization', None)
-
     def validate(self, data):
         """
-        Perform bulk validation for both email and username to avoid duplicate queries.
+        Check email and username against other users in one query that also tells which
+        of them collided. The unique constraints remain the race-safe check on save.
         """
         email = data.get('email', None)
         username = data.get('username', None)
-        user_id = self.instance.id if self.instance else None
+        if not email and not username:
+            return data
 
-        # If both email and username are provided, perform a bulk query
-        if email or username:
-            # Construct a query to check if either email or username already exists (excluding the current instance)
-            filters = Q()
-            if email:
-                filters |= Q(email=email)
-            if username:
-                filters |= Q(username=username)
-            
-            # Exclude the current instance when updating
-            if user_id:
-                filters &= ~Q(id=user_id)
-
-            # Check if any other user exists with the same email or username
-            if User.objects.filter(filters).exists():
-                if email and User.objects.filter(email=email).exclude(id=user_id).exists():
-                    raise ValidationError({'email': 'Email is already taken.'})
-                if username and User.objects.filter(username=username).exclude(id=user_id).exists():
-                    raise ValidationError({'username': 'Username is already taken.'})
+        filters = Q()
+        if email:
+            filters |= Q(email=email)
+        if username:
+            filters |= Q(username=username)
+        taken = User.objects.filter(filters)
+        if self.instance:
+            taken = taken.exclude(id=self.instance.id)
 
+        errors = {}
+        # At most one user can hold each value, so two rows cover every collision
+        for taken_username, taken_email in taken.values_list('username', 'email')[:2]:
+            if email and taken_email == email:
+                errors['email'] = 'Email is already taken.'
+            if username and taken_username == username:
+                errors['username'] = 'Username is already taken.'
+        if errors:
+            raise ValidationError(errors)
         return data
 
-    @transaction.atomic
     def create(self, validated_data):
         user = User(**validated_data)
         user.set_password(validated_data['password'])
-        user.save()
+        with unique_field_errors():
+            with transaction.atomic():
+                user.save()
         return user
 
-    @transaction.atomic
     def update(self, instance, validated_data):
         password = validated_data.pop('password', None)
         if password:
             instance.set_password(password)
-        
-        return super().update(instance, validated_data)
+
+        with unique_field_errors():
+            with transaction.atomic():
+                return super().update(instance, validated_data)
+
+
+
+class DoctorSerializer(UserSerializer):
+    """
+    Serializer for doctors, the only users with a specialization.
+    """
+
+
+class PatientSerializer(UserSerializer):
+    """
+    Serializer for patients.
+    """
+    class Meta(UserSerializer.Meta):
+        fields = [field for field in UserSerializer.Meta.fields if field != 'specialization']
+
+
+class AdminSerializer(UserSerializer):
+    """
+    Serializer for admins.
+    """
+    class Meta(PatientSerializer.Meta):
+        pass
+
+
+ROLE_SERIALIZERS = {
+    User.DOCTOR: DoctorSerializer,
+    User.PATIENT: PatientSerializer,
+    User.ADMIN: AdminSerializer,
+}
+
+
+def serializer_for_role(role):
+    """
+    Return the serializer class of the role; unknown roles get the patient layout.
+    """
+    return ROLE_SERIALIZERS.get(role.lower(), PatientSerializer)
+
+class UserRowSerializer(serializers.ModelSerializer):
+    """
+    Serializer for one user of a bulk registration. Only checks the shape of the row;
+    uniqueness is checked for the whole batch at once by BulkRegisterSerializer.
+
+    A row carries a plain `password` to hash, the `password_hash` of a migrated account
+    in any format of PASSWORD_HASHERS, or neither for an unusable password.
+    """
+    password = serializers.CharField(required=False, write_only=True)
+    password_hash = serializers.CharField(required=False, write_only=True, max_length=128)
+
+    class Meta:
+        model = User
+        fields = ['username', 'first_name', 'last_name', 'email', 'password', 'password_hash', 'phone_number',
+                  'date_of_birth', 'gender', 'address', 'specialization']
+        extra_kwargs = {
+            'specialization': {'required': False},
+            'username': {'validators': [UnicodeUsernameValidator()]},
+            'email': {'validators': []},
+        }
+
+    def validate_password_hash(self, value):
+        try:
+            identify_hasher(value)
+        except ValueError:
+            raise ValidationError("Unknown password hash format.")
+        return value
+
+    def validate(self, data):
+        if 'password' in data and 'password_hash' in data:
+            raise ValidationError("Provide either password or password_hash, not both.")
+        return data
+
+
+class BulkRegisterSerializer(serializers.Serializer):
+    """
+    Serializer for registering many users of one role in one transaction. Errors are
+    reported per row, as a list aligned with the submitted users. Usernames and emails
+    are checked against the database in one query for the whole batch.
+    """
+    MAX_ROWS = 1000
+
+    users = UserRowSerializer(many=True, allow_empty=False, max_length=MAX_ROWS)
+
+    def validate_users(self, rows):
+        errors = self.conflicts(rows)
+        if any(errors):
+            raise ValidationError(errors)
+        return rows
+
+    def conflicts(self, rows):
+        """
+        Return the uniqueness errors of every row, within the batch and against the database.
+        """
+        usernames = {row['username'] for row in rows}
+        emails = {row['email'] for row in rows if row.get('email')}
+        taken_usernames, taken_emails = set(), set()
+        for username, email in User.objects.filter(Q(username__in=usernames) | Q(email__in=emails)).values_list('username', 'email'):
+            taken_usernames.add(username)
+            taken_emails.add(email)
+
+        errors = []
+        seen_usernames, seen_emails = set(), set()
+        for row in rows:
+            row_errors = {}
+            username, email = row['username'], row.get('email')
+            if username in taken_usernames:
+                row_errors['username'] = [UNIQUE_FIELD_MESSAGES['username']]
+            elif username in seen_usernames:
+                row_errors['username'] = ["Username appears more than once in this batch."]
+            if email and email in taken_emails:
+                row_errors['email'] = [UNIQUE_FIELD_MESSAGES['email']]
+            elif email and email in seen_emails:
+                row_errors['email'] = ["Email appears more than once in this batch."]
+            seen_usernames.add(username)
+            if email:
+                seen_emails.add(email)
+            errors.append(row_errors)
+        return errors
+
+    def create(self, validated_data):
+        rows = validated_data['users']
+        role = validated_data['role']
+        # Hash outside the transaction; it takes far longer than the inserts
+        to_hash = [row for row in rows if 'password_hash' not in row]
+        for row, password in zip(to_hash, hash_passwords(row.get('password') for row in to_hash)):
+            row['password_hash'] = password
+
+        users = []
+        for row in rows:
+            fields = {field: value for field, value in row.items() if field not in ('password', 'password_hash')}
+            if role != User.DOCTOR:
+                fields.pop('specialization', None)
+            users.append(User(role=role, password=row['password_hash'], **fields))
+
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create(users)
+                # bulk_create skips User.save(), which indexes doctors for name search
+                if role == User.DOCTOR:
+                    NameSearchToken.objects.bulk_create(
+                        NameSearchToken(user=user, prefix=prefix)
+                        for user in users for prefix in name_prefixes(user.first_name, user.last_name)
+                    )
+                # bulk_create sends no signals either
+                directory.invalidate_roles(role)
+                record_instances(users, Change.CREATE)
+        except IntegrityError:
+            # Users registered concurrently since validation; report which rows now collide
+            errors = self.conflicts(rows)
+            if not any(errors):
+                raise
+            raise ValidationError({'users': errors})
+        return users
@@ -0,0 +1,35 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from . import directory
+from .models import User
+from .authentication import invalidate_principal
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Drop the cached principal, so role changes and deactivations apply on the next request,
+    and the user's directory entry. List pages only change when a role gains or loses a member.
+    """
+    if created:
+        directory.invalidate_roles(instance.role)
+        return
+    invalidate_principal(instance.pk)
+
+    if update_fields is not None and not set(update_fields) & set(directory.DIRECTORY_FIELDS):
+        return
+    directory.invalidate_user(instance.pk)
+    # The role the instance was loaded with; unknown for instances not read from the database
+    loaded_state = getattr(instance, '_loaded_name_state', None)
+    if loaded_state is None:
+        directory.invalidate_roles(*(role for role, _ in User.ROLE_CHOICES))
+    elif loaded_state[0] != instance.role:
+        directory.invalidate_roles(loaded_state[0], instance.role)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    user_id = instance.pk
+    invalidate_principal(user_id)
+    directory.invalidate_user(user_id)
+    directory.invalidate_roles(instance.role)
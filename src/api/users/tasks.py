@@ -0,0 +1,30 @@
+from django.core.cache import cache
+from api.tasks.queue import task
+from . import directory
+from .authentication import principal_cache_key
+
+
+@task('users.invalidate_principals', dedupe=True)
+def invalidate_principals(payloads):
+    """
+    Drop the queued users' principals from the shared cache, should the delete after
+    the commit have failed.
+    """
+    cache.delete_many([principal_cache_key(payload['user_id']) for payload in payloads])
+
+
+@task('users.invalidate_directory_entries', dedupe=True)
+def invalidate_directory_entries(payloads):
+    """
+    Drop the queued users' directory entries, should the delete after the commit have
+    failed.
+    """
+    cache.delete_many([directory.entry_key(payload['user_id']) for payload in payloads])
+
+
+@task('users.bump_directory_generations', dedupe=True)
+def bump_directory_generations(payloads):
+    """
+    Invalidate the cached directory pages of the queued roles.
+    """
+    directory.bump_generations(*(payload['role'] for payload in payloads))
@@ -0,0 +1,93 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+from api.users.authentication import local_principals
+from api.users.models import User
+
+
+class CachedJWTAuthenticationTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        local_principals.clear()
+        self.admin = User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        self.doctor = User.objects.create_user('doctor', 'doctor@test.com', 'password', role=User.DOCTOR)
+
+    def obtain_access_token(self, username):
+        response = self.client.post(reverse('token_obtain_pair'), {'username': username, 'password': 'password'})
+        self.assertEqual(response.status_code, 200)
+        return response.data['access']
+
+    def get_appointments(self, token):
+        return self.client.get(reverse('appointment-list'), HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def get_cache_stats(self, token):
+        return self.client.get(reverse('appointment-cache-stats'), HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def user_table_queries(self, context):
+        return [query['sql'] for query in context.captured_queries if '"users_user"' in query['sql']]
+
+    def test_token_carries_role_claims(self):
+        token = AccessToken(self.obtain_access_token('doctor'))
+        self.assertEqual(token['role'], User.DOCTOR)
+        self.assertFalse(token['is_superuser'])
+        self.assertTrue(AccessToken(self.obtain_access_token('admin'))['is_superuser'])
+
+    def test_repeated_requests_skip_user_table(self):
+        token = self.obtain_access_token('admin')
+        self.assertEqual(self.get_appointments(token).status_code, 200)
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.get_appointments(token)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.user_table_queries(context), [])
+
+    def test_shared_cache_is_used_when_local_cache_is_cold(self):
+        token = self.obtain_access_token('admin')
+        self.get_appointments(token)
+        local_principals.clear()
+
+        with CaptureQueriesContext(connection) as context:
+            self.get_appointments(token)
+        self.assertEqual(self.user_table_queries(context), [])
+
+    def test_role_change_is_picked_up(self):
+        token = self.obtain_access_token('doctor')
+        self.assertEqual(self.get_cache_stats(token).status_code, 403)
+
+        self.doctor.is_staff = self.doctor.is_superuser = True
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor.save()
+        self.assertEqual(self.get_cache_stats(token).status_code, 200)
+
+    def test_deactivated_user_is_rejected(self):
+        token = self.obtain_access_token('admin')
+        self.assertEqual(self.get_appointments(token).status_code, 200)
+
+        self.admin.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin.save(update_fields=['is_active'])
+        self.assertEqual(self.get_appointments(token).status_code, 401)
+
+    def test_deleted_user_is_rejected(self):
+        token = self.obtain_access_token('doctor')
+        self.get_appointments(token)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor.delete()
+        self.assertEqual(self.get_appointments(token).status_code, 401)
+
+    @override_settings(TASKS_EAGER=False)
+    def test_deactivation_does_not_wait_for_the_task_worker(self):
+        token = self.obtain_access_token('admin')
+        self.assertEqual(self.get_cache_stats(token).status_code, 200)
+
+        self.admin.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin.save(update_fields=['is_active'])
+        # As in another process: only the shared cache is left
+        local_principals.clear()
+        self.assertEqual(self.get_cache_stats(token).status_code, 401)
@@ -0,0 +1,143 @@
+import tempfile
+from io import StringIO
+from unittest import mock
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.management import call_command
+from django.urls import reverse
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APITestCase, APIClient
+from api.users import hashing
+from api.users.models import NameSearchToken, User
+from api.users.serializers import BulkRegisterSerializer
+from api.users.views import BulkRegisterView
+from config.query_budget import QueryBudgetTestMixin
+
+
+class BulkRegisterViewTests(QueryBudgetTestMixin, APITestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        User.objects.create_user('taken', 'taken@test.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def url(self, user_type='patient'):
+        return reverse('auth_register_bulk', kwargs={'user_type': user_type})
+
+    def test_register_many_patients(self):
+        legacy_hash = make_password('legacy-secret')
+        users = [
+            {'username': 'plain', 'email': 'plain@test.com', 'password': 'secret-1'},
+            {'username': 'migrated', 'email': 'migrated@test.com', 'password_hash': legacy_hash},
+            {'username': 'nopassword', 'first_name': 'Nia'},
+        ]
+        response = self.client.post(self.url(), {'users': users}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertEqual(response.data['created'], 3)
+
+        created = {user.username: user for user in User.objects.filter(id__in=response.data['ids'])}
+        self.assertTrue(all(user.role == User.PATIENT for user in created.values()))
+        self.assertTrue(check_password('secret-1', created['plain'].password))
+        self.assertEqual(created['migrated'].password, legacy_hash)
+        self.assertFalse(created['nopassword'].has_usable_password())
+        self.assertEqual(created['nopassword'].first_name, 'Nia')
+
+    def test_doctors_are_indexed_for_name_search(self):
+        users = [{'username': 'doc', 'first_name': 'Ann', 'last_name': 'Lee', 'specialization': 'Cardiology'}]
+        response = self.client.post(self.url('doctor'), {'users': users}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        doctor = User.objects.get(username='doc')
+        self.assertEqual(doctor.role, User.DOCTOR)
+        self.assertEqual(doctor.specialization, 'Cardiology')
+        self.assertEqual(set(NameSearchToken.objects.filter(user=doctor).values_list('prefix', flat=True)),
+                         {'a', 'an', 'ann', 'l', 'le', 'lee'})
+
+    def test_conflicts_are_reported_per_row(self):
+        users = [
+            {'username': 'fresh', 'email': 'fresh@test.com'},
+            {'username': 'taken'},
+            {'username': 'other', 'email': 'taken@test.com'},
+            {'username': 'fresh'},
+        ]
+        response = self.client.post(self.url(), {'users': users}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = response.data['users']
+        self.assertEqual(errors[0], {})
+        self.assertEqual(set(errors[1]), {'username'})
+        self.assertEqual(set(errors[2]), {'email'})
+        self.assertEqual(set(errors[3]), {'username'})
+        self.assertFalse(User.objects.filter(username='fresh').exists())
+
+    def test_rows_are_checked_for_shape(self):
+        users = [
+            {'username': 'fine'},
+            {'username': 'bad', 'password_hash': 'not-a-hash'},
+            {'username': 'both', 'password': 'a', 'password_hash': make_password('b')},
+        ]
+        response = self.client.post(self.url(), {'users': users}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = response.data['users']
+        self.assertEqual(errors[0], {})
+        self.assertEqual(set(errors[1]), {'password_hash'})
+        self.assertEqual(set(errors[2]), {'non_field_errors'})
+
+    def test_constraint_violation_is_reported_per_row(self):
+        # Someone registered "taken" after the batch was validated
+        with mock.patch.object(BulkRegisterSerializer, 'validate_users', lambda self, rows: rows):
+            response = self.client.post(self.url(), {'users': [{'username': 'fresh'}, {'username': 'taken'}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['users'][0], {})
+        self.assertEqual(set(response.data['users'][1]), {'username'})
+        self.assertFalse(User.objects.filter(username='fresh').exists())
+
+    def test_admin_only_and_role_checked(self):
+        response = self.client.post(self.url('admin'), {'users': [{'username': 'x'}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.client.force_authenticate(user=User.objects.get(username='taken'))
+        response = self.client.post(self.url(), {'users': [{'username': 'x'}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        users = [{'username': f'user{i}', 'email': f'user{i}@test.com'} for i in range(20)]
+        response = self.assertWithinQueryBudget(BulkRegisterView, 'POST', self.url('doctor'), {'users': users}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+
+
+class PasswordHashingTests(APITestCase):
+
+    @override_settings(PASSWORD_HASH_WORKERS=2)
+    def test_large_batches_are_hashed_in_worker_processes(self):
+        passwords = [f'secret-{i}' for i in range(hashing.PARALLEL_HASH_MIN)] + [None]
+        with mock.patch.object(hashing, 'get_pool', wraps=hashing.get_pool) as get_pool:
+            hashes = hashing.hash_passwords(passwords)
+        get_pool.assert_called_once()
+        self.assertEqual(len(hashes), len(passwords))
+        for password, hashed in zip(passwords[:-1], hashes):
+            self.assertTrue(check_password(password, hashed))
+        self.assertTrue(hashes[-1].startswith('!'))
+
+    def test_small_batches_are_hashed_in_process(self):
+        with mock.patch.object(hashing, 'get_pool') as get_pool:
+            hashes = hashing.hash_passwords(['one', 'two'])
+        get_pool.assert_not_called()
+        self.assertTrue(check_password('two', hashes[1]))
+
+
+class ImportUsersCommandTests(APITestCase):
+
+    def test_import_skips_invalid_rows(self):
+        User.objects.create_user('taken', 'taken@test.com', 'password')
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as csv_file:
+            csv_file.write('username,email,first_name,password\n')
+            csv_file.write('ann,ann@test.com,Ann,\n')
+            csv_file.write('taken,,Bob,\n')
+            csv_file.write('cy,cy@test.com,Cy,secret\n')
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_users', csv_file.name, batch_size=2, stdout=stdout, stderr=stderr)
+
+        self.assertEqual(set(User.objects.filter(role=User.PATIENT).values_list('username', flat=True)) - {'taken'},
+                         {'ann', 'cy'})
+        self.assertIn('Line 3', stderr.getvalue())
+        self.assertIn('Imported 2 patients; rejected 1 rows.', stdout.getvalue())
+        self.assertFalse(User.objects.get(username='ann').has_usable_password())
@@ -2,10 +2,14 @@ from rest_framework.test import APITestCase, APIClient
 from django.urls import reverse
 from api.users.models import User
 from rest_framework import status
+from django.core.cache import cache
+
 
 class UserDetailViewTests(APITestCase):
 
     def setUp(self):
+        # Directory entries are keyed by user id, which the next test may reuse
+        cache.clear()
         self.admin = User.objects.create_superuser('admin', 'admin@test.com', 'password')
         self.doctor = User.objects.create_user('doctor', 'doctor@test.com', 'password')
         self.patient = User.objects.create_user('patient', 'patient@test.com', 'password')
@@ -0,0 +1,117 @@
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from api.users import directory
+from api.users.models import User
+from api.users.serializers import UserSerializer
+
+
+class UserDirectoryTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        self.doctors = [
+            User.objects.create_user(f'doctor{i}', f'doctor{i}@test.com', 'password', role=User.DOCTOR,
+                                     first_name='Ann', specialization='Cardiology')
+            for i in range(3)
+        ]
+        self.patient = User.objects.create_user('patient', 'patient@test.com', 'password', role=User.PATIENT)
+        self.client.force_authenticate(user=self.admin)
+
+    def list_url(self, role='doctor', query='?limit=10'):
+        return reverse('user-list', kwargs={'user_type': role}) + query
+
+    def detail_url(self, user, role='doctor'):
+        return reverse('user-detail', kwargs={'user_type': role, 'id': user.id})
+
+    def save(self, user, **changes):
+        for field, value in changes.items():
+            setattr(user, field, value)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+
+    def test_list_matches_serializer_and_is_cached(self):
+        response = self.client.get(self.list_url())
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(response.data['results'], UserSerializer(self.doctors, many=True).data)
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.list_url())
+        self.assertEqual(cached.data, response.data)
+
+        # Only doctors have a specialization
+        response = self.client.get(self.list_url('patient'))
+        self.assertNotIn('specialization', response.data['results'][0])
+
+    def test_cursor_pages_are_cached(self):
+        url = self.list_url(query='?pagination=cursor&limit=2')
+        response = self.client.get(url)
+        self.assertEqual([row['id'] for row in response.data['results']], [doctor.id for doctor in self.doctors[:2]])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).data, response.data)
+
+    def test_edits_refresh_only_the_users_entry(self):
+        self.client.get(self.list_url())
+        generation = directory.get_generation(User.DOCTOR)
+        self.save(self.doctors[1], email='renamed@test.com')
+        self.assertEqual(directory.get_generation(User.DOCTOR), generation)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.list_url())
+        self.assertEqual(response.data['results'][1]['email'], 'renamed@test.com')
+        self.assertEqual(self.client.get(self.detail_url(self.doctors[1])).data['email'], 'renamed@test.com')
+
+    def test_membership_changes_invalidate_only_their_roles(self):
+        self.client.get(self.list_url())
+        self.client.get(self.list_url('patient'))
+        doctor_generation = directory.get_generation(User.DOCTOR)
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create_user('patient2', 'patient2@test.com', 'password', role=User.PATIENT)
+        self.assertEqual(directory.get_generation(User.DOCTOR), doctor_generation)
+        self.assertEqual(self.client.get(self.list_url('patient')).data['count'], 2)
+
+        self.save(self.doctors[0], role=User.PATIENT)
+        self.assertEqual(self.client.get(self.list_url()).data['count'], 2)
+        self.assertEqual(self.client.get(self.list_url('patient')).data['count'], 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctors[1].delete()
+        self.assertEqual(self.client.get(self.list_url()).data['count'], 1)
+
+    def test_bulk_registration_invalidates_the_role(self):
+        self.client.get(self.list_url('patient'))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('auth_register_bulk', kwargs={'user_type': 'patient'}),
+                                        {'users': [{'username': 'bulk1'}, {'username': 'bulk2'}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.client.get(self.list_url('patient')).data['count'], 3)
+
+    def test_detail_reads_from_the_directory(self):
+        doctor = self.doctors[0]
+        response = self.client.get(self.detail_url(doctor))
+        self.assertEqual(response.data, UserSerializer(doctor).data)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.detail_url(doctor)).data, response.data)
+        # A cached user is still only found under their role
+        response = self.client.get(self.detail_url(doctor, role='patient'))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_forbidden_detail_requests_run_no_queries(self):
+        self.client.force_authenticate(user=self.patient)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.detail_url(self.doctors[0]))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        with self.assertNumQueries(0):
+            response = self.client.patch(self.detail_url(self.patient, role='patient'), {'first_name': 'Pat'})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.get(self.detail_url(self.patient, role='patient'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('specialization', response.data)
+
+    @override_settings(TASKS_EAGER=False)
+    def test_edits_do_not_wait_for_the_task_worker(self):
+        doctor = self.doctors[0]
+        self.client.get(self.detail_url(doctor))
+        self.save(doctor, email='new@test.com')
+        self.assertEqual(self.client.get(self.detail_url(doctor)).data['email'], 'new@test.com')
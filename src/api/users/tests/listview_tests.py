@@ -2,10 +2,14 @@ from rest_framework.test import APITestCase, APIClient
 from django.urls import reverse
 from api.users.models import User
 from rest_framework import status
+from django.core.cache import cache
+
 
 class UserListViewTests(APITestCase):
 
     def setUp(self):
+        # Directory entries are keyed by user id, which the next test may reuse
+        cache.clear()
         self.admin = User.objects.create_superuser('admin', 'admin@test.com', 'password')
         self.doctor = User.objects.create_user('doctor', 'doctor@test.com', 'password')
         self.patient = User.objects.create_user('patient', 'patient@test.com', 'password')
@@ -39,3 +43,15 @@ class UserListViewTests(APITestCase):
         url = reverse('user-list', kwargs={'user_type': 'invalid_role'}) + '?page=1'
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_list_users_with_cursor_pagination(self):
+        self.client.force_authenticate(user=self.admin)
+        url = reverse('user-list', kwargs={'user_type': 'doctor'}) + '?pagination=cursor&limit=1'
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            ids.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(ids, [self.doctor.id, self.extra_doctor.id])
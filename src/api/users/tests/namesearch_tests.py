@@ -0,0 +1,49 @@
+from django.core.cache import cache
+from rest_framework.test import APITestCase
+from api.users.models import User, NameSearchToken
+from api.users.search import name_prefixes, name_search_q
+
+
+class NameSearchTokenTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.doctor = User.objects.create_user(
+            'doctor', 'doctor@test.com', 'password', role=User.DOCTOR, first_name='José', last_name='Van Helsing'
+        )
+        self.patient = User.objects.create_user(
+            'patient', 'patient@test.com', 'password', role=User.PATIENT, first_name='Josephine'
+        )
+
+    def search(self, value):
+        return list(User.objects.filter(name_search_q(value)).values_list('id', flat=True))
+
+    def test_prefixes_are_normalized(self):
+        self.assertEqual(name_prefixes('Jo'), {'j', 'jo'})
+        self.assertIn('jose', name_prefixes('José'))
+
+    def test_doctor_is_found_by_word_prefixes(self):
+        self.assertEqual(self.search('jos'), [self.doctor.id])
+        self.assertEqual(self.search('HELS'), [self.doctor.id])
+        self.assertEqual(self.search('van hel'), [self.doctor.id])
+        self.assertEqual(self.search('jose smith'), [])
+
+    def test_only_doctors_are_indexed(self):
+        self.assertFalse(NameSearchToken.objects.filter(user=self.patient).exists())
+        self.patient.role = User.DOCTOR
+        self.patient.save()
+        self.assertEqual(self.search('josephine'), [self.patient.id])
+
+    def test_rename_rebuilds_tokens(self):
+        self.doctor.last_name = 'Stevens'
+        self.doctor.save()
+        self.assertEqual(self.search('helsing'), [])
+        self.assertEqual(self.search('stev'), [self.doctor.id])
+
+    def test_unrelated_saves_do_not_touch_tokens(self):
+        doctor = User.objects.get(id=self.doctor.id)
+        with self.assertNumQueries(1):
+            doctor.save(update_fields=['last_login'])
+        # The UPDATE and its change record
+        with self.assertNumQueries(2):
+            doctor.save()
@@ -0,0 +1,46 @@
+from rest_framework.test import APITestCase
+from django.urls import reverse
+from api.users.models import User
+from api.users.views import UserListView, UserDetailView, RegisterView
+from config.query_budget import QueryBudgetTestMixin
+from rest_framework import status
+
+
+class UserQueryBudgetTests(QueryBudgetTestMixin, APITestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        User.objects.bulk_create(
+            User(username=f'doctor{i}', email=f'doctor{i}@test.com', role=User.DOCTOR) for i in range(60)
+        )
+        self.doctor = User.objects.filter(role=User.DOCTOR).first()
+        self.client.force_authenticate(user=self.admin)
+
+    def test_list_stays_within_budget_at_any_page_size(self):
+        """
+        Test that listing users costs the same number of queries for any page size.
+        """
+        for query in ('?limit=1', '?limit=60', '?pagination=cursor&limit=60'):
+            url = reverse('user-list', kwargs={'user_type': 'doctor'}) + query
+            response = self.assertWithinQueryBudget(UserListView, 'GET', url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_detail_stays_within_budget(self):
+        """
+        Test retrieving, renaming and deleting a doctor within the view's budget.
+        """
+        url = reverse('user-detail', kwargs={'user_type': 'doctor', 'id': self.doctor.id})
+        self.assertWithinQueryBudget(UserDetailView, 'GET', url)
+        response = self.assertWithinQueryBudget(UserDetailView, 'PATCH', url, {'first_name': 'Ann'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.assertWithinQueryBudget(UserDetailView, 'DELETE', url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_register_stays_within_budget(self):
+        """
+        Test registering a doctor within the view's budget.
+        """
+        url = reverse('auth_register', kwargs={'user_type': 'doctor'})
+        data = {'username': 'newdoctor', 'email': 'newdoctor@test.com', 'password': 'newpassword', 'first_name': 'Zed'}
+        response = self.assertWithinQueryBudget(RegisterView, 'POST', url, data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
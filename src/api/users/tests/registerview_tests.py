@@ -2,6 +2,10 @@ from rest_framework.test import APITestCase, APIClient
 from django.urls import reverse
 from api.users.models import User
 from rest_framework import status
+from unittest import mock
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from api.users.serializers import UserSerializer
 
 class RegisterViewTests(APITestCase):
 
@@ -74,3 +78,52 @@ class RegisterViewTests(APITestCase):
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn('Invalid user type provided', str(response.data))
+
+
+class RegisterUniquenessTests(APITestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        User.objects.create_user('taken', 'taken@test.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+        self.url = reverse('auth_register', kwargs={'user_type': 'patient'})
+
+    def register(self, username, email):
+        return self.client.post(self.url, {'username': username, 'email': email, 'password': 'newpassword'})
+
+    def test_conflicts_are_reported_per_field(self):
+        response = self.register('taken', 'free@test.com')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data), {'username'})
+
+        response = self.register('free', 'taken@test.com')
+        self.assertEqual(set(response.data), {'email'})
+
+        # Both values taken, by two different users
+        response = self.register('taken', 'admin@test.com')
+        self.assertEqual(set(response.data), {'username', 'email'})
+
+    def test_uniqueness_is_checked_in_one_query(self):
+        serializer = UserSerializer(data={'username': 'taken', 'email': 'taken@test.com', 'password': 'newpassword'})
+        with CaptureQueriesContext(connection) as context:
+            self.assertFalse(serializer.is_valid())
+        self.assertEqual(len(context), 1)
+        self.assertEqual(set(serializer.errors), {'username', 'email'})
+
+    def test_update_may_keep_own_values(self):
+        user = User.objects.get(username='taken')
+        serializer = UserSerializer(user, data={'username': 'taken', 'email': 'taken@test.com'}, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+
+    def test_constraint_violation_is_mapped_to_field_errors(self):
+        # A concurrent registration that passed validation first leaves only the constraint
+        with mock.patch.object(UserSerializer, 'validate', lambda self, data: data):
+            response = self.register('taken', 'free@test.com')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(set(response.data), {'username'})
+
+            response = self.register('free', 'taken@test.com')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(set(response.data), {'email'})
+        self.assertFalse(User.objects.filter(username='free').exists())
@@ -0,0 +1,55 @@
+from io import StringIO
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import serializers, status
+from rest_framework.test import APITestCase
+from api.users.models import User
+from api.users.serializers import AdminSerializer, DoctorSerializer, PatientSerializer, serializer_for_role
+
+
+class RoleSerializerTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser('admin', 'admin@test.com', 'password')
+        self.doctor = User.objects.create_user('doctor', 'doctor@test.com', 'password', role=User.DOCTOR,
+                                               specialization='Cardiology')
+        self.client.force_authenticate(user=self.admin)
+
+    def test_layouts_per_role(self):
+        self.assertIs(serializer_for_role('Doctor'), DoctorSerializer)
+        self.assertIs(serializer_for_role('patient'), PatientSerializer)
+        self.assertIs(serializer_for_role('admin'), AdminSerializer)
+        self.assertIn('specialization', DoctorSerializer(self.doctor).data)
+        for serializer_class in (PatientSerializer, AdminSerializer):
+            self.assertNotIn('specialization', serializer_class(self.doctor).data)
+            self.assertNotIn('specialization', serializer_class().fields)
+
+    def test_fields_are_built_once_per_class(self):
+        class ProbeSerializer(PatientSerializer):
+            pass
+
+        with mock.patch.object(serializers.ModelSerializer, 'get_fields',
+                               autospec=True, side_effect=serializers.ModelSerializer.get_fields) as get_fields:
+            first = ProbeSerializer(self.doctor).data
+            second = ProbeSerializer(self.doctor).data
+            ProbeSerializer([self.doctor, self.admin], many=True).data
+        self.assertEqual(get_fields.call_count, 1)
+        self.assertEqual(first, second)
+        # Each instance binds its own copies of the fields
+        self.assertIsNot(ProbeSerializer().fields['username'], ProbeSerializer().fields['username'])
+
+    def test_patients_cannot_be_given_a_specialization(self):
+        url = reverse('auth_register', kwargs={'user_type': 'patient'})
+        response = self.client.post(url, {'username': 'pat', 'password': 'secret', 'specialization': 'Surgery'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('specialization', response.data)
+        self.assertIsNone(User.objects.get(username='pat').specialization)
+
+    def test_benchmark_runs(self):
+        out = StringIO()
+        call_command('benchmark_user_serializers', users=3, repeat=1, stdout=out)
+        self.assertIn('prebuilt', out.getvalue())
+        self.assertEqual(User.objects.filter(username__startswith='benchmark-').count(), 0)
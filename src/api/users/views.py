@@ -1,18 +1,39 @@
-from rest_framework import generics
+from rest_framework import generics, status
+from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from .models import User
-from .serializers import UserSerializer
+from .serializers import BulkRegisterSerializer, UserSerializer, serializer_for_role
 from .permissions import IsOwnerOrAdmin
+from .pagination import UserPagination
 from rest_framework import serializers
 from django.core.exceptions import ObjectDoesNotExist
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from . import directory
 
-class UserListView(generics.ListAPIView):
+
+class RoleSerializerMixin:
+    """
+    Use the serializer class of the role in the URL, whose fields are built only once.
+    """
+
+    def get_serializer_class(self):
+        user_type = self.kwargs.get('user_type')
+        if user_type is None:
+            # No URL kwargs when the schema is generated
+            return super().get_serializer_class()
+        return serializer_for_role(user_type)
+
+
+class UserListView(RoleSerializerMixin, generics.ListAPIView):
     """
     API view to retrieve a list of users based on their role.
     Only accessible by admin users.
     """
     serializer_class = UserSerializer
     permission_classes = [IsAdminUser]
+    pagination_class = UserPagination
+    query_budget = {'GET': 3}
 
     def get_queryset(self):
         """
@@ -21,27 +42,42 @@ class UserListView(generics.ListAPIView):
         user_type = self.kwargs['user_type'].lower()
         if user_type not in [User.DOCTOR,User.PATIENT,User.ADMIN]:
             raise ObjectDoesNotExist("Role not found")
-        return User.objects.filter(role=user_type)
+        return User.objects.filter(role=user_type).order_by('id')
+
+    def list(self, request, *args, **kwargs):
+        """
+        Serve the page from the user directory: the page's ids are cached per role, the
+        users themselves per user.
+        """
+        queryset = self.get_queryset()
+        role = self.kwargs['user_type'].lower()
+        key = directory.page_key(role, request)
+        page = directory.get_page(key)
+        if page is None:
+            rows = self.paginate_queryset(queryset.values('id'))
+            page = dict(self.get_paginated_response([row['id'] for row in rows]).data)
+            directory.set_page(key, page)
+        users = directory.get_users(page['results'], fields=self.get_serializer_class().Meta.fields)
+        return Response({**page, 'results': users})
 
 
-class UserDetailView(generics.RetrieveUpdateDestroyAPIView):
+class UserDetailView(RoleSerializerMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     API view to retrieve, update, or delete a user by ID.
     Accessible by authenticated users who are either the owner or an admin.
     """
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated, IsOwnerOrAdmin]
-    
+    query_budget = {'GET': 1, 'PUT': 7, 'PATCH': 7, 'DELETE': 13}
+
     def get_object(self):
         """
         Override the get_object method to return the user based on the user_type.
         """
-        user_type = self.kwargs['user_type']
-        user= User.objects.get(id=self.kwargs['id'], role=user_type)
-        if(user is None):
-            raise ObjectDoesNotExist("User not found")
+        user = get_object_or_404(self.get_queryset(), id=self.kwargs['id'])
+        self.check_object_permissions(self.request, user)
         return user
-    
+
     def get_serializer(self, *args, **kwargs):
         kwargs['partial'] = True
         return super().get_serializer(*args, **kwargs)
@@ -51,18 +87,29 @@ class UserDetailView(generics.RetrieveUpdateDestroyAPIView):
         Override the get_queryset method to filter users by role.
         """
         return User.objects.filter(role=self.kwargs['user_type'].lower())
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Serve the user from the directory; IsOwnerOrAdmin already decided from the id.
+        """
+        role = self.kwargs['user_type'].lower()
+        user = directory.get_user(self.kwargs['id'], fields=self.get_serializer_class().Meta.fields)
+        if user is None or user['role'] != role:
+            raise Http404
+        return Response(user)
     
     def put(self, request, *args, **kwargs):
         return self.update(request, *args, **kwargs)
 
 
-class RegisterView(generics.CreateAPIView):
+class RegisterView(RoleSerializerMixin, generics.CreateAPIView):
     """
     API view to register a new user based on the user_type in the URL.
     Only accessible by admin users.
     """
     serializer_class = UserSerializer
     permission_classes = [IsAdminUser]
+    query_budget = {'POST': 6}
 
     def perform_create(self, serializer):
         """
@@ -73,3 +120,26 @@ class RegisterView(generics.CreateAPIView):
             raise serializers.ValidationError("Invalid user type provided.")
         # Set the role based on the user_type in the URL
         serializer.save(role=user_type)
+
+
+class BulkRegisterView(generics.GenericAPIView):
+    """
+    API view to register many doctors or patients at once, e.g. when importing them from
+    another system. Either every user is created or none is, with errors reported per row.
+    Only accessible by admin users.
+    """
+    serializer_class = BulkRegisterSerializer
+    permission_classes = [IsAdminUser]
+    query_budget = {'POST': 5}  # For batches that fit in one INSERT
+
+    def post(self, request, *args, **kwargs):
+        user_type = self.kwargs['user_type'].lower()
+        if user_type not in [User.DOCTOR, User.PATIENT]:
+            raise serializers.ValidationError("Invalid user type provided.")
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        users = serializer.save(role=user_type)
+        return Response(
+            {'created': len(users), 'ids': [user.id for user in users]},
+            status=status.HTTP_201_CREATED,
+        )
@@ -0,0 +1,82 @@
+"""
+Non-blocking access to the default cache for async views.
+
+Django's cache backends implement their async methods by running the sync client in the
+single "thread sensitive" executor, so under ASGI every cache call still queues for one
+thread. For the django-redis backend this module talks to the same Redis server through
+redis.asyncio instead, reusing the backend's own key scheme and (de)serialization so both
+paths read and write the same entries. Other backends fall back to their async methods.
+"""
+import asyncio
+import weakref
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+
+class AsyncCache:
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+        self._clients = weakref.WeakKeyDictionary()
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def _redis(self):
+        """
+        Return a redis.asyncio client for the running event loop, or None if the cache
+        is not backed by django-redis. Connections cannot be shared between loops.
+        """
+        backend = self.backend
+        if not hasattr(backend, '_server') or not hasattr(backend, 'client'):
+            return None
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            import redis.asyncio
+
+            server = backend._server
+            location = (server.split(',') if isinstance(server, str) else server)[0]
+            options = backend._params.get('OPTIONS', {})
+            client = self._clients[loop] = redis.asyncio.from_url(location, password=options.get('PASSWORD'))
+        return client
+
+    def _timeout_ms(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.backend.default_timeout
+        # Like django-redis, a timeout of zero or less expires the entry at once
+        return None if timeout is None else max(int(timeout * 1000), 1)
+
+    async def get(self, key, default=None):
+        redis = self._redis()
+        if redis is None:
+            return await self.backend.aget(key, default)
+        value = await redis.get(self.backend.client.make_key(key))
+        return default if value is None else self.backend.client.decode(value)
+
+    async def get_many(self, keys):
+        redis = self._redis()
+        if redis is None:
+            return await self.backend.aget_many(keys)
+        client = self.backend.client
+        keys = list(keys)
+        values = await redis.mget([client.make_key(key) for key in keys])
+        return {key: client.decode(value) for key, value in zip(keys, values) if value is not None}
+
+    async def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        redis = self._redis()
+        if redis is None:
+            return await self.backend.aset(key, value, timeout)
+        client = self.backend.client
+        await redis.set(client.make_key(key), client.encode(value), px=self._timeout_ms(timeout))
+
+    async def add(self, key, value, timeout=DEFAULT_TIMEOUT):
+        redis = self._redis()
+        if redis is None:
+            return await self.backend.aadd(key, value, timeout)
+        client = self.backend.client
+        return bool(await redis.set(client.make_key(key), client.encode(value), px=self._timeout_ms(timeout), nx=True))
+
+
+async_cache = AsyncCache()
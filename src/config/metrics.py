@@ -0,0 +1,223 @@
+"""
+Lightweight request metrics exposed in the Prometheus text format on /metrics.
+
+MetricsMiddleware records, per resolved URL name, the wall time, database time, query
+count and response size of every request into fixed-bucket histograms, plus the cache
+hits and misses reported through record_cache_result(). Everything is kept in process
+memory with a bounded number of series (one per URL name, and per status and known
+method for the request counts), so each worker process exports its own numbers and the
+scraper aggregates them.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+UNMATCHED_VIEW = 'unmatched'
+# Method labels; anything else a client sends is counted as OTHER_METHOD
+METHODS = frozenset({'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'})
+OTHER_METHOD = 'other'
+
+_current_request = ContextVar('request_metrics', default=None)
+
+
+class Histogram:
+    """
+    A Prometheus histogram with fixed buckets and one series per view. Not locked on
+    its own; the registry serializes updates.
+    """
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, view, value):
+        series = self.series.get(view)
+        if series is None:
+            # Bucket counts (the last one is +Inf), then the sum of all observations
+            series = self.series[view] = [[0] * (len(self.buckets) + 1), 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for view, (counts, total) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{view="{view}"}} {total}')
+            lines.append(f'{self.name}_count{{view="{view}"}} {cumulative}')
+        return lines
+
+
+class Counter:
+    """
+    A Prometheus counter keyed by a tuple of label values.
+    """
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.values = {}
+
+    def inc(self, labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            label_text = ','.join(f'{name}="{value}"' for name, value in zip(self.label_names, labels))
+            lines.append(f'{self.name}{{{label_text}}} {value}')
+        return lines
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = Counter('hms_requests_total', "HTTP requests.", ('view', 'method', 'status'))
+            self.duration = Histogram('hms_request_duration_seconds', "Wall time of requests.", DURATION_BUCKETS)
+            self.db_duration = Histogram('hms_request_db_duration_seconds', "Time spent in SQL per request.", DURATION_BUCKETS)
+            self.queries = Histogram('hms_request_queries', "SQL queries per request.", QUERY_BUCKETS)
+            self.response_size = Histogram('hms_response_size_bytes', "Response body sizes.", SIZE_BUCKETS)
+            self.cache = Counter('hms_cache_requests_total', "Cache lookups made by requests.", ('view', 'result'))
+
+    def record(self, view, method, status_code, request_metrics, response_size):
+        with self._lock:
+            self.requests.inc((view, method, status_code))
+            self.duration.observe(view, request_metrics.duration)
+            self.db_duration.observe(view, request_metrics.db_duration)
+            self.queries.observe(view, request_metrics.queries)
+            if response_size is not None:
+                self.response_size.observe(view, response_size)
+            if request_metrics.cache_hits:
+                self.cache.inc((view, 'hit'), request_metrics.cache_hits)
+            if request_metrics.cache_misses:
+                self.cache.inc((view, 'miss'), request_metrics.cache_misses)
+
+    def render(self):
+        with self._lock:
+            lines = []
+            for metric in (self.requests, self.duration, self.db_duration, self.queries, self.response_size, self.cache):
+                lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class RequestMetrics:
+    """
+    What one request did; also the database execute wrapper that times its queries.
+    """
+    __slots__ = ('duration', 'db_duration', 'queries', 'cache_hits', 'cache_misses')
+
+    def __init__(self):
+        self.duration = self.db_duration = 0.0
+        self.queries = self.cache_hits = self.cache_misses = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_duration += time.perf_counter() - started
+            self.queries += 1
+
+
+def record_cache_result(hit):
+    """
+    Count a cache hit or miss against the request being handled, if any.
+    """
+    request_metrics = _current_request.get()
+    if request_metrics is None:
+        return
+    if hit:
+        request_metrics.cache_hits += 1
+    else:
+        request_metrics.cache_misses += 1
+
+
+class MetricsMiddleware:
+    """
+    Records the metrics of every request. Should come first in MIDDLEWARE so the
+    timings cover the other middleware too.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        request_metrics = RequestMetrics()
+        token = _current_request.set(request_metrics)
+        started = time.perf_counter()
+        try:
+            with self.timing(request_metrics):
+                response = self.get_response(request)
+        finally:
+            _current_request.reset(token)
+        request_metrics.duration = time.perf_counter() - started
+        self.record(request, response, request_metrics)
+        return response
+
+    async def __acall__(self, request):
+        request_metrics = RequestMetrics()
+        token = _current_request.set(request_metrics)
+        started = time.perf_counter()
+        try:
+            with self.timing(request_metrics):
+                response = await self.get_response(request)
+        finally:
+            _current_request.reset(token)
+        request_metrics.duration = time.perf_counter() - started
+        self.record(request, response, request_metrics)
+        return response
+
+    def timing(self, request_metrics):
+        stack = ExitStack()
+        for database in connections:
+            stack.enter_context(connections[database].execute_wrapper(request_metrics))
+        return stack
+
+    def record(self, request, response, request_metrics):
+        match = request.resolver_match
+        view = match.url_name if match is not None and match.url_name else UNMATCHED_VIEW
+        # Streamed bodies are produced after the middleware returns and are not measured
+        response_size = None if response.streaming else len(response.content)
+        method = request.method if request.method in METHODS else OTHER_METHOD
+        registry.record(view, method, response.status_code, request_metrics, response_size)
+
+
+def metrics_view(request):
+    """
+    Export the metrics of this process in the Prometheus text format.
+    """
+    allowed_ips = getattr(settings, 'METRICS_ALLOWED_IPS', None)
+    if allowed_ips is not None and request.META.get('REMOTE_ADDR') not in allowed_ips:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,118 @@
+"""
+Per-view query budgets.
+
+API views declare how many SQL queries one request may run, either as a number or as
+a {method: number} dict:
+
+    class AppointmentDetailView(...):
+        query_budget = {'GET': 1, 'PATCH': 8, 'DELETE': 6}
+
+Budgets count the queries of the view itself. QueryBudgetMiddleware logs requests that
+go over their budget in production, and QueryBudgetTestMixin fails tests that do.
+"""
+import logging
+from contextlib import ExitStack
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection, connections
+
+logger = logging.getLogger('query_budget')
+
+
+def get_query_budget(view_class, method):
+    """
+    Return the query budget the view declares for the HTTP method, or None.
+    """
+    budget = getattr(view_class, 'query_budget', None)
+    if isinstance(budget, dict):
+        return budget.get(method.upper())
+    return budget
+
+
+class QueryCounter:
+    """
+    Database execute wrapper that counts the queries going through it.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class QueryBudgetMiddleware:
+    """
+    Counts the queries of every request and logs a warning when a view goes over its
+    query budget. Authentication may add up to QUERY_BUDGET_AUTHENTICATION_QUERIES on
+    top of the budget (the session and user lookups of session authentication; JWT
+    principals normally come from the cache).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        counter = QueryCounter()
+        with self.counting(counter):
+            response = self.get_response(request)
+        self.check(request, counter)
+        return response
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        with self.counting(counter):
+            response = await self.get_response(request)
+        self.check(request, counter)
+        return response
+
+    def counting(self, counter):
+        stack = ExitStack()
+        for database in connections:
+            stack.enter_context(connections[database].execute_wrapper(counter))
+        return stack
+
+    def check(self, request, counter):
+        budget = getattr(request, 'query_budget', None)
+        if budget is not None and counter.count > budget + getattr(settings, 'QUERY_BUDGET_AUTHENTICATION_QUERIES', 2):
+            logger.warning(
+                "%s %s ran %d queries, over the %s budget of %d",
+                request.method, request.path, counter.count, request.query_budget_view, budget,
+            )
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Class-based views carry the budget on the class, function views on themselves
+        view = getattr(view_func, 'view_class', view_func)
+        budget = get_query_budget(view, request.method)
+        if budget is not None:
+            request.query_budget = budget
+            request.query_budget_view = view.__name__
+
+
+class QueryBudgetTestMixin:
+    """
+    TestCase mixin with an assertion that a request stays within its view's budget.
+    """
+
+    def assertWithinQueryBudget(self, view_class, method, url, data=None, **extra):
+        from django.test.utils import CaptureQueriesContext
+
+        budget = get_query_budget(view_class, method)
+        self.assertIsNotNone(budget, f"{view_class.__name__} declares no query budget for {method}.")
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method.lower())(url, data, **extra)
+        queries = '\n'.join(query['sql'] for query in context.captured_queries)
+        self.assertLessEqual(
+            len(context), budget,
+            f"{method} {url} ran {len(context)} queries, over the {view_class.__name__} budget of {budget}:\n{queries}",
+        )
+        return response
@@ -0,0 +1,116 @@
+"""
+Read-replica routing.
+
+ReplicaRoutingMiddleware lets the reads of safe-method requests (GET, HEAD, OPTIONS) go
+to one of the DATABASE_REPLICAS, picked once per request so its reads see one state of
+the data (replicas may lag by different amounts); everything else uses the primary
+("default"):
+
+- writes, and every read of a request after its first write
+- requests with unsafe methods
+- requests of a client that wrote within the last REPLICA_PIN_SECONDS, tracked with a
+  cookie, so it reads its own writes despite replication lag
+- code inside use_primary(), for checks that must not see stale data (double booking)
+- anything outside a request (management commands, shell)
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+PRIMARY_DATABASE = 'default'
+PIN_COOKIE = 'hms_primary'
+
+# The replica the current request reads from (None: the primary), and whether it has to stop
+_replica = ContextVar('replica', default=None)
+_pinned = ContextVar('replica_pinned', default=False)
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+@contextmanager
+def use_primary():
+    """
+    Send the reads inside the block to the primary.
+    """
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        replica = _replica.get()
+        if replica is None or _pinned.get():
+            return None
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Related objects come from the database the instance was read from
+            return instance._state.db
+        return replica
+
+    def db_for_write(self, model, **hints):
+        # Later reads of this request must see the write
+        _pinned.set(True)
+        return PRIMARY_DATABASE
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Decides per request whether reads may use a replica, and pins a client to the
+    primary for REPLICA_PIN_SECONDS after it writes.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        tokens = self.start(request)
+        try:
+            response = self.get_response(request)
+            self.finish(request, response)
+        finally:
+            self.reset(tokens)
+        return response
+
+    async def __acall__(self, request):
+        tokens = self.start(request)
+        try:
+            response = await self.get_response(request)
+            self.finish(request, response)
+        finally:
+            self.reset(tokens)
+        return response
+
+    def start(self, request):
+        replicas = get_replicas()
+        use_replica = request.method in ('GET', 'HEAD', 'OPTIONS') and PIN_COOKIE not in request.COOKIES and replicas
+        return _replica.set(random.choice(replicas) if use_replica else None), _pinned.set(False)
+
+    def finish(self, request, response):
+        if (_pinned.get() or request.method not in ('GET', 'HEAD', 'OPTIONS')) and get_replicas():
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 5), httponly=True, samesite='Lax'
+            )
+
+    def reset(self, tokens):
+        _replica.reset(tokens[0])
+        _pinned.reset(tokens[1])
@@ -35,6 +35,8 @@ INSTALLED_APPS = [
     'rest_framework',
     'api.users.apps.UsersConfig',
     'api.appointments.apps.AppointmentsConfig',
+    'api.tasks.apps.TasksConfig',
+    'api.outbox.apps.OutboxConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -43,19 +45,31 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'drf_spectacular',
     'django_filters',
-    'debug_toolbar'
 ]
 MIDDLEWARE = [
+    'config.metrics.MetricsMiddleware',
+    'config.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'config.query_budget.QueryBudgetMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
 
+# The toolbar instruments every request heavily; only load it for local development
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
+
+# Addresses allowed to scrape /metrics; None allows everyone
+METRICS_ALLOWED_IPS = ['127.0.0.1']
+
+# Queries authentication may add on top of a view's query budget (see config/query_budget.py)
+QUERY_BUDGET_AUTHENTICATION_QUERIES = 2
+
 INTERNAL_IPS = [
     '127.0.0.1',
 ]
@@ -88,9 +102,22 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    },
+    # Point this at a read replica of default; locally it is the same file
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+    },
 }
 
+DATABASE_ROUTERS = ['config.routers.ReplicaRouter']
+
+# Aliases that safe-method requests may read from; empty sends everything to default
+DATABASE_REPLICAS = []
+
+# How long a client reads from default after a write, to cover replication lag
+REPLICA_PIN_SECONDS = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -110,6 +137,12 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Processes hashing the passwords of bulk registrations; None uses one per CPU
+PASSWORD_HASH_WORKERS = None
+
+# Run background tasks where they are queued instead of in a run_tasks worker
+TASKS_EAGER = DEBUG
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
@@ -135,7 +168,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.users.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
@@ -151,6 +184,7 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': True,
+    'TOKEN_OBTAIN_SERIALIZER': 'api.users.authentication.PrincipalTokenObtainPairSerializer',
 }
 
 SPECTACULAR_SETTINGS = {
@@ -19,14 +19,17 @@ from drf_spectacular.views import SpectacularSwaggerView, SpectacularAPIView, Sp
 from django.urls import path, include
 from rest_framework import permissions
 from .settings import DEBUG
+from .metrics import metrics_view
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('users/', include('api.users.urls')),
     path('appointments/', include('api.appointments.urls')),
+    path('changes/', include('api.outbox.urls')),
     path('schema/', SpectacularAPIView.as_view(), name='schema'),
     path('', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
     path('redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
     path('api-auth/', include('rest_framework.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 if DEBUG:
     import debug_toolbar
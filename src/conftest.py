@@ -0,0 +1,17 @@
+import pytest
+from django.core.cache import cache
+from django.test import override_settings
+
+# Tests use a per-process cache instead of the shared Redis of settings.CACHES
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@pytest.fixture(autouse=True, scope='session')
+def test_caches():
+    with override_settings(CACHES=TEST_CACHES):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def clear_cache(test_caches):
+    cache.clear()